@@ -0,0 +1,44 @@
+"""
+Быстрый JSON-рендерер для API на orjson.
+
+orjson сам сериализует UUID (Company.id), datetime/date/time и строки без
+промежуточного str, результат сразу получается в байтах. Остальные типы
+(Decimal, ленивые строки перевода, timedelta и т.д.) передаются стандартному
+encoder DRF, поэтому ответ совпадает с ответом JSONRenderer. Отступы (?indent,
+браузерный API) и ensure_ascii отдаются стандартному рендереру. Если orjson не
+установлен, ORJSONRenderer полностью повторяет JSONRenderer.
+
+    REST_FRAMEWORK = {
+        'DEFAULT_RENDERER_CLASSES': ['api.renderers.ORJSONRenderer', ...],
+        'DEFAULT_PARSER_CLASSES': ['api.parsers.ORJSONParser', ...],
+    }
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Разделители строк, которые JSONRenderer экранирует для вставки JSON в <script>
+_LINE_SEPARATORS = ('\u2028'.encode(), '\u2029'.encode())
+
+OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=OPTIONS)
+        if _LINE_SEPARATORS[0] in ret or _LINE_SEPARATORS[1] in ret:
+            ret = ret.replace(_LINE_SEPARATORS[0], b'\\u2028').replace(_LINE_SEPARATORS[1], b'\\u2029')
+        return ret
@@ -0,0 +1,105 @@
+"""
+Пагинация для API v1
+
+По умолчанию страницы выбираются по номеру (?page=N), но общее число записей
+берется из быстрого счетчика представления (get_fast_count) или из кэша, а не
+COUNT(*) на каждой странице. С параметром ?pagination=cursor включается
+keyset-пагинация по стабильной сортировке (date_joined, id): курсор хранит
+значения последней записи, поэтому дальние страницы стоят столько же, сколько
+первая. В этом режиме параметр ordering не применяется; поврежденный курсор
+или курсор от другой сортировки - ошибка 400.
+"""
+import hashlib
+from functools import partial
+
+from django.core.cache import cache
+from django.core.paginator import Paginator as DjangoPaginator
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from companies import keyset
+
+
+# Сколько секунд хранится посчитанное COUNT(*) для отфильтрованных выборок
+COUNT_CACHE_TIMEOUT = 60
+
+
+def cached_count(queryset, view=None):
+    """Число записей: быстрый счетчик представления или COUNT(*) из кэша"""
+    get_fast_count = getattr(view, 'get_fast_count', None)
+    if get_fast_count is not None:
+        count = get_fast_count()
+        if count is not None:
+            return count
+
+    sql, params = queryset.query.sql_with_params()
+    key = 'api:count:' + hashlib.md5(f'{sql}{params!r}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class CountedPaginator(DjangoPaginator):
+    """Paginator с заранее известным числом записей"""
+
+    def __init__(self, *args, count=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if count is not None:
+            self.__dict__['count'] = count
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    """Номера страниц с кэшированным count или курсор по ?pagination=cursor"""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+
+    # Поля keyset-пагинации: (поле, по убыванию); последнее поле уникально
+    cursor_ordering = [('date_joined', True), ('id', True)]
+
+    cursor_mode = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        count = cached_count(queryset, view)
+        if not self.is_cursor_mode(request):
+            self.django_paginator_class = partial(CountedPaginator, count=count)
+            return super().paginate_queryset(queryset, request, view)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor and keyset.decode_cursor(cursor, self.cursor_ordering, queryset.model) is None:
+            raise ValidationError({self.cursor_query_param: 'Неверный курсор'})
+
+        self.cursor_mode = True
+        self.count = count
+        rows, self.next_cursor = keyset.paginate(
+            queryset, self.cursor_ordering, cursor, self.get_page_size(request),
+        )
+        return rows
+
+    def is_cursor_mode(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor' or
+                self.cursor_query_param in request.query_params)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_cursor_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_next_cursor_link(self):
+        if not self.next_cursor:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        url = replace_query_param(url, self.mode_query_param, 'cursor')
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
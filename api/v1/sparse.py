@@ -0,0 +1,109 @@
+"""
+Выборочные поля и раскрытие связанных объектов в API v1.
+
+    GET /api/v1/users/?fields=id,username,full_name
+    GET /api/v1/users/42/?fields=id,email&expand=profile,memberships
+
+?fields= оставляет в ответе только перечисленные поля, ?expand= добавляет
+связанные объекты из expandable_fields сериализатора. optimize_queryset()
+подстраивает выборку под запрос: only() по нужным столбцам, select_related и
+prefetch_related - только для раскрытых объектов.
+"""
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def requested_names(request, param):
+    """Имена из параметра запроса через запятую или None, если параметра нет"""
+    if request is None:
+        return None
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def requested(request, expandable):
+    """Возвращает (запрошенные поля или None, раскрываемые объекты из expandable)"""
+    fields = requested_names(request, FIELDS_PARAM)
+    expand = (requested_names(request, EXPAND_PARAM) or set()) & set(expandable)
+    if fields is not None:
+        fields |= {'id'}
+    return fields, expand
+
+
+class Expandable:
+    """
+    Связанный объект, который можно раскрыть через ?expand=:
+    сериализатор и что добавить к выборке (select_related, prefetch_related
+    и столбцы связанной модели для only()). uses_parent - вложенный
+    сериализатор сам выводит родительский объект целиком (профиль с полем
+    user), поэтому only() по столбцам родителя к выборке не применяется:
+    иначе каждое отложенное поле загружалось бы отдельным запросом.
+    """
+
+    def __init__(self, serializer, select_related=None, prefetch=None, columns=(), uses_parent=False):
+        self.serializer = serializer
+        self.select_related = select_related
+        self.prefetch = prefetch
+        self.columns = columns
+        self.uses_parent = uses_parent
+
+
+class SparseFieldsMixin:
+    """Миксин сериализатора: ?fields= и ?expand="""
+
+    # имя: Expandable
+    expandable_fields = {}
+
+    # Вычисляемые поля сериализатора и столбцы модели, из которых они строятся
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, expand = self.requested(self.context.get('request'))
+        for name in expand - set(self.fields):
+            self.fields[name] = self.expandable_fields[name].serializer()
+        if fields is not None:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
+
+    @classmethod
+    def requested(cls, request):
+        return requested(request, cls.expandable_fields)
+
+    @classmethod
+    def columns(cls, fields):
+        """Столбцы модели для запрошенных полей"""
+        model_fields = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        columns = {'id'}
+        for name in fields:
+            if name in cls.field_sources:
+                columns.update(cls.field_sources[name])
+            elif name in model_fields:
+                columns.add(name)
+        return columns
+
+    @classmethod
+    def related(cls, fields, expand):
+        """Связанные объекты в ответе: раскрытые и входящие в поля по умолчанию"""
+        default = {name for name in cls.expandable_fields if name in cls.Meta.fields}
+        return expand | (default if fields is None else default & fields)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request):
+        """Подстраивает выборку под ?fields= и ?expand="""
+        fields, expand = cls.requested(request)
+        columns = set()
+        for name in cls.related(fields, expand):
+            expandable = cls.expandable_fields[name]
+            if expandable.uses_parent:
+                fields = None
+            if expandable.select_related:
+                queryset = queryset.select_related(expandable.select_related)
+                columns.update(f'{expandable.select_related}__{column}' for column in expandable.columns)
+            if expandable.prefetch:
+                queryset = queryset.prefetch_related(expandable.prefetch(request))
+        if fields is not None:
+            queryset = queryset.only(*cls.columns(fields), *columns)
+        return queryset
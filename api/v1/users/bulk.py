@@ -0,0 +1,167 @@
+"""
+Массовые операции над пользователями компании.
+
+Цели задаются списком id или фильтром (те же параметры, что у списка, и
+search). Операция выполняется в одной транзакции: одна выборка текущего
+состояния и один UPDATE на все изменяемые строки, поэтому число запросов не
+зависит от числа пользователей. По каждому id возвращается результат:
+
+    updated    - изменен
+    unchanged  - уже в нужном состоянии
+    skipped    - пользователь защищен от операции (см. protected_ids)
+    not_found  - нет среди пользователей текущей компании
+
+is_active и пароль - общие для всех компаний поля User, поэтому, как и при
+импорте, нельзя менять владельца, самого себя, участников с ролью не ниже
+своей, а также сотрудников и суперпользователей.
+
+При сбросе пароля ссылка приглашения (companies:accept_invite), по которой
+задается новый пароль, отправляется пользователю письмом; в ответ
+администратору она не попадает, у результата есть только признак notified.
+
+Сигналы при update() не отправляются, поэтому поколение данных компаний
+(ETag) обновляется здесь же.
+"""
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from companies.conditional import touch_users_companies
+from companies.models import CompanyMembership
+from companies.session import invite_path, invite_path_template
+from users import search
+from .filters import UserFilter
+
+
+# Максимум пользователей в одном запросе
+BULK_MAX_ITEMS = 1000
+
+
+def resolve_targets(data, queryset):
+    """
+    Возвращает (запрошенные id, выборка пользователей) по телу запроса
+    {"ids": [...]} или {"filter": {...}}
+    """
+    if not isinstance(data, dict):
+        raise ValidationError({'detail': 'Ожидается объект с ids или filter'})
+    ids = data.get('ids')
+    filters = data.get('filter')
+    if (ids is None) == (filters is None):
+        raise ValidationError({'detail': 'Нужно указать либо ids, либо filter'})
+
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise ValidationError({'ids': 'Ожидается список целых чисел'})
+        if len(ids) > BULK_MAX_ITEMS:
+            raise ValidationError({'ids': f'Не больше {BULK_MAX_ITEMS} пользователей за запрос'})
+        ids = list(dict.fromkeys(ids))
+        return ids, queryset.filter(pk__in=ids)
+
+    if not isinstance(filters, dict) or not filters:
+        raise ValidationError({'filter': 'Ожидается непустой набор условий'})
+    filters = dict(filters)
+    text = filters.pop('search', '')
+    filterset = UserFilter(filters, queryset=queryset)
+    if not filterset.is_valid():
+        raise ValidationError({'filter': filterset.errors})
+    queryset = filterset.qs
+    if text:
+        queryset = search.filter_users(queryset, str(text))
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:BULK_MAX_ITEMS + 1])
+    if len(ids) > BULK_MAX_ITEMS:
+        raise ValidationError({'filter': f'Под условия попадает больше {BULK_MAX_ITEMS} пользователей'})
+    return ids, User.objects.filter(pk__in=ids)
+
+
+def _results(ids, found, changed, skipped):
+    results = []
+    for pk in ids:
+        if pk not in found:
+            status = 'not_found'
+        elif pk in skipped:
+            status = 'skipped'
+        elif pk in changed:
+            status = 'updated'
+        else:
+            status = 'unchanged'
+        results.append({'id': pk, 'status': status})
+    return results
+
+
+def protected_ids(found, actor, company):
+    """
+    Id из found, которые actor (членство в company) менять не может: владелец,
+    сам actor, участники с ролью не ниже его, сотрудники и суперпользователи
+    """
+    protected = {company.owner_id, actor.user_id} & found
+    protected.update(
+        User.objects.filter(pk__in=found)
+        .filter(Q(is_staff=True) | Q(is_superuser=True))
+        .values_list('pk', flat=True)
+    )
+    protected.update(
+        CompanyMembership.objects.filter(
+            company=company, user_id__in=found, role_level__gte=actor.role_level,
+        ).values_list('user_id', flat=True)
+    )
+    return protected
+
+
+def set_active(ids, queryset, is_active, actor, company):
+    """Активирует или деактивирует пользователей одним UPDATE"""
+    with transaction.atomic():
+        states = dict(queryset.select_for_update(of=('self',)).values_list('pk', 'is_active'))
+        skipped = protected_ids(set(states), actor, company)
+        changed = [pk for pk, active in states.items() if active != is_active and pk not in skipped]
+        if changed:
+            User.objects.filter(pk__in=changed).update(is_active=is_active)
+            touch_users_companies(changed)
+    return _results(ids, states, set(changed), skipped)
+
+
+def reset_passwords(ids, queryset, actor, company, build_url):
+    """
+    Сбрасывает пароли одним UPDATE: пароль становится непригодным для входа,
+    сессии пользователей перестают действовать. Вместо временных паролей
+    (хэширование для каждого пользователя заняло бы секунды) пользователям
+    отправляются ссылки приглашения в компанию company, по которым они задают
+    пароль. build_url превращает путь ссылки в абсолютный адрес.
+    """
+    users = []
+    with transaction.atomic():
+        found = set(queryset.select_for_update(of=('self',)).values_list('pk', flat=True))
+        skipped = protected_ids(found, actor, company)
+        changed = found - skipped
+        if changed:
+            User.objects.filter(pk__in=changed).update(password=make_password(None))
+            # Токен приглашения зависит от хэша пароля - берем уже новый
+            users = list(User.objects.filter(pk__in=changed).only('pk', 'username', 'password', 'last_login', 'email'))
+    notified = send_reset_links(users, company, build_url)
+    results = _results(ids, found, changed, skipped)
+    for result in results:
+        if result['status'] == 'updated':
+            result['notified'] = result['id'] in notified
+    return results
+
+
+def send_reset_links(users, company, build_url):
+    """Отправляет ссылки для нового пароля одним соединением; возвращает id получателей"""
+    template = invite_path_template(company)
+    recipients = [user for user in users if user.email]
+    messages = [
+        EmailMessage(
+            subject=f'Сброс пароля: {company.name}',
+            body=(
+                f'Администратор компании «{company.name}» сбросил пароль учетной записи {user.username}.\n'
+                f'Задать новый пароль: {build_url(invite_path(template, user))}\n'
+            ),
+            to=[user.email],
+        )
+        for user in recipients
+    ]
+    if not messages or not get_connection(fail_silently=True).send_messages(messages):
+        return set()
+    return {user.pk for user in recipients}
@@ -3,6 +3,9 @@
 """
 import django_filters
 from django.contrib.auth.models import User
+from rest_framework import filters
+
+from users import search
 
 
 class UserFilter(django_filters.FilterSet):
@@ -14,13 +17,13 @@ class UserFilter(django_filters.FilterSet):
     
     # Фильтр по подразделению (как текстовое поле)
     department = django_filters.CharFilter(
-        field_name='userprofile__department',
+        field_name='profile__department',
         lookup_expr='icontains'
     )
     
     # Фильтр по должности
     position = django_filters.CharFilter(
-        field_name='userprofile__position',
+        field_name='profile__position',
         lookup_expr='icontains'
     )
     
@@ -43,3 +46,17 @@ class UserFilter(django_filters.FilterSet):
             'last_name': ['exact', 'icontains'],
             'email': ['exact', 'icontains'],
         }
+
+
+class UserSearchFilter(filters.SearchFilter):
+    """
+    Поиск ?search= по полнотекстовому индексу пользователей
+    (по началу слов, в пределах текущей компании)
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+        company = getattr(request, 'current_company', None)
+        return search.filter_users(queryset, text, company.pk if company else None)
@@ -28,7 +28,9 @@ class UserPermissions(BasePermission):
             # Управление пользователями только для администраторов
             return self._is_admin(request)
         
-        elif view.action in ['activate', 'deactivate', 'reset_password']:
+        elif view.action in ['activate', 'deactivate', 'reset_password',
+                             'bulk_activate', 'bulk_deactivate', 'bulk_reset_password',
+                             'import_members']:
             # Управление статусом только для администраторов
             return self._is_admin(request)
         
@@ -48,16 +50,9 @@ class UserPermissions(BasePermission):
     
     def _is_admin(self, request):
         """Проверяем, является ли пользователь администратором"""
-        if not hasattr(request.user, 'userprofile'):
-            return False
-        
-        # Проверяем членство в компании
-        try:
-            from companies.models import CompanyMembership
-            membership = CompanyMembership.objects.get(
-                user=request.user,
-                company=request.current_company
-            )
-            return membership.has_full_admin_rights()
-        except CompanyMembership.DoesNotExist:
+        # Членство в текущей компании уже определено CompanyMiddleware,
+        # поэтому проверка сводится к сравнению уровня роли без запросов
+        membership = getattr(request, 'current_membership', None)
+        if membership is None or membership.company_id != request.current_company.pk:
             return False
+        return membership.has_full_admin_rights()
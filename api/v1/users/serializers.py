@@ -3,13 +3,68 @@
 """
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Case, CharField, F, Prefetch, Value, When
+from django.db.models.functions import Concat, NullIf, Trim
+from companies.models import CompanyMembership
 from users.models import UserProfile
+from ..sparse import Expandable, SparseFieldsMixin, requested
 
 
-class UserSerializer(serializers.ModelSerializer):
+# Поля профиля и членства, которые отдаются при ?expand=
+PROFILE_FIELDS = ['phone', 'position', 'department', 'email']
+MEMBERSHIP_FIELDS = ['role', 'role_level', 'is_active', 'joined_at']
+
+
+class UserProfileBriefSerializer(serializers.ModelSerializer):
+    """Профиль пользователя для ?expand=profile"""
+
+    class Meta:
+        model = UserProfile
+        fields = PROFILE_FIELDS
+
+
+class MembershipBriefSerializer(serializers.ModelSerializer):
+    """Членство пользователя в текущей компании для ?expand=memberships"""
+
+    class Meta:
+        model = CompanyMembership
+        fields = MEMBERSHIP_FIELDS
+
+
+def current_memberships(request):
+    """Prefetch членств только в текущей компании - чужие компании не раскрываются"""
+    return Prefetch(
+        'company_memberships',
+        queryset=CompanyMembership.objects.filter(
+            company=getattr(request, 'current_company', None)
+        ).only('id', 'user_id', *MEMBERSHIP_FIELDS),
+        to_attr='current_memberships',
+    )
+
+
+USER_EXPANDABLE_FIELDS = {
+    'profile': Expandable(
+        lambda: UserProfileBriefSerializer(read_only=True),
+        select_related='profile',
+        columns=['id', 'user_id', *PROFILE_FIELDS],
+    ),
+    'memberships': Expandable(
+        lambda: MembershipBriefSerializer(source='current_memberships', many=True, read_only=True),
+        prefetch=current_memberships,
+    ),
+}
+
+# Полное имя строится из имени, фамилии и логина
+FULL_NAME_SOURCES = {'full_name': ['first_name', 'last_name', 'username']}
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Базовый сериализатор пользователя"""
     full_name = serializers.SerializerMethodField()
     
+    expandable_fields = USER_EXPANDABLE_FIELDS
+    field_sources = FULL_NAME_SOURCES
+    
     class Meta:
         model = User
         fields = [
@@ -65,16 +120,27 @@ class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = [
-            'id', 'user', 'phone_number', 'position', 
-            'department', 'avatar'
+            'id', 'user', 'phone', 'position',
+            'department', 'email'
         ]
 
 
-class UserDetailSerializer(serializers.ModelSerializer):
+class UserDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Детальный сериализатор пользователя с профилем"""
     profile = UserProfileSerializer(read_only=True)
     full_name = serializers.SerializerMethodField()
     
+    expandable_fields = {
+        **USER_EXPANDABLE_FIELDS,
+        'profile': Expandable(
+            lambda: UserProfileSerializer(read_only=True),
+            select_related='profile',
+            columns=['id', 'user_id', *PROFILE_FIELDS],
+            uses_parent=True,
+        ),
+    }
+    field_sources = FULL_NAME_SOURCES
+    
     class Meta:
         model = User
         fields = [
@@ -87,24 +153,83 @@ class UserDetailSerializer(serializers.ModelSerializer):
         return obj.get_full_name() or obj.username
 
 
-class UserListSerializer(serializers.ModelSerializer):
-    """Сериализатор для списка пользователей"""
-    full_name = serializers.SerializerMethodField()
-    department_name = serializers.SerializerMethodField()
-    position = serializers.SerializerMethodField()
-    
+class UserListRowsSerializer(serializers.ListSerializer):
+    """Список строк: членства для ?expand=memberships загружаются одним запросом на страницу"""
+
+    def to_representation(self, data):
+        rows = list(data)
+        request = self.context.get('request')
+        _, expand = requested(request, UserListSerializer.EXPANDABLE)
+        if 'memberships' in expand:
+            memberships = {}
+            queryset = CompanyMembership.objects.filter(
+                company=getattr(request, 'current_company', None),
+                user_id__in=[row['id'] for row in rows],
+            ).values('user_id', *MEMBERSHIP_FIELDS)
+            for membership in queryset:
+                memberships.setdefault(membership.pop('user_id'), []).append(membership)
+            for row in rows:
+                row['memberships'] = memberships.get(row['id'], [])
+        return [self.child.to_representation(row) for row in rows]
+
+
+class UserListSerializer(serializers.BaseSerializer):
+    """
+    Сериализатор для списка пользователей.
+
+    Строки списка целиком собираются в SQL (values() с аннотациями, см.
+    list_rows), поэтому сериализатор отдает словари как есть, без вызова
+    полей DRF и обращений к связанным объектам для каждой записи.
+    ?fields= сокращает список столбцов в SELECT, ?expand=profile добавляет
+    столбцы профиля, ?expand=memberships - один запрос членств на страницу.
+    """
+    VALUES = ['id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'date_joined']
+    ANNOTATIONS = ['full_name', 'department_name', 'position']
+    EXPANDABLE = ['profile', 'memberships']
+
+    # Поля keyset-пагинации нужны в строке, даже если не запрошены
+    CURSOR_FIELDS = ['id', 'date_joined']
+
+    # Время выводится так же, как в карточке пользователя: в текущем часовом поясе
+    date_joined_field = serializers.DateTimeField()
+
     class Meta:
-        model = User
-        fields = [
-            'id', 'username', 'email', 'first_name', 'last_name',
-            'full_name', 'is_active', 'department_name', 'position'
-        ]
-    
-    def get_full_name(self, obj):
-        return obj.get_full_name() or obj.username
-    
-    def get_department_name(self, obj):
-        return getattr(obj.userprofile.department, 'name', None) if hasattr(obj, 'userprofile') and obj.userprofile.department else None
-    
-    def get_position(self, obj):
-        return getattr(obj.userprofile, 'position', None) if hasattr(obj, 'userprofile') else None
+        list_serializer_class = UserListRowsSerializer
+
+    @staticmethod
+    def annotations():
+        full_name = Trim(Concat('first_name', Value(' '), 'last_name'))
+        return {
+            'full_name': Case(
+                When(first_name='', last_name='', then='username'),
+                default=full_name,
+                output_field=CharField(),
+            ),
+            'department_name': NullIf('profile__department', Value('')),
+            'position': F('profile__position'),
+        }
+
+    @classmethod
+    def list_rows(cls, queryset, request=None):
+        """Превращает выборку пользователей в словари полей списка"""
+        fields, expand = requested(request, cls.EXPANDABLE)
+        values = [name for name in cls.VALUES if fields is None or name in fields or name in cls.CURSOR_FIELDS]
+        annotations = {
+            name: expression for name, expression in cls.annotations().items()
+            if fields is None or name in fields
+        }
+        if 'profile' in expand:
+            values += [f'profile__{name}' for name in PROFILE_FIELDS]
+        return queryset.values(*values, **annotations)
+
+    def to_representation(self, row):
+        # Параметры запроса разбираются один раз на весь список
+        if not hasattr(self, '_requested'):
+            self._requested = requested(self.context.get('request'), self.EXPANDABLE)
+        fields, expand = self._requested
+        row['date_joined'] = self.date_joined_field.to_representation(row['date_joined'])
+        if 'profile' in expand:
+            row['profile'] = {name: row.pop(f'profile__{name}') for name in PROFILE_FIELDS}
+        if fields is not None:
+            row = {name: value for name, value in row.items() if name in fields or name in expand}
+        return row
@@ -3,40 +3,69 @@
 """
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.models import User
 from django.db.models import Q
+from django.utils.decorators import method_decorator
 from django_filters.rest_framework import DjangoFilterBackend
 
+from companies.conditional import company_conditional
+from companies.imports import ImportFileError, import_format, import_members
+from companies.statistics import get_company_statistics
 from users.models import UserProfile
+from ..pagination import CursorOrPageNumberPagination
 from .serializers import (
     UserSerializer, UserCreateSerializer, UserUpdateSerializer,
     UserDetailSerializer, UserListSerializer, UserProfileSerializer
 )
 from .permissions import UserPermissions
-from .filters import UserFilter
+from .filters import UserFilter, UserSearchFilter
+from . import bulk
 
 
+@method_decorator(company_conditional, name='dispatch')
 class UserViewSet(viewsets.ModelViewSet):
     """
     ViewSet для управления пользователями
     """
     permission_classes = [IsAuthenticated, UserPermissions]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, UserSearchFilter, filters.OrderingFilter]
     filterset_class = UserFilter
     search_fields = ['username', 'first_name', 'last_name', 'email']
     ordering_fields = ['username', 'first_name', 'last_name', 'date_joined']
-    ordering = ['-date_joined']
+    ordering = ['-date_joined', '-id']
+    pagination_class = CursorOrPageNumberPagination
+    
+    # Параметры, не меняющие состав выборки
+    PAGINATION_PARAMS = {'page', 'page_size', 'cursor', 'pagination', 'ordering', 'format', 'fields', 'expand'}
     
     def get_queryset(self):
         """Получаем пользователей текущей компании"""
         if not hasattr(self.request, 'current_company') or not self.request.current_company:
             return User.objects.none()
         
-        return User.objects.filter(
-            userprofile__company=self.request.current_company
-        ).select_related('userprofile', 'userprofile__department')
+        queryset = User.objects.filter(company_memberships__company=self.request.current_company)
+        if self.action == 'retrieve':
+            # Столбцы и связи под ?fields= и ?expand=
+            queryset = UserDetailSerializer.optimize_queryset(queryset, self.request)
+        return queryset
+    
+    def get_fast_count(self):
+        """Без фильтров число пользователей берется из счетчиков компании"""
+        company = getattr(self.request, 'current_company', None)
+        if company is None or set(self.request.query_params) - self.PAGINATION_PARAMS:
+            return None
+        return get_company_statistics(company).members_count
+    
+    def list(self, request, *args, **kwargs):
+        """Список строится из values(), без объектов моделей"""
+        queryset = UserListSerializer.list_rows(self.filter_queryset(self.get_queryset()), request)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
     
     def get_serializer_class(self):
         """Выбираем сериализатор в зависимости от действия"""
@@ -60,6 +89,71 @@ class UserViewSet(viewsets.ModelViewSet):
             company=self.request.current_company
         )
     
+    @action(detail=False, methods=['post'], url_path='bulk-activate')
+    def bulk_activate(self, request):
+        """Активировать пользователей по списку id или фильтру"""
+        return self._bulk_response(
+            lambda ids, queryset: bulk.set_active(ids, queryset, True, request.current_membership, request.current_company),
+            'Пользователи активированы',
+        )
+    
+    @action(detail=False, methods=['post'], url_path='bulk-deactivate')
+    def bulk_deactivate(self, request):
+        """Деактивировать пользователей по списку id или фильтру"""
+        return self._bulk_response(
+            lambda ids, queryset: bulk.set_active(ids, queryset, False, request.current_membership, request.current_company),
+            'Пользователи деактивированы',
+        )
+    
+    @action(detail=False, methods=['post'], url_path='bulk-reset-password')
+    def bulk_reset_password(self, request):
+        """Сбросить пароли пользователей по списку id или фильтру"""
+        return self._bulk_response(
+            lambda ids, queryset: bulk.reset_passwords(
+                ids, queryset, request.current_membership, request.current_company, request.build_absolute_uri,
+            ),
+            'Пароли сброшены',
+        )
+    
+    def _bulk_response(self, operation, message):
+        # Права проверены один раз в UserPermissions.has_permission, без проверки каждого объекта
+        ids, queryset = bulk.resolve_targets(self.request.data, self.get_queryset())
+        results = operation(ids, queryset)
+        return Response({
+            'success': True,
+            'message': message,
+            'updated': sum(result['status'] == 'updated' for result in results),
+            'results': results,
+        })
+    
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FormParser])
+    def import_members(self, request):
+        """
+        Импорт участников из CSV/XLSX (поле file). С dry_run=1 только
+        показывает, что изменится. Новым пользователям выдаются ссылки-приглашения.
+        """
+        upload = request.FILES.get('file')
+        file_format = import_format(upload.name) if upload else None
+        if file_format is None:
+            return Response({
+                'success': False,
+                'message': 'Нужен файл CSV или XLSX в поле file'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        dry_run = request.data.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        try:
+            report = import_members(
+                request.current_company, upload, file_format,
+                actor=request.current_membership, dry_run=dry_run,
+            )
+        except ImportFileError as error:
+            return Response({'success': False, 'message': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = report.as_dict()
+        for invite in data['invites']:
+            invite['url'] = request.build_absolute_uri(invite.pop('path'))
+        return Response({'success': True, **data})
+    
     @action(detail=True, methods=['post'])
     def activate(self, request, pk=None):
         """Активировать пользователя"""
@@ -116,6 +210,7 @@ class UserViewSet(viewsets.ModelViewSet):
         })
 
 
+@method_decorator(company_conditional, name='dispatch')
 class UserProfileViewSet(viewsets.ModelViewSet):
     """
     ViewSet для управления профилями пользователей
@@ -129,14 +224,14 @@ class UserProfileViewSet(viewsets.ModelViewSet):
             return UserProfile.objects.none()
         
         return UserProfile.objects.filter(
-            company=self.request.current_company
-        ).select_related('user', 'department')
+            user__company_memberships__company=self.request.current_company
+        ).select_related('user')
     
     @action(detail=False, methods=['get', 'patch'])
     def me(self, request):
         """Получить/обновить собственный профиль"""
         try:
-            profile = request.user.userprofile
+            profile = request.user.profile
         except UserProfile.DoesNotExist:
             return Response({
                 'success': False,
@@ -5,3 +5,8 @@ class CompaniesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'companies'
     verbose_name = 'Компании'
+
+    def ready(self):
+        # Подключаем обработчики инвалидации кэша тенантов, фрагментов шаблонов,
+        # счетчиков компаний и ETag
+        from . import cache, conditional, fragments, statistics  # noqa: F401
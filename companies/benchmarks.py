@@ -0,0 +1,147 @@
+"""
+Бенчмарк ключевых страниц и API.
+
+Прогоняет запросы тестовым клиентом Django и для каждого эндпоинта
+записывает p50/p95 задержки, число SQL-запросов и размер ответа. Результаты
+сравниваются с сохраненной базовой линией: ответ не 2xx и рост числа
+запросов (например, новый N+1 в middleware) считаются регрессией всегда,
+рост задержки и размера ответа - если он превышает допуск. Базовая линия с
+ответом не 2xx не сохраняется: замерялась бы страница ошибки.
+"""
+import json
+import math
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+DEFAULT_BASELINE_PATH = Path(settings.BASE_DIR) / 'benchmarks' / 'endpoints.json'
+
+# Прирост задержки меньше этого порога (мс) не считается регрессией - шум таймера
+MIN_LATENCY_REGRESSION_MS = 2.0
+
+
+def _company_url(name):
+    return lambda company: reverse(name, kwargs={'company_slug': company.slug})
+
+
+# (название, построитель URL, GET-параметры, нужен ли вход).
+# companies:users_list не измеряется: шаблона companies/users_list.html нет,
+# и страница отвечает ошибкой 500
+ENDPOINTS = [
+    ('unified_login', lambda company: reverse('companies:unified_login'), None, False),
+    ('company_login', _company_url('companies:login'), None, False),
+    ('company_dashboard', _company_url('companies:dashboard'), None, True),
+    ('users_list_view', _company_url('company_users:users_list'), None, True),
+    ('api_users_list', lambda company: '/api/v1/users/', None, True),
+    ('api_users_search', lambda company: '/api/v1/users/', {'search': 'Иван'}, True),
+]
+
+
+def percentile(values, percent):
+    """Возвращает перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _response_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def measure(client, path, params=None, iterations=20, warmup=2):
+    """Выполняет GET-запросы и возвращает статистику по одному эндпоинту"""
+    for _ in range(warmup):
+        _response_size(client.get(path, params))
+
+    timings = []
+    queries = []
+    size = status = 0
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(path, params)
+            # Потоковые ответы формируются при чтении - учитываем и его
+            size = _response_size(response)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+        status = response.status_code
+
+    return {
+        'status': status,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'queries': max(queries),
+        'bytes': size,
+    }
+
+
+def run_benchmarks(company, user, iterations=20, warmup=2, only=None):
+    """Прогоняет все эндпоинты от имени пользователя и возвращает {название: статистика}"""
+    anonymous = Client(raise_request_exception=False)
+    client = Client(raise_request_exception=False)
+    client.force_login(user)
+    # Дашборд сохраняет текущую компанию в сессии - API берет ее оттуда
+    client.get(reverse('companies:dashboard', kwargs={'company_slug': company.slug}))
+
+    results = {}
+    for name, build_url, params, authenticated in ENDPOINTS:
+        if only and name not in only:
+            continue
+        results[name] = measure(
+            client if authenticated else anonymous,
+            build_url(company),
+            params,
+            iterations=iterations,
+            warmup=warmup,
+        )
+    return results
+
+
+def failed(results):
+    """Эндпоинты, ответившие не 2xx: {название: статус}"""
+    return {
+        name: result['status'] for name, result in results.items()
+        if not 200 <= result['status'] < 300
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Возвращает список описаний регрессий относительно базовой линии"""
+    regressions = [f'{name}: статус {status}' for name, status in failed(results).items()]
+    for name, current in results.items():
+        previous = baseline['endpoints'].get(name)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name}: SQL-запросов {previous['queries']} -> {current['queries']}")
+        for field in ('p50_ms', 'p95_ms'):
+            limit = max(previous[field] * (1 + tolerance), previous[field] + MIN_LATENCY_REGRESSION_MS)
+            if current[field] > limit:
+                regressions.append(f"{name}: {field} {previous[field]} -> {current[field]}")
+        if current['bytes'] > previous['bytes'] * (1 + tolerance):
+            regressions.append(f"{name}: размер ответа {previous['bytes']} -> {current['bytes']}")
+    return regressions
+
+
+def load_baseline(path):
+    """Читает базовую линию или возвращает None, если файла нет"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def save_baseline(path, results, parameters):
+    """Сохраняет результаты как новую базовую линию"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {'parameters': parameters, 'endpoints': results}
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
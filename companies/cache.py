@@ -0,0 +1,223 @@
+"""
+Кэш разрешения тенанта: компания по slug, членство пользователя и список
+компаний пользователя. Используется CompanyMiddleware, чтобы "тёплый" запрос
+определял текущую компанию без обращений к базе данных.
+
+Здесь же хранятся разделы меню, видимые каждой роли, и счетчики поколений
+компании, по которым инвалидируются производные данные.
+
+Инвалидация по сигналам очищает кэш только того процесса, который выполнил
+запись. Поэтому при нескольких воркерах нужен общий бэкенд (CACHE_URL,
+например Redis или Memcached). С кэшем в памяти процесса (locmem) записи
+живут не дольше COMPANY_LOCAL_CACHE_TIMEOUT: отозванное в другом воркере
+членство действует лишь несколько секунд, а не COMPANY_CACHE_TIMEOUT.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .metrics import record_cache_lookup
+from .models import Company, CompanyMembership, CompanyMenuSection
+
+
+TENANT_CACHE_TIMEOUT = getattr(settings, 'COMPANY_CACHE_TIMEOUT', 300)
+LOCAL_TENANT_CACHE_TIMEOUT = getattr(settings, 'COMPANY_LOCAL_CACHE_TIMEOUT', 5)
+
+# Маркер "записи нет" - позволяет кэшировать отрицательные ответы
+MISSING = 'missing'
+
+
+def _company_key(slug):
+    return f'companies:company:slug:{slug}'
+
+
+def _company_slug_key(company_id):
+    return f'companies:company:id:{company_id}:slug'
+
+
+def _membership_key(company_id, user_id):
+    return f'companies:membership:{company_id}:{user_id}'
+
+
+def _user_companies_key(user_id):
+    return f'companies:user:{user_id}:company_slugs'
+
+
+def _generation_key(namespace, company_id):
+    return f'companies:generation:{namespace}:{company_id}'
+
+
+def _menu_key(company_id, role_level, generation):
+    return f'companies:menu:{company_id}:{role_level}:{generation}'
+
+
+def is_shared_cache():
+    """Общий ли кэш по умолчанию для всех процессов (не locmem и не dummy)"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def tenant_cache_timeout():
+    """Время жизни записей кэша тенанта с учетом бэкенда кэша"""
+    if is_shared_cache():
+        return TENANT_CACHE_TIMEOUT
+    return min(TENANT_CACHE_TIMEOUT, LOCAL_TENANT_CACHE_TIMEOUT)
+
+
+def get_generation(namespace, company_id):
+    """Возвращает текущее поколение данных компании в пространстве namespace"""
+    key = _generation_key(namespace, company_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Начальное значение от времени: если ключ вытеснен из кэша,
+        # счетчик не вернется к уже использованному поколению
+        cache.add(key, _initial_generation(), None)
+        generation = cache.get(key, 0)
+    return generation
+
+
+def bump_generation(namespace, company_id):
+    """Увеличивает поколение - все ключи предыдущего поколения становятся неактуальны"""
+    key = _generation_key(namespace, company_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        generation = _initial_generation()
+        cache.set(key, generation, None)
+        return generation
+
+
+def touch_generation(namespace, company_id):
+    """
+    Переводит поколение на текущее время в микросекундах (но не меньше
+    прежнего значения + 1): такое поколение одновременно служит временем
+    последнего изменения данных компании.
+    """
+    key = _generation_key(namespace, company_id)
+    generation = max(_initial_generation(), (cache.get(key) or 0) + 1)
+    cache.set(key, generation, None)
+    return generation
+
+
+def _initial_generation():
+    return time.time_ns() // 1000
+
+
+def get_active_company(slug):
+    """Возвращает активную компанию по slug или None"""
+    key = _company_key(slug)
+    company = cache.get(key)
+    record_cache_lookup('company', company is not None)
+    if company is None:
+        company = Company.objects.filter(slug=slug, is_active=True).first() or MISSING
+        cache.set(key, company, tenant_cache_timeout())
+        if company != MISSING:
+            # Запоминаем slug, чтобы после переименования очистить старый ключ
+            cache.set(_company_slug_key(company.pk), slug, tenant_cache_timeout())
+    return None if company == MISSING else company
+
+
+def get_active_membership(company, user):
+    """Возвращает активное членство пользователя в компании или None"""
+    key = _membership_key(company.pk, user.pk)
+    membership = cache.get(key)
+    record_cache_lookup('membership', membership is not None)
+    if membership is None:
+        membership = CompanyMembership.objects.filter(
+            company=company, user=user, is_active=True
+        ).first() or MISSING
+        cache.set(key, membership, tenant_cache_timeout())
+    if membership == MISSING:
+        return None
+    # Подставляем уже загруженные объекты, чтобы не было дополнительных запросов
+    membership.company = company
+    membership.user = user
+    return membership
+
+
+def get_user_company_slugs(user):
+    """Возвращает slug-и компаний, в которых пользователь активен"""
+    key = _user_companies_key(user.pk)
+    slugs = cache.get(key)
+    record_cache_lookup('user_companies', slugs is not None)
+    if slugs is None:
+        slugs = list(
+            CompanyMembership.objects.filter(user=user, is_active=True)
+            .values_list('company__slug', flat=True)
+        )
+        cache.set(key, slugs, tenant_cache_timeout())
+    return slugs
+
+
+def get_menu_sections(company, role_level):
+    """
+    Возвращает активные разделы меню компании, доступные уровню роли role_level.
+    Один запрос на (компания, уровень) до следующего изменения разделов.
+    """
+    key = _menu_key(company.pk, role_level, get_generation('menu', company.pk))
+    sections = cache.get(key)
+    record_cache_lookup('menu', sections is not None)
+    if sections is None:
+        sections = list(
+            CompanyMenuSection.objects.filter(
+                company=company,
+                is_active=True,
+                required_level__lte=role_level,
+            ).order_by('order', 'title')
+        )
+        cache.set(key, sections, tenant_cache_timeout())
+    for section in sections:
+        # get_full_url обращается к компании - не допускаем запроса на каждый раздел
+        section.company = company
+    return sections
+
+
+def invalidate_company(company):
+    """Сбрасывает кэш компании (в том числе по прежнему slug)"""
+    keys = [_company_key(company.slug), _company_slug_key(company.pk)]
+    previous_slug = cache.get(_company_slug_key(company.pk))
+    if previous_slug and previous_slug != company.slug:
+        keys.append(_company_key(previous_slug))
+    cache.delete_many(keys)
+
+
+def invalidate_membership(company_id, user_id):
+    """Сбрасывает кэш членства и списка компаний пользователя"""
+    cache.delete_many([
+        _membership_key(company_id, user_id),
+        _user_companies_key(user_id),
+    ])
+
+
+def invalidate_memberships(company_id, user_ids):
+    """Сбрасывает кэш членств компании одним запросом к кэшу (для массовых операций)"""
+    keys = []
+    for user_id in user_ids:
+        keys += [_membership_key(company_id, user_id), _user_companies_key(user_id)]
+    if keys:
+        cache.delete_many(keys)
+
+
+@receiver([post_save, post_delete], sender=Company)
+def invalidate_company_cache(sender, instance, **kwargs):
+    """Инвалидирует кэш при изменении или удалении компании"""
+    invalidate_company(instance)
+    # Slug и активность компании входят в списки компаний её участников
+    user_ids = CompanyMembership.objects.filter(company_id=instance.pk).values_list('user_id', flat=True)
+    cache.delete_many([_user_companies_key(user_id) for user_id in user_ids])
+
+
+@receiver([post_save, post_delete], sender=CompanyMembership)
+def invalidate_membership_cache(sender, instance, **kwargs):
+    """Инвалидирует кэш при изменении или удалении членства"""
+    invalidate_membership(instance.company_id, instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=CompanyMenuSection)
+def invalidate_menu_cache(sender, instance, **kwargs):
+    """Инвалидирует меню компании при создании, изменении или удалении раздела"""
+    bump_generation('menu', instance.company_id)
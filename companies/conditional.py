@@ -0,0 +1,152 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) по поколению данных компании.
+
+Поколение 'data' компании (companies.cache) переводится на текущее время
+сигналами изменения компании, её участников, профилей, прав, разделов меню и
+настроек. ETag ответа - это поколение плюс хэш варианта ответа (пользователь,
+путь с параметрами, Accept, CSRF-cookie), Last-Modified - время поколения.
+Если клиент прислал совпадающий If-None-Match, декоратор condition() Django
+возвращает 304 до вызова представления: без SQL, сериализации и шаблонов.
+
+Массовые операции без сигналов (bulk_create, update) должны вызывать
+touch_company_data() сами.
+
+Поколение хранится в кэше по умолчанию. Кэш в памяти процесса (locmem) у
+каждого воркера свой, и запись, обработанная одним воркером, не меняет
+поколение в других - они отдавали бы 304 на устаревшие данные без
+ограничения по времени. Поэтому при COMPANY_CONDITIONAL_GET='auto' условные
+GET работают только с общим кэшем.
+"""
+import datetime
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from users.models import UserProfile
+from .cache import get_generation, is_shared_cache, touch_generation
+from .models import Company, CompanyMembership, CompanyMenuSection, CompanySettings
+
+
+DATA_NAMESPACE = 'data'
+
+
+def touch_company_data(company_id):
+    """Отмечает изменение данных компании - все ETag компании устаревают"""
+    return touch_generation(DATA_NAMESPACE, company_id)
+
+
+def touch_users_companies(user_ids):
+    """Отмечает изменение данных всех компаний, в которых состоят пользователи"""
+    company_ids = (
+        CompanyMembership.objects.filter(user_id__in=user_ids)
+        .values_list('company_id', flat=True).distinct()
+    )
+    for company_id in company_ids:
+        touch_company_data(company_id)
+
+
+def _touch_user_companies(user_id):
+    touch_users_companies([user_id])
+
+
+def conditional_get_enabled():
+    """Включены ли условные GET: 'on', 'off' или 'auto' (только с общим кэшем)"""
+    mode = getattr(settings, 'COMPANY_CONDITIONAL_GET', 'auto')
+    if mode == 'auto':
+        return is_shared_cache()
+    return mode == 'on'
+
+
+def _request_company(request, kwargs):
+    """Текущая компания запроса, если ответ можно проверять по её поколению"""
+    company = getattr(request, 'current_company', None)
+    if company is None or not request.user.is_authenticated:
+        return None
+    # Компания из URL должна совпадать с определенной CompanyMiddleware
+    if kwargs.get('company_slug', company.slug) != company.slug:
+        return None
+    # Непоказанные сообщения должны попасть в новый ответ
+    if len(get_messages(request)):
+        return None
+    return company
+
+
+def company_etag(request, *args, **kwargs):
+    company = _request_company(request, kwargs)
+    if company is None:
+        return None
+    variant = '\n'.join([
+        str(request.user.pk),
+        request.get_full_path(),
+        request.headers.get('Accept', ''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ])
+    generation = get_generation(DATA_NAMESPACE, company.pk)
+    return f'"{generation}-{hashlib.md5(variant.encode()).hexdigest()[:16]}"'
+
+
+def company_last_modified(request, *args, **kwargs):
+    company = _request_company(request, kwargs)
+    if company is None:
+        return None
+    generation = get_generation(DATA_NAMESPACE, company.pk)
+    return datetime.datetime.fromtimestamp(generation / 1_000_000, tz=datetime.timezone.utc)
+
+
+def company_conditional(view):
+    """
+    Декоратор представления: ETag/Last-Modified по поколению данных текущей
+    компании и 304 без вызова представления. Ответы помечаются
+    "Cache-Control: private, no-cache", чтобы браузер перепроверял их каждый раз.
+    Если условные GET выключены (conditional_get_enabled), вызывает view как есть.
+    """
+    conditional_view = condition(etag_func=company_etag, last_modified_func=company_last_modified)(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not conditional_get_enabled():
+            return view(request, *args, **kwargs)
+        response = conditional_view(request, *args, **kwargs)
+        if response.has_header('ETag'):
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
+
+
+@receiver([post_save, post_delete], sender=Company)
+def touch_company(sender, instance, **kwargs):
+    touch_company_data(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=CompanyMembership)
+@receiver([post_save, post_delete], sender=CompanyMenuSection)
+@receiver([post_save, post_delete], sender=CompanySettings)
+def touch_company_of(sender, instance, **kwargs):
+    touch_company_data(instance.company_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def touch_user_companies(sender, instance, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login - данные не меняются
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    _touch_user_companies(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def touch_profile_companies(sender, instance, **kwargs):
+    _touch_user_companies(instance.user_id)
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def touch_permission_companies(sender, instance, action, reverse, **kwargs):
+    if action.startswith('post_') and not reverse:
+        _touch_user_companies(instance.pk)
@@ -0,0 +1,164 @@
+"""
+Нагрузочный тест SQLite несколькими процессами.
+
+Каждый воркер - отдельный процесс со своим подключением, как воркер
+gunicorn. Воркеры в течение заданного времени выполняют смесь операций:
+чтение списка участников компании, запись сессии (создание и обновление)
+и изменение членства по схеме «прочитать и сохранить» в одной транзакции.
+Последняя под DEFERRED-транзакциями и журналом отката чаще всего и дает
+"database is locked": транзакция начинается как читающая, а при попытке
+записи SQLite не ждет освобождения блокировки, а сразу возвращает ошибку.
+
+Режимы сравниваются на копиях одной подготовленной базы: journal_mode=WAL
+сохраняется в файле, поэтому одна и та же база для обоих режимов не годится.
+"""
+import math
+import multiprocessing
+import random
+import shutil
+import time
+from pathlib import Path
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import OperationalError, connection, connections, transaction
+
+from .models import CompanyMembership
+
+
+OPERATIONS = ('read', 'session', 'membership')
+
+
+def _read(rng, membership_ids, company_ids, session_keys):
+    company_id = rng.choice(company_ids)
+    list(
+        CompanyMembership.objects.active()
+        .filter(company_id=company_id)
+        .select_related('user')
+        .order_by('-joined_at')[:20]
+    )
+
+
+def _write_session(rng, membership_ids, company_ids, session_keys):
+    if session_keys and rng.random() < 0.5:
+        session = SessionStore(session_key=rng.choice(session_keys))
+    else:
+        session = SessionStore()
+    session['current_company_id'] = str(rng.choice(company_ids))
+    session['touched'] = time.time()
+    session.save()
+    session_keys.append(session.session_key)
+    del session_keys[:-100]
+
+
+def _write_membership(rng, membership_ids, company_ids, session_keys):
+    with transaction.atomic():
+        membership = CompanyMembership.objects.get(pk=rng.choice(membership_ids))
+        membership.permissions ^= CompanyMembership.PERM_VIEW_REPORTS
+        membership.save(update_fields=['permissions'])
+
+
+HANDLERS = {
+    'read': _read,
+    'session': _write_session,
+    'membership': _write_membership,
+}
+
+
+def _worker(db_path, options, duration, write_ratio, seed, membership_ids, company_ids, results):
+    """Тело процесса-воркера: операции до истечения duration секунд"""
+    settings_dict = connection.settings_dict
+    settings_dict['NAME'] = str(db_path)
+    settings_dict['OPTIONS'] = dict(options)
+    rng = random.Random(seed)
+    session_keys = []
+    stats = {operation: {'ok': 0, 'locked': 0, 'latencies': []} for operation in OPERATIONS}
+
+    deadline = time.perf_counter() + duration
+    try:
+        while time.perf_counter() < deadline:
+            if rng.random() < write_ratio:
+                operation = 'session' if rng.random() < 0.5 else 'membership'
+            else:
+                operation = 'read'
+            started = time.perf_counter()
+            try:
+                HANDLERS[operation](rng, membership_ids, company_ids, session_keys)
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                stats[operation]['locked'] += 1
+                continue
+            stats[operation]['ok'] += 1
+            stats[operation]['latencies'].append(time.perf_counter() - started)
+    finally:
+        # Родитель ждет результат каждого воркера, даже упавшего
+        connection.close()
+        results.put(stats)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(fraction * len(values)) - 1)]
+
+
+def run_mode(db_path, options, workers=4, duration=5.0, write_ratio=0.3, seed=0):
+    """
+    Запускает workers процессов на базе db_path с OPTIONS подключения options.
+    Возвращает по каждой операции: выполнено, в секунду, ошибок блокировки,
+    p50 и p99 в мс; плюс итог 'total'.
+    """
+    membership_ids = list(CompanyMembership.objects.values_list('pk', flat=True))
+    company_ids = list(CompanyMembership.objects.values_list('company_id', flat=True).distinct())
+    # Подключения родителя не должны унаследоваться дочерними процессами
+    connections.close_all()
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_worker,
+            args=(db_path, options, duration, write_ratio, seed + number, membership_ids, company_ids, results),
+        )
+        for number in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {}
+    totals = {'ok': 0, 'locked': 0, 'latencies': []}
+    for operation in OPERATIONS:
+        ok = sum(stats[operation]['ok'] for stats in collected)
+        locked = sum(stats[operation]['locked'] for stats in collected)
+        latencies = [value for stats in collected for value in stats[operation]['latencies']]
+        totals['ok'] += ok
+        totals['locked'] += locked
+        totals['latencies'].extend(latencies)
+        summary[operation] = _summarize(ok, locked, latencies, duration)
+    summary['total'] = _summarize(totals['ok'], totals['locked'], totals['latencies'], duration)
+    return summary
+
+
+def _summarize(ok, locked, latencies, duration):
+    return {
+        'ok': ok,
+        'per_second': round(ok / duration, 1),
+        'locked': locked,
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def copy_database(source, target):
+    """Копия файла базы SQLite (вместе с -wal/-shm, если они есть)"""
+    source, target = Path(source), Path(target)
+    shutil.copyfile(source, target)
+    for suffix in ('-wal', '-shm'):
+        extra = source.with_name(source.name + suffix)
+        if extra.exists():
+            shutil.copyfile(extra, target.with_name(target.name + suffix))
+    return target
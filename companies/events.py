@@ -0,0 +1,214 @@
+"""
+Буферизованный журнал структурированных событий.
+
+log_event() только кладет словарь в очередь процесса и сразу возвращает
+управление; фоновый поток забирает события пачками и передает их в
+приемники (JSONL-файл, таблица CompanyEvent или свой класс). Настройки
+задаются словарем COMPANY_EVENT_LOG:
+
+    COMPANY_EVENT_LOG = {
+        'LEVEL': 'INFO',            # минимальный уровень события
+        'SINKS': ['jsonl'],         # 'jsonl', 'db' (не на SQLite), 'null' или путь к классу
+        'JSONL_PATH': BASE_DIR / 'logs' / 'events.jsonl',
+        'BATCH_SIZE': 500,          # максимум событий в одной записи
+        'FLUSH_INTERVAL': 1.0,      # сколько секунд копить пачку
+        'QUEUE_SIZE': 10000,        # при переполнении события отбрасываются
+    }
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+}
+
+DEFAULTS = {
+    'LEVEL': 'INFO',
+    'SINKS': ['jsonl'],
+    'JSONL_PATH': Path(settings.BASE_DIR) / 'logs' / 'events.jsonl',
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'QUEUE_SIZE': 10000,
+}
+
+
+class JsonlSink:
+    """Дописывает события в файл, по одному JSON-объекту на строку"""
+
+    def __init__(self, config):
+        self.path = Path(config['JSONL_PATH'])
+
+    def write(self, events):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines = ''.join(
+            json.dumps(event, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+            for event in events
+        )
+        with self.path.open('a', encoding='utf-8') as stream:
+            stream.write(lines)
+
+
+class DatabaseSink:
+    """
+    Сохраняет события в таблицу CompanyEvent одним bulk_create на пачку.
+
+    С SQLite не поддерживается: запись из фонового потока конкурирует за
+    единственную блокировку записи с транзакциями запросов (BEGIN IMMEDIATE в
+    режиме SQLITE_MODE=production) и ухудшает их задержки и ошибки "database
+    is locked". На SQLite используйте приемник jsonl.
+    """
+
+    def __init__(self, config):
+        if connections[DEFAULT_DB_ALIAS].vendor == 'sqlite':
+            raise ImproperlyConfigured('Приемник событий db не поддерживается с SQLite, используйте jsonl')
+        self.batch_size = config['BATCH_SIZE']
+
+    def write(self, events):
+        from .models import CompanyEvent
+
+        CompanyEvent.objects.bulk_create([
+            CompanyEvent(
+                created_at=event['ts'],
+                event=event['event'],
+                level=event['level'],
+                company_id=event.get('company_id'),
+                user_id=event.get('user_id'),
+                data=event['data'],
+            )
+            for event in events
+        ], batch_size=self.batch_size)
+
+
+class NullSink:
+    """Отбрасывает события (например, для тестов)"""
+
+    def __init__(self, config):
+        pass
+
+    def write(self, events):
+        pass
+
+
+SINKS = {
+    'jsonl': JsonlSink,
+    'db': DatabaseSink,
+    'null': NullSink,
+}
+
+
+class EventLog:
+    """Очередь событий процесса и фоновый поток, записывающий их пачками"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        config = self.configure()
+        self.queue = queue.Queue(maxsize=config['QUEUE_SIZE'])
+        self.dropped = 0
+
+    def configure(self):
+        """(Пере)читывает уровень и приемники из настройки COMPANY_EVENT_LOG"""
+        config = {**DEFAULTS, **getattr(settings, 'COMPANY_EVENT_LOG', {})}
+        self.level = LEVELS[config['LEVEL']]
+        self.batch_size = config['BATCH_SIZE']
+        self.flush_interval = config['FLUSH_INTERVAL']
+        self.sinks = [
+            (SINKS.get(name) or import_string(name))(config)
+            for name in config['SINKS']
+        ]
+        return config
+
+    def is_enabled_for(self, level):
+        return LEVELS[level] >= self.level and bool(self.sinks)
+
+    def log(self, event, level='INFO', company_id=None, user_id=None, **data):
+        if not self.is_enabled_for(level):
+            return
+        record = {
+            'ts': timezone.now(),
+            'event': event,
+            'level': LEVELS[level],
+            'company_id': company_id,
+            'user_id': user_id,
+            'data': data,
+        }
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Сохранение модели важнее журнала - не блокируемся
+            self.dropped += 1
+            return
+        self._ensure_writer()
+
+    def flush(self, timeout=5.0):
+        """Ждет, пока все поставленные в очередь события будут записаны"""
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _ensure_writer(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='company-event-log', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _write(self, batch):
+        for sink in self.sinks:
+            try:
+                sink.write(batch)
+            except Exception:
+                logger.exception('Не удалось записать %d событий в %s', len(batch), type(sink).__name__)
+
+
+event_log = EventLog()
+
+atexit.register(event_log.flush)
+
+
+def log_event(event, level='INFO', **data):
+    """
+    Ставит событие в очередь журнала: log_event('membership.created',
+    company_id=..., user_id=..., role='admin'). Не блокирует вызывающий код.
+    """
+    event_log.log(event, level=level, **data)
@@ -0,0 +1,240 @@
+"""
+Потоковая выгрузка участников компании в CSV и XLSX.
+
+Строки читаются из базы через values().iterator(chunk_size=...) и сразу
+превращаются в байты: в памяти одновременно находится только одна пачка
+строк, поэтому потребление памяти не зависит от числа участников. XLSX
+собирается вручную - это zip-архив, в который лист пишется потоком (zipfile
+на незаписываемом назад выходе использует data descriptor), а ячейки
+хранятся как inline-строки без общей таблицы строк. openpyxl и tablib
+(import_export) так не умеют: они держат в памяти весь лист или весь набор
+данных.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import CompanyMembership
+
+
+# Строк в одной пачке выборки и в одном куске ответа
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Заголовок столбца и поле values()
+FIELDS = [
+    ('ID пользователя', 'user_id'),
+    ('Логин', 'user__username'),
+    ('Имя', 'user__first_name'),
+    ('Фамилия', 'user__last_name'),
+    ('Email', 'user__email'),
+    ('Аккаунт активен', 'user__is_active'),
+    ('Телефон', 'user__profile__phone'),
+    ('Должность', 'user__profile__position'),
+    ('Подразделение', 'user__profile__department'),
+    ('Роль', 'role'),
+    ('Уровень роли', 'role_level'),
+    ('Активное членство', 'is_active'),
+    ('Дата присоединения', 'joined_at'),
+]
+
+# Флаги прав берутся из маски permissions
+PERMISSIONS = [
+    (str(CompanyMembership._meta.get_field(name).verbose_name), bit)
+    for name, bit in CompanyMembership.PERMISSION_FIELDS.items()
+]
+
+HEADERS = [header for header, _ in FIELDS] + [header for header, _ in PERMISSIONS]
+
+ROLE_NAMES = dict(CompanyMembership.ROLES)
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def member_rows(company, chunk_size=EXPORT_CHUNK_SIZE):
+    """Строки выгрузки (списки значений в порядке HEADERS)"""
+    memberships = (
+        CompanyMembership.objects.filter(company=company)
+        .order_by('joined_at', 'pk')
+        .values(*[field for _, field in FIELDS], 'permissions')
+        .iterator(chunk_size=chunk_size)
+    )
+    # Часовой пояс определяется один раз, а не для каждой строки
+    tz = timezone.get_current_timezone()
+    for membership in memberships:
+        row = [membership[field] for _, field in FIELDS]
+        row[-4] = ROLE_NAMES.get(row[-4], row[-4])
+        if row[-1] is not None:
+            row[-1] = row[-1].astimezone(tz).replace(tzinfo=None)
+        permissions = membership['permissions']
+        row.extend(permissions & bit == bit for _, bit in PERMISSIONS)
+        yield row
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Значения, которые табличные редакторы выполняют как формулы
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'да' if value else 'нет'
+    if isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(rows, batch_size=EXPORT_CHUNK_SIZE):
+    """Байты CSV по пачкам строк; BOM нужен, чтобы Excel распознал UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADERS)
+    yield ('\ufeff' + buffer.getvalue()).encode()
+    for batch in _batches(rows, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode()
+
+
+# Символы, недопустимые в XML 1.0
+_XML_ILLEGAL_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def _xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, int):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        value = value.strftime(DATETIME_FORMAT)
+    text = escape(_XML_ILLEGAL_RE.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Участники" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+XLSX_SHEET = 'xl/worksheets/sheet1.xml'
+
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+
+class _ChunkSink:
+    """Выход zipfile без seek: накапливает записанные байты до выдачи"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def xlsx_chunks(rows, batch_size=EXPORT_CHUNK_SIZE):
+    """Байты XLSX по пачкам строк"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open(XLSX_SHEET, 'w') as sheet:
+            sheet.write((XLSX_SHEET_START + _xlsx_row(HEADERS)).encode())
+            for batch in _batches(rows, batch_size):
+                sheet.write(''.join(_xlsx_row(row) for row in batch).encode())
+                data = sink.drain()
+                if data:
+                    yield data
+            sheet.write(XLSX_SHEET_END.encode())
+    yield sink.drain()
+
+
+WRITERS = {
+    'csv': csv_chunks,
+    'xlsx': xlsx_chunks,
+}
+
+
+def export_members(company, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Итератор байтов выгрузки участников компании в формате export_format"""
+    return WRITERS[export_format](member_rows(company, chunk_size), chunk_size)
+
+
+def export_filename(company, export_format):
+    return f'{company.slug}-members-{timezone.localdate():%Y%m%d}.{export_format}'
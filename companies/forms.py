@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from .models import Company, CompanyMembership, CompanyMenuSection
+from .slugs import allocate_company_slug
 
 
 class CompanyRegistrationForm(forms.Form):
@@ -110,6 +111,8 @@ class CompanyRegistrationForm(forms.Form):
         company_name = self.cleaned_data.get('company_name')
         if Company.objects.filter(name=company_name).exists():
             raise forms.ValidationError("Компания с таким названием уже существует.")
+        # Выделяем slug заранее: при гонке Company.save() подберет следующий
+        self.cleaned_data['company_slug'] = allocate_company_slug(company_name)
         return company_name
     
     def clean(self):
@@ -0,0 +1,77 @@
+"""
+Кэш отрисованных фрагментов шаблонов компании (боковая панель с разделами
+меню).
+
+Ключ фрагмента: компания, вариант (уровень роли, активный пункт), версия
+шаблона и поколение 'fragments' компании. Версия - хэш исходника шаблона,
+поэтому после выкладки измененного шаблона старые фрагменты не
+используются. Поколение увеличивают сигналы компании, её настроек и
+разделов меню; массовые изменения этих моделей должны вызывать
+invalidate_fragments() сами. Старые ключи не удаляются, а вытесняются по
+таймауту.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import get_template
+
+from .cache import bump_generation, get_generation
+from .metrics import record_cache_lookup
+from .models import Company, CompanyMenuSection, CompanySettings
+
+
+FRAGMENTS_NAMESPACE = 'fragments'
+
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'COMPANY_FRAGMENT_CACHE_TIMEOUT', 3600)
+
+_versions = {}
+
+
+def template_version(template_name):
+    """Короткий хэш исходника шаблона (в DEBUG пересчитывается каждый раз)"""
+    if settings.DEBUG or template_name not in _versions:
+        source = get_template(template_name).template.source
+        _versions[template_name] = hashlib.md5(source.encode()).hexdigest()[:10]
+    return _versions[template_name]
+
+
+def _fragment_key(template_name, company_id, variant, version, generation):
+    return f'companies:fragment:{template_name}:{company_id}:{variant}:{version}:{generation}'
+
+
+def render_fragment(template_name, company_id, variant, get_context):
+    """
+    Возвращает HTML фрагмента из кэша или отрисовывает шаблон с контекстом
+    get_context() и кэширует результат. variant - строка со всем, от чего
+    зависит HTML помимо компании.
+    """
+    key = _fragment_key(
+        template_name, company_id, variant,
+        template_version(template_name), get_generation(FRAGMENTS_NAMESPACE, company_id),
+    )
+    html = cache.get(key)
+    record_cache_lookup('fragment', html is not None)
+    if html is None:
+        html = get_template(template_name).render(get_context())
+        cache.set(key, html, FRAGMENT_CACHE_TIMEOUT)
+    return html
+
+
+def invalidate_fragments(company_id):
+    """Сбрасывает все фрагменты компании"""
+    bump_generation(FRAGMENTS_NAMESPACE, company_id)
+
+
+@receiver([post_save, post_delete], sender=Company)
+def invalidate_company_fragments(sender, instance, **kwargs):
+    # Название и slug компании входят в ссылки фрагментов
+    invalidate_fragments(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=CompanyMenuSection)
+@receiver([post_save, post_delete], sender=CompanySettings)
+def invalidate_fragments_of(sender, instance, **kwargs):
+    invalidate_fragments(instance.company_id)
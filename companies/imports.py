@@ -0,0 +1,504 @@
+"""
+Массовый импорт участников компании из CSV и XLSX.
+
+Файл читается построчно (CSV - через инкрементальный декодер, XLSX - openpyxl
+в режиме read_only) и обрабатывается пачками по chunk_size строк. Для каждой
+пачки текущее состояние читается тремя запросами (пользователи с профилями по
+логинам, членства в компании), изменения пишутся bulk_create/bulk_update,
+поэтому число запросов зависит от числа пачек, а не строк.
+
+Новые пользователи создаются с непригодным паролем (без PBKDF2 на каждого)
+и получают ссылку-приглашение, по которой задают пароль сами. Личные данные
+существующего пользователя меняются, только если он уже участник компании;
+пользователь из другой компании просто добавляется. Членство владельца
+компании и самого импортирующего не меняется.
+
+Массовые операции не вызывают сигналов, поэтому счетчики компании, поисковый
+индекс, кэш членств и поколение данных обновляются здесь же. В режиме dry_run
+ничего не записывается, отчет показывает, что изменилось бы.
+
+Столбцы определяются по заголовку: подходят как имена полей (username,
+email, role, ...), так и заголовки выгрузки companies.export, поэтому
+выгруженный файл можно отредактировать и загрузить обратно.
+"""
+import codecs
+import csv
+import itertools
+import os
+import secrets
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+from users import search
+from users.models import UserProfile
+from .cache import invalidate_memberships
+from .conditional import touch_company_data, touch_users_companies
+from .export import FIELDS as EXPORT_FIELDS
+from .models import CompanyMembership
+from .session import invite_path, invite_path_template
+from .statistics import adjust_counters, claim_activity
+
+
+# Строк в одной пачке
+IMPORT_CHUNK_SIZE = 1000
+
+# Сколько ошибок хранить в отчете (считаются все)
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FORMATS = ('csv', 'xlsx')
+
+USER_FIELDS = ['first_name', 'last_name', 'email']
+PROFILE_FIELDS = ['phone', 'position', 'department']
+MEMBERSHIP_FIELDS = ['role', 'is_active', *CompanyMembership.PERMISSION_FIELDS]
+BOOLEAN_FIELDS = {'is_active', *CompanyMembership.PERMISSION_FIELDS}
+
+# Поле импорта и поле values() в выгрузке, заголовок которого тоже подходит
+EXPORT_SOURCES = {
+    'username': 'user__username',
+    'first_name': 'user__first_name',
+    'last_name': 'user__last_name',
+    'email': 'user__email',
+    'phone': 'user__profile__phone',
+    'position': 'user__profile__position',
+    'department': 'user__profile__department',
+    'role': 'role',
+    'is_active': 'is_active',
+}
+
+
+def _column_aliases():
+    headers = {source: header for header, source in EXPORT_FIELDS}
+    aliases = {}
+    for field in ['username', *USER_FIELDS, *PROFILE_FIELDS, *MEMBERSHIP_FIELDS]:
+        aliases[field] = field
+        if field in EXPORT_SOURCES:
+            aliases[headers[EXPORT_SOURCES[field]].lower()] = field
+        elif field in CompanyMembership.PERMISSION_FIELDS:
+            verbose_name = CompanyMembership._meta.get_field(field).verbose_name
+            aliases[str(verbose_name).lower()] = field
+    return aliases
+
+
+COLUMN_ALIASES = _column_aliases()
+
+ROLE_ALIASES = {
+    **{code: code for code, _ in CompanyMembership.ROLES},
+    **{str(name).lower(): code for code, name in CompanyMembership.ROLES},
+}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да', '+'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'нет', '-'}
+
+# Экранирование формул, которое добавляет выгрузка в CSV
+_FORMULA_PREFIXES = ('=', '+', '-', '@')
+
+_username_validator = UnicodeUsernameValidator()
+
+
+def unusable_password():
+    """
+    Непригодный пароль, как make_password(None), но одним вызовом secrets:
+    make_password(None) выбирает 40 случайных символов по одному, что на
+    сотнях тысяч пользователей занимает секунды
+    """
+    return UNUSABLE_PASSWORD_PREFIX + secrets.token_hex(20)
+
+
+class ImportFileError(Exception):
+    """Файл нельзя импортировать целиком (формат, нет нужных столбцов)"""
+
+
+def _max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+MAX_LENGTHS = {
+    'username': _max_length(User, 'username'),
+    **{field: _max_length(User, field) for field in USER_FIELDS},
+    **{field: _max_length(UserProfile, field) for field in PROFILE_FIELDS},
+}
+
+
+def _csv_records(file):
+    """Строки CSV-файла (байтового); разделитель - запятая, точка с запятой или табуляция"""
+    lines = codecs.iterdecode(file, 'utf-8-sig')
+    try:
+        first = next(lines)
+    except StopIteration:
+        return
+    except UnicodeDecodeError:
+        raise ImportFileError('Файл должен быть в кодировке UTF-8')
+    delimiter = max([',', ';', '\t'], key=first.count)
+    try:
+        yield from csv.reader(itertools.chain([first], lines), delimiter=delimiter)
+    except UnicodeDecodeError:
+        raise ImportFileError('Файл должен быть в кодировке UTF-8')
+
+
+def _xlsx_records(file):
+    """Строки первого листа XLSX; openpyxl в режиме read_only читает лист потоком"""
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (InvalidFileException, KeyError, OSError, ValueError) as error:
+        raise ImportFileError(f'Не удалось прочитать XLSX: {error}')
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def import_format(name):
+    """Формат файла по имени или None, если формат не поддерживается"""
+    extension = os.path.splitext(name or '')[1].lower().lstrip('.')
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    if value[:1] == "'" and value[1:2] in _FORMULA_PREFIXES:
+        value = value[1:]
+    return value
+
+
+def read_rows(file, import_format):
+    """
+    Разбирает файл и выдает (номер строки, {поле: значение}) только для
+    распознанных столбцов. Пустые строки пропускаются.
+    """
+    records = _csv_records(file) if import_format == 'csv' else _xlsx_records(file)
+    header = next(records, None)
+    if header is None:
+        raise ImportFileError('Файл пуст')
+    columns = [COLUMN_ALIASES.get(str(_cell(name)).lower()) for name in header]
+    if 'username' not in columns:
+        raise ImportFileError('Нет столбца с логином (username или «Логин»)')
+
+    for line, record in enumerate(records, start=2):
+        values = {}
+        for field, value in zip(columns, record):
+            if field is not None:
+                values[field] = _cell(value)
+        if any(value != '' for value in values.values()):
+            yield line, values
+
+
+def _parse_bool(value):
+    if value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError(f'Ожидается да/нет, получено «{value}»')
+
+
+def clean_row(values):
+    """Проверяет и приводит значения строки; ошибки - ValidationError"""
+    cleaned = {}
+    for field, value in values.items():
+        if field in BOOLEAN_FIELDS:
+            parsed = _parse_bool(value)
+            if parsed is not None:
+                cleaned[field] = parsed
+            continue
+        value = str(value) if not isinstance(value, bool) else str(int(value))
+        if field == 'role':
+            if value:
+                if value.lower() not in ROLE_ALIASES:
+                    raise ValidationError(f'Неизвестная роль «{value}»')
+                cleaned['role'] = ROLE_ALIASES[value.lower()]
+            continue
+        if len(value) > MAX_LENGTHS[field]:
+            raise ValidationError(f'Поле {field} длиннее {MAX_LENGTHS[field]} символов')
+        cleaned[field] = value
+
+    if not cleaned.get('username'):
+        raise ValidationError('Не указан логин')
+    _username_validator(cleaned['username'])
+    if cleaned.get('email'):
+        validate_email(cleaned['email'])
+    return cleaned
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _membership_state(membership):
+    return tuple(getattr(membership, field) for field in ['role_level', 'permissions', *MEMBERSHIP_FIELDS])
+
+
+class ImportReport:
+    """Итоги импорта: счетчики по статусам, ошибки и приглашения"""
+
+    STATUSES = ['created', 'added', 'updated', 'unchanged', 'error']
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.counts = dict.fromkeys(self.STATUSES, 0)
+        self.errors = []
+        self.invites = []
+
+    def add_error(self, line, message):
+        self.counts['error'] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'message': message})
+
+    def as_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'counts': self.counts,
+            'errors': self.errors,
+            'invites': self.invites,
+        }
+
+
+class MemberImporter:
+    """
+    Импорт участников в компанию company.
+
+        report = MemberImporter(company, dry_run=True).run(read_rows(file, 'csv'))
+
+    actor - членство импортирующего: администратор (не владелец) не может
+    назначать роль администратора и менять членства и личные данные
+    администраторов, как и в edit_user_membership. Владельца и самого actor
+    импорт не меняет. Без actor (команда управления) ограничений нет.
+    """
+
+    def __init__(self, company, actor=None, dry_run=False, chunk_size=IMPORT_CHUNK_SIZE):
+        self.company = company
+        self.actor = actor
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size
+        self.protected_user_ids = {company.owner_id}
+        if actor is not None:
+            self.protected_user_ids.add(actor.user_id)
+        self.seen_usernames = set()
+        self.invite_path = invite_path_template(company)
+
+    def run(self, rows):
+        report = ImportReport(self.dry_run)
+        for chunk in _chunks(rows, self.chunk_size):
+            self.import_chunk(chunk, report)
+        return report
+
+    def _may_assign(self, role_level):
+        if self.actor is None or self.actor.role_level >= CompanyMembership.ROLE_LEVELS['owner']:
+            return True
+        return role_level < CompanyMembership.ROLE_LEVELS['admin']
+
+    def _clean(self, chunk, report):
+        cleaned = []
+        for line, values in chunk:
+            try:
+                row = clean_row(values)
+            except ValidationError as error:
+                report.add_error(line, ' '.join(error.messages))
+                continue
+            if row['username'] in self.seen_usernames:
+                report.add_error(line, f'Логин {row["username"]} повторяется в файле')
+                continue
+            self.seen_usernames.add(row['username'])
+            cleaned.append((line, row))
+        return cleaned
+
+    def _check_owner(self, line, user, row, report):
+        # Владелец в выгрузке остается владельцем, другим эта роль не назначается
+        if row.get('role') == 'owner' and (user is None or user.pk != self.company.owner_id):
+            report.add_error(line, 'Роль владельца не назначается импортом')
+            return False
+        return True
+
+    def import_chunk(self, chunk, report):
+        rows = self._clean(chunk, report)
+        if not rows:
+            return
+
+        users = {
+            user.username: user
+            for user in User.objects.filter(username__in=[row['username'] for _, row in rows])
+        }
+        profiles = {
+            profile.user_id: profile
+            for profile in UserProfile.objects.filter(user__in=users.values())
+        }
+        memberships = {
+            membership.user_id: membership
+            for membership in CompanyMembership.objects.filter(company=self.company, user__in=users.values())
+        }
+
+        now = timezone.now()
+        new_users, new_profiles, new_memberships = [], [], []
+        changed_users, changed_profiles, changed_memberships = [], [], []
+        for line, row in rows:
+            user = users.get(row['username'])
+            if not self._check_owner(line, user, row, report):
+                continue
+            if user is None:
+                user = User(
+                    username=row['username'],
+                    password=unusable_password(),
+                    date_joined=now,
+                    **{field: row.get(field, '') for field in USER_FIELDS},
+                )
+                membership = CompanyMembership(company=self.company, user=user, role='employee')
+                self._apply_membership(membership, row)
+                if not self._may_assign(membership.role_level):
+                    report.add_error(line, 'Недостаточно прав для назначения этой роли')
+                    continue
+                new_users.append(user)
+                new_profiles.append(UserProfile(user=user, **{field: row.get(field, '') for field in PROFILE_FIELDS}))
+                new_memberships.append(membership)
+                report.counts['created'] += 1
+                continue
+
+            membership = memberships.get(user.pk)
+            if membership is None:
+                # Пользователь другой компании: личные данные не трогаем
+                membership = CompanyMembership(company=self.company, user=user, role='employee')
+                self._apply_membership(membership, row)
+                if not self._may_assign(membership.role_level):
+                    report.add_error(line, 'Недостаточно прав для назначения этой роли')
+                    continue
+                new_memberships.append(membership)
+                report.counts['added'] += 1
+                continue
+
+            profile = profiles.get(user.pk)
+            if user.pk in self.protected_user_ids or not self._may_assign(membership.role_level):
+                # Владельца, самого импортирующего и участников с ролью не ниже
+                # той, что он может назначать, импорт не меняет - в том числе
+                # личные данные
+                if self._differs(user, row, USER_FIELDS) or (
+                    profile is not None and self._differs(profile, row, PROFILE_FIELDS)
+                ):
+                    report.add_error(line, 'Недостаточно прав для изменения этого участника')
+                else:
+                    report.counts['unchanged'] += 1
+                continue
+
+            changed = False
+            before = _membership_state(membership)
+            self._apply_membership(membership, row)
+            if _membership_state(membership) != before:
+                if not self._may_assign(membership.role_level):
+                    report.add_error(line, 'Недостаточно прав для изменения этого участника')
+                    continue
+                changed_memberships.append(membership)
+                changed = True
+            if self._apply(user, row, USER_FIELDS):
+                changed_users.append(user)
+                changed = True
+            if profile is None:
+                new_profiles.append(UserProfile(user=user, **{field: row.get(field, '') for field in PROFILE_FIELDS}))
+            elif self._apply(profile, row, PROFILE_FIELDS):
+                changed_profiles.append(profile)
+                changed = True
+            report.counts['updated' if changed else 'unchanged'] += 1
+
+        if self.dry_run or not (new_memberships or new_profiles or changed_users
+                                or changed_profiles or changed_memberships):
+            return
+
+        with transaction.atomic():
+            User.objects.bulk_create(new_users)
+            for profile in new_profiles:
+                profile.user_id = profile.user.pk
+            for membership in new_memberships:
+                membership.user_id = membership.user.pk
+            UserProfile.objects.bulk_create(new_profiles)
+            CompanyMembership.objects.bulk_create(new_memberships)
+            if changed_users:
+                User.objects.bulk_update(changed_users, USER_FIELDS)
+            if changed_profiles:
+                UserProfile.objects.bulk_update(changed_profiles, PROFILE_FIELDS)
+            # Активность учитывается по строкам, которые условный UPDATE действительно изменил
+            active_delta = sum(membership.is_active for membership in new_memberships)
+            if changed_memberships:
+                for is_active in (True, False):
+                    active_delta += claim_activity(
+                        CompanyMembership.objects.filter(pk__in=[
+                            membership.pk for membership in changed_memberships if membership.is_active == is_active
+                        ]),
+                        is_active,
+                    )
+                CompanyMembership.objects.bulk_update(
+                    changed_memberships, ['role_level', 'permissions', *MEMBERSHIP_FIELDS]
+                )
+            adjust_counters(
+                self.company.pk,
+                members_count=len(new_memberships),
+                active_members_count=active_delta,
+            )
+
+        search.index_users(
+            [user.pk for user in new_users]
+            + [membership.user_id for membership in new_memberships]
+            + [user.pk for user in changed_users]
+        )
+        invalidate_memberships(
+            self.company.pk,
+            [membership.user_id for membership in new_memberships + changed_memberships],
+        )
+        touch_company_data(self.company.pk)
+        # Личные данные видны и в других компаниях пользователя
+        edited = {user.pk for user in changed_users} | {profile.user_id for profile in changed_profiles}
+        if edited:
+            touch_users_companies(edited)
+
+        for user in new_users:
+            report.invites.append({
+                'user_id': user.pk,
+                'username': user.username,
+                'email': user.email,
+                'path': invite_path(self.invite_path, user),
+            })
+
+    @staticmethod
+    def _apply_membership(membership, row):
+        for field in MEMBERSHIP_FIELDS:
+            if field in row:
+                setattr(membership, field, row[field])
+        membership.apply_role_defaults()
+
+    @staticmethod
+    def _differs(instance, row, fields):
+        return any(field in row and getattr(instance, field) != row[field] for field in fields)
+
+    @staticmethod
+    def _apply(instance, row, fields):
+        """Переносит значения столбцов файла в instance, возвращает True при изменении"""
+        changed = False
+        for field in fields:
+            if field in row and getattr(instance, field) != row[field]:
+                setattr(instance, field, row[field])
+                changed = True
+        return changed
+
+
+def import_members(company, file, import_format, actor=None, dry_run=False, chunk_size=IMPORT_CHUNK_SIZE):
+    """Импортирует участников из файла и возвращает ImportReport"""
+    return MemberImporter(company, actor, dry_run, chunk_size).run(read_rows(file, import_format))
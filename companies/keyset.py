@@ -0,0 +1,127 @@
+"""
+Keyset-пагинация (поиск по ключу вместо OFFSET).
+
+Страница выбирается условием «строки после последней строки предыдущей
+страницы» по тем же полям, что и сортировка, поэтому при индексе по этим
+полям любая страница стоит столько же, сколько первая. Курсор - сортировка
+и значения её полей для последней строки в base64 JSON. Курсор другой
+сортировки или с неподходящими значениями считается отсутствующим: выдается
+первая страница.
+
+    ordering = [('joined_at', True), ('pk', True)]   # (поле, по убыванию)
+    rows, next_cursor = paginate(queryset, ordering, request.GET.get('cursor'), 50)
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+def _json_default(value):
+    # DjangoJSONEncoder округляет время до миллисекунд - для курсора нужна полная точность
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def sort_key(ordering):
+    """Сортировка строкой, как в order_by(): '-joined_at,-pk'"""
+    return ','.join(order_by(ordering))
+
+
+def encode_cursor(values, ordering):
+    data = json.dumps(
+        {'sort': sort_key(ordering), 'values': values}, default=_json_default, separators=(',', ':'),
+    ).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _model_field(model, path):
+    field = None
+    for part in path.split('__'):
+        if field is not None:
+            model = field.related_model
+        field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+    return field
+
+
+def decode_cursor(cursor, ordering, model):
+    """
+    Возвращает значения полей из курсора, приведенные к типам полей model,
+    или None, если курсор поврежден или выдан для другой сортировки
+    """
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('sort') != sort_key(ordering):
+        return None
+    values = data.get('values')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        return None
+    try:
+        values = [
+            _model_field(model, field).to_python(value)
+            for (field, _), value in zip(ordering, values)
+        ]
+    except (FieldDoesNotExist, ValidationError, TypeError, ValueError):
+        return None
+    # Поля сортировки не бывают NULL, а сравнение с None фильтр не примет
+    if any(value is None for value in values):
+        return None
+    return values
+
+
+def order_by(ordering):
+    """Аргументы order_by() для сортировки"""
+    return [f'-{field}' if descending else field for field, descending in ordering]
+
+
+def after(ordering, values):
+    """
+    Условие «строка идет после values» для сортировки ordering:
+    (a > x) OR (a = x AND b > y) OR ... с учетом направления каждого поля.
+    """
+    # Условие на первое поле дублирует OR-ветки, но позволяет начать
+    # чтение индекса сразу с нужного места, а не с начала
+    first_field, first_descending = ordering[0]
+    bound = Q(**{f'{first_field}__{"lte" if first_descending else "gte"}': values[0]})
+    condition = Q()
+    for index, (field, descending) in enumerate(ordering):
+        step = Q(**{f'{field}__{"lt" if descending else "gt"}': values[index]})
+        for previous, (previous_field, _) in enumerate(ordering[:index]):
+            step &= Q(**{previous_field: values[previous]})
+        condition |= step
+    return bound & condition
+
+
+def row_values(row, ordering):
+    """Значения полей сортировки строки (объекта модели или словаря из values())"""
+    if isinstance(row, dict):
+        return [row[field] for field, _ in ordering]
+    values = []
+    for field, _ in ordering:
+        value = row
+        for part in field.split('__'):
+            value = getattr(value, part)
+        values.append(value)
+    return values
+
+
+def paginate(queryset, ordering, cursor, per_page):
+    """Возвращает строки страницы и курсор следующей страницы (или None)"""
+    queryset = queryset.order_by(*order_by(ordering))
+    values = decode_cursor(cursor, ordering, queryset.model)
+    if values is not None:
+        queryset = queryset.filter(after(ordering, values))
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(row_values(rows[-1], ordering), ordering)
+    return rows, next_cursor
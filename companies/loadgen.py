@@ -0,0 +1,239 @@
+"""
+Генератор синтетических данных для нагрузочного тестирования.
+
+Создает N компаний по M участников с профилями, членствами и разделами меню
+через bulk_create пачками. Пароль хэшируется один раз, а все значения,
+включая id компаний и даты регистрации пользователей, выводятся из seed,
+поэтому повторный запуск с тем же seed дает тот же набор данных (кроме
+created_at/joined_at, которые Django проставляет при вставке). Сигналы
+моделей при bulk_create не срабатывают, поэтому настройки, счетчики,
+поисковый индекс и производные поля (уровень роли, маска прав) заполняются
+здесь же.
+"""
+import datetime
+import random
+import time
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+
+from users import search
+from users.models import UserProfile
+from .cache import invalidate_company
+from .models import (Company, CompanyMembership, CompanySettings, CompanyStatistics,
+                     CompanyMenuSection)
+
+
+FIRST_NAMES = [
+    'Александр', 'Анна', 'Дмитрий', 'Елена', 'Иван', 'Мария', 'Сергей', 'Ольга',
+    'Андрей', 'Наталья', 'Алексей', 'Татьяна', 'Михаил', 'Ирина', 'Николай', 'Светлана',
+]
+
+LAST_NAMES = [
+    'Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+    'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов',
+]
+
+POSITIONS = [
+    'Менеджер по закупкам', 'Специалист', 'Бухгалтер', 'Кладовщик', 'Аналитик',
+    'Начальник отдела', 'Инженер', 'Логист',
+]
+
+DEPARTMENTS = ['Закупки', 'Бухгалтерия', 'Склад', 'Логистика', 'Продажи', 'ИТ']
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань']
+
+# Доли ролей среди участников (кроме владельца)
+ROLE_WEIGHTS = [('admin', 2), ('manager', 10), ('employee', 80), ('viewer', 8)]
+
+# Доля неактивных членств
+INACTIVE_SHARE = 0.03
+
+# Дата регистрации первого пользователя; следующие - с шагом в минуту
+DATE_JOINED_FROM = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Пространство имен UUID компаний: id выводится из slug (префикс, seed, номер)
+COMPANY_ID_NAMESPACE = uuid.UUID('6f1c7a52-3d4e-4b8a-9c1f-2e5d8a7b6c40')
+
+
+def _delete_rows(queryset):
+    """Удаляет строки выборки одним DELETE без сигналов и каскада; возвращает их число"""
+    model = queryset.model
+    connection = connections[queryset.db]
+    select_sql, params = queryset.values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} '
+            f'WHERE {connection.ops.quote_name(model._meta.pk.column)} IN ({select_sql})',
+            params,
+        )
+        return cursor.rowcount
+
+
+class LoadDataGenerator:
+    """Создает компании, пользователей, профили, членства и разделы меню пачками"""
+
+    def __init__(self, companies=10, members=100, sections=5, seed=0,
+                 chunk_size=5000, password='pass123', prefix='load', log=None):
+        self.companies = companies
+        self.members = max(members, 1)
+        self.sections = sections
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.password = password
+        self.prefix = prefix
+        self.log = log or (lambda message: None)
+
+    @property
+    def slug_prefix(self):
+        return f'{self.prefix}-{self.seed}-'
+
+    @property
+    def username_prefix(self):
+        return f'{self.prefix}{self.seed}_'
+
+    def clear(self):
+        """Удаляет данные, ранее созданные с тем же префиксом и seed"""
+        companies = Company.objects.filter(slug__startswith=self.slug_prefix)
+        existing = list(companies.only('pk', 'slug'))
+        company_ids = [company.pk for company in existing]
+        # Обычный delete() отправил бы сигналы для каждого из сотен тысяч членств,
+        # поэтому связанные таблицы очищаются прямыми DELETE в порядке зависимостей
+        with transaction.atomic():
+            for model in (CompanyMembership, CompanyMenuSection, CompanySettings, CompanyStatistics):
+                _delete_rows(model.objects.filter(company_id__in=company_ids))
+            deleted_companies = _delete_rows(companies)
+            users = User.objects.filter(username__startswith=self.username_prefix)
+            _delete_rows(UserProfile.objects.filter(user__in=users))
+            deleted_users = users.delete()[1].get('auth.User', 0)
+        for company in existing:
+            invalidate_company(company)
+        return deleted_companies, deleted_users
+
+    def run(self):
+        """Создает данные и возвращает сводку"""
+        started = time.monotonic()
+        rng = random.Random(self.seed)
+        # Один хэш на всех пользователей вместо PBKDF2 на каждого
+        password_hash = make_password(self.password)
+
+        # Сколько компаний помещается в одну пачку пользователей
+        companies_per_chunk = max(1, self.chunk_size // self.members)
+
+        totals = {'companies': 0, 'users': 0, 'memberships': 0, 'sections': 0}
+        for first in range(0, self.companies, companies_per_chunk):
+            indexes = range(first, min(first + companies_per_chunk, self.companies))
+            with transaction.atomic():
+                created = self._create_chunk(indexes, rng, password_hash)
+            for key, value in created.items():
+                totals[key] += value
+            self.log(
+                f'  компании {indexes.start + 1}-{indexes.stop} из {self.companies}: '
+                f'{totals["users"]} пользователей'
+            )
+
+        totals['seconds'] = round(time.monotonic() - started, 2)
+        return totals
+
+    def _create_chunk(self, indexes, rng, password_hash):
+        users = []
+        for company_index in indexes:
+            for member_index in range(self.members):
+                first_name = rng.choice(FIRST_NAMES)
+                last_name = rng.choice(LAST_NAMES)
+                username = f'{self.username_prefix}c{company_index}_u{member_index}'
+                users.append(User(
+                    username=username,
+                    email=f'{username}@example.com',
+                    first_name=first_name,
+                    last_name=last_name,
+                    password=password_hash,
+                    date_joined=DATE_JOINED_FROM + datetime.timedelta(
+                        minutes=company_index * self.members + member_index,
+                    ),
+                ))
+        User.objects.bulk_create(users, batch_size=self.chunk_size)
+
+        UserProfile.objects.bulk_create([
+            UserProfile(
+                user=user,
+                phone=f'+7 (9{rng.randrange(10, 99)}) {rng.randrange(100, 999)}-{rng.randrange(10, 99)}-{rng.randrange(10, 99)}',
+                position=rng.choice(POSITIONS),
+                department=rng.choice(DEPARTMENTS),
+                email=user.email,
+            )
+            for user in users
+        ], batch_size=self.chunk_size)
+
+        companies = []
+        memberships = []
+        sections = []
+        statistics = []
+        roles = [role for role, _ in ROLE_WEIGHTS]
+        weights = [weight for _, weight in ROLE_WEIGHTS]
+        for offset, company_index in enumerate(indexes):
+            members = users[offset * self.members:(offset + 1) * self.members]
+            owner = members[0]
+            slug = f'{self.slug_prefix}{company_index}'
+            company = Company(
+                id=uuid.uuid5(COMPANY_ID_NAMESPACE, slug),
+                name=f'Нагрузочная компания {self.seed}-{company_index}',
+                slug=slug,
+                company_type=rng.choice(Company.COMPANY_TYPES)[0],
+                email=f'info@{self.slug_prefix}{company_index}.example.com',
+                city=rng.choice(CITIES),
+                owner=owner,
+            )
+            companies.append(company)
+
+            active_members = 0
+            for member_index, user in enumerate(members):
+                role = 'owner' if member_index == 0 else rng.choices(roles, weights)[0]
+                is_active = member_index == 0 or rng.random() >= INACTIVE_SHARE
+                membership = CompanyMembership(company=company, user=user, role=role, is_active=is_active)
+                membership.apply_role_defaults()
+                memberships.append(membership)
+                active_members += is_active
+
+            for section_index in range(self.sections):
+                required_role = rng.choice(roles)
+                sections.append(CompanyMenuSection(
+                    company=company,
+                    created_by=owner,
+                    title=f'Раздел {section_index + 1}',
+                    url=f'/section-{section_index + 1}/',
+                    icon=rng.choice(CompanyMenuSection.ICON_CHOICES)[0],
+                    order=section_index + 1,
+                    required_role=required_role,
+                    required_level=CompanyMembership.ROLE_LEVELS[required_role],
+                ))
+
+            statistics.append(CompanyStatistics(
+                company=company,
+                members_count=len(members),
+                active_members_count=active_members,
+                menu_sections_count=self.sections,
+                active_menu_sections_count=self.sections,
+            ))
+
+        Company.objects.bulk_create(companies, batch_size=self.chunk_size)
+        CompanySettings.objects.bulk_create(
+            [CompanySettings(company=company) for company in companies], batch_size=self.chunk_size
+        )
+        CompanyStatistics.objects.bulk_create(statistics, batch_size=self.chunk_size)
+        CompanyMembership.objects.bulk_create(memberships, batch_size=self.chunk_size)
+        CompanyMenuSection.objects.bulk_create(sections, batch_size=self.chunk_size)
+
+        # Сигналы не срабатывали - сбрасываем возможные отрицательные записи кэша
+        for company in companies:
+            invalidate_company(company)
+        search.index_users([user.pk for user in users])
+
+        return {
+            'companies': len(companies),
+            'users': len(users),
+            'memberships': len(memberships),
+            'sections': len(sections),
+        }
@@ -0,0 +1,127 @@
+from django.contrib.auth.models import Permission, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from companies.benchmarks import (DEFAULT_BASELINE_PATH, ENDPOINTS, compare, failed, load_baseline,
+                                  run_benchmarks, save_baseline)
+from companies.loadgen import LoadDataGenerator
+from companies.models import Company
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет задержку, число SQL-запросов и размер ответа ключевых страниц '
+        'на сгенерированных данных и сравнивает с базовой линией'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=20, help='Количество компаний')
+        parser.add_argument('--members', type=int, default=500, help='Участников в каждой компании')
+        parser.add_argument('--sections', type=int, default=10, help='Разделов меню в каждой компании')
+        parser.add_argument('--seed', type=int, default=0, help='Seed генератора данных')
+        parser.add_argument('--iterations', type=int, default=20, help='Замеров на эндпоинт')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов на эндпоинт')
+        parser.add_argument(
+            '--endpoint',
+            action='append',
+            dest='endpoints',
+            choices=[name for name, *_ in ENDPOINTS],
+            help='Измерить только указанный эндпоинт (можно указать несколько раз)',
+        )
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE_PATH), help='Файл базовой линии')
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Сохранить результаты как новую базовую линию вместо сравнения',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Допустимый относительный рост задержки и размера ответа',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Не удалять тестовую базу после прогона (повторный запуск без генерации)',
+        )
+
+    def handle(self, *args, **options):
+        parameters = {
+            key: options[key] for key in ('companies', 'members', 'sections', 'seed', 'iterations')
+        }
+
+        # Замеры идут на отдельной тестовой базе, рабочие данные не затрагиваются
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.stdout.write(f'{"эндпоинт":<22}{"статус":>7}{"p50, мс":>10}{"p95, мс":>10}{"SQL":>6}{"байт":>10}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<22}{result["status"]:>7}{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                f'{result["queries"]:>6}{result["bytes"]:>10}'
+            )
+
+        if options['save_baseline']:
+            errors = failed(results)
+            if errors:
+                raise CommandError(
+                    'Базовая линия не сохранена, ответы не 2xx: '
+                    + ', '.join(f'{name} ({status})' for name, status in errors.items())
+                )
+            save_baseline(options['baseline'], results, parameters)
+            self.stdout.write(self.style.SUCCESS(f'Базовая линия сохранена в {options["baseline"]}'))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(
+                f'Базовая линия {options["baseline"]} не найдена, запустите с --save-baseline'
+            ))
+            return
+
+        if baseline['parameters'] != parameters:
+            self.stdout.write(self.style.WARNING(
+                f'Базовая линия снята с другими параметрами: {baseline["parameters"]}'
+            ))
+
+        regressions = compare(results, baseline, tolerance=options['tolerance'])
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(f'  {regression}')
+            raise CommandError(f'Обнаружено регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено'))
+
+    def run(self, options):
+        generator = LoadDataGenerator(
+            companies=options['companies'],
+            members=options['members'],
+            sections=options['sections'],
+            seed=options['seed'],
+            prefix='bench',
+        )
+        company = Company.objects.filter(slug=f'{generator.slug_prefix}0').first()
+        if company is None:
+            self.stdout.write('Генерация данных...')
+            generator.run()
+            company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+
+        # Владелец первой компании с правом просмотра всех пользователей,
+        # чтобы списки пользователей шли по «тяжелой» ветке
+        user = User.objects.get(pk=company.owner_id)
+        user.user_permissions.add(Permission.objects.get(codename='view_user', content_type__app_label='auth'))
+
+        self.stdout.write(f'Замеры: {options["iterations"]} запросов на эндпоинт...')
+        return run_benchmarks(
+            company,
+            user,
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            only=options['endpoints'],
+        )
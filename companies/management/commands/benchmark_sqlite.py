@@ -0,0 +1,91 @@
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from companies.dbbench import OPERATIONS, copy_database, run_mode
+from companies.loadgen import LoadDataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite при чтении и записи из нескольких '
+        'процессов: настройки по умолчанию и режим SQLITE_MODE=production'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Количество процессов')
+        parser.add_argument('--duration', type=float, default=5.0, help='Секунд нагрузки на режим')
+        parser.add_argument('--write-ratio', type=float, default=0.3, help='Доля операций записи')
+        parser.add_argument('--companies', type=int, default=5, help='Количество компаний')
+        parser.add_argument('--members', type=int, default=200, help='Участников в каждой компании')
+        parser.add_argument('--seed', type=int, default=0, help='Seed генератора данных и нагрузки')
+        parser.add_argument(
+            '--mode',
+            action='append',
+            dest='modes',
+            choices=['default', 'production'],
+            help='Измерить только указанный режим (можно указать несколько раз)',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite')
+        modes = {
+            'default': {},
+            'production': settings.SQLITE_PRODUCTION_OPTIONS,
+        }
+        selected = options['modes'] or list(modes)
+
+        with tempfile.TemporaryDirectory(prefix='sqlite-bench-') as directory:
+            directory = Path(directory)
+            # Отдельная файловая тестовая база: воркерам нужна общая база на диске,
+            # in-memory база тестов для этого не подходит
+            setup_test_environment(debug=False)
+            old_name = connection.settings_dict['NAME']
+            old_options = connection.settings_dict['OPTIONS']
+            connection.settings_dict['TEST']['NAME'] = str(directory / 'template.sqlite3')
+            connection.settings_dict['OPTIONS'] = {}
+            try:
+                connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                self.stdout.write('Генерация данных...')
+                LoadDataGenerator(
+                    companies=options['companies'],
+                    members=options['members'],
+                    sections=0,
+                    seed=options['seed'],
+                    prefix='sqlite',
+                ).run()
+                connection.close()
+                template = Path(connection.settings_dict['NAME'])
+
+                results = {}
+                for mode in selected:
+                    db_path = copy_database(template, directory / f'{mode}.sqlite3')
+                    self.stdout.write(f'Режим {mode}: {options["workers"]} процессов, {options["duration"]} с...')
+                    results[mode] = run_mode(
+                        db_path,
+                        modes[mode],
+                        workers=options['workers'],
+                        duration=options['duration'],
+                        write_ratio=options['write_ratio'],
+                        seed=options['seed'],
+                    )
+            finally:
+                connection.settings_dict['OPTIONS'] = old_options
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        self.stdout.write(
+            f'{"режим":<12}{"операция":<12}{"выполнено":>10}{"в сек.":>10}'
+            f'{"locked":>8}{"p50, мс":>10}{"p99, мс":>10}'
+        )
+        for mode, summary in results.items():
+            for operation in (*OPERATIONS, 'total'):
+                row = summary[operation]
+                self.stdout.write(
+                    f'{mode:<12}{operation:<12}{row["ok"]:>10}{row["per_second"]:>10}'
+                    f'{row["locked"]:>8}{row["p50_ms"]:>10}{row["p99_ms"]:>10}'
+                )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from companies.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_filename, export_members
+from companies.models import Company
+
+
+class Command(BaseCommand):
+    help = 'Выгружает участников компании в CSV или XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', metavar='SLUG', help='Slug компании')
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv', help='Формат файла')
+        parser.add_argument('--output', help='Путь к файлу (по умолчанию <slug>-members-<дата>.<формат>)')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Строк в одной пачке')
+
+    def handle(self, *args, **options):
+        company = Company.objects.filter(slug=options['company']).first()
+        if company is None:
+            raise CommandError(f'Компания {options["company"]} не найдена')
+
+        path = options['output'] or export_filename(company, options['format'])
+        size = 0
+        with open(path, 'wb') as output:
+            for chunk in export_members(company, options['format'], options['chunk_size']):
+                output.write(chunk)
+                size += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Выгружено в {path}: {size} байт'))
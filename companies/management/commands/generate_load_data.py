@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from companies.loadgen import LoadDataGenerator
+
+
+class Command(BaseCommand):
+    help = 'Создает большой синтетический набор компаний и пользователей для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=10, help='Количество компаний')
+        parser.add_argument('--members', type=int, default=100, help='Участников в каждой компании (включая владельца)')
+        parser.add_argument('--sections', type=int, default=5, help='Разделов меню в каждой компании')
+        parser.add_argument('--seed', type=int, default=0, help='Seed генератора (одинаковый seed - одинаковые данные)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Размер пачки bulk_create')
+        parser.add_argument('--password', default='pass123', help='Пароль всех создаваемых пользователей')
+        parser.add_argument('--prefix', default='load', help='Префикс логинов и slug-ов')
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить данные, ранее созданные с тем же префиксом и seed',
+        )
+
+    def handle(self, *args, **options):
+        generator = LoadDataGenerator(
+            companies=options['companies'],
+            members=options['members'],
+            sections=options['sections'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            password=options['password'],
+            prefix=options['prefix'],
+            log=self.stdout.write,
+        )
+
+        if options['clear']:
+            companies, users = generator.clear()
+            self.stdout.write(f'Удалено компаний: {companies}, пользователей: {users}')
+
+        self.stdout.write(
+            f'Создание {options["companies"]} компаний по {options["members"]} участников '
+            f'(seed={options["seed"]})...'
+        )
+        totals = generator.run()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: компаний {totals["companies"]}, пользователей {totals["users"]}, '
+            f'членств {totals["memberships"]}, разделов меню {totals["sections"]} '
+            f'за {totals["seconds"]} с'
+        ))
+        self.stdout.write(f'Логины: {generator.username_prefix}c<N>_u<M>, пароль: {options["password"]}')
@@ -0,0 +1,58 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from companies.imports import IMPORT_CHUNK_SIZE, ImportFileError, import_format, import_members
+from companies.models import Company
+
+
+class Command(BaseCommand):
+    help = 'Импортирует участников компании из CSV или XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', metavar='SLUG', help='Slug компании')
+        parser.add_argument('path', help='Файл CSV или XLSX')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что изменится')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Строк в одной пачке')
+        parser.add_argument(
+            '--invites',
+            metavar='PATH',
+            help='Сохранить ссылки-приглашения новых пользователей в CSV',
+        )
+        parser.add_argument(
+            '--base-url',
+            default='',
+            help='Адрес сайта для ссылок-приглашений, например https://purchases.example.com',
+        )
+
+    def handle(self, *args, **options):
+        company = Company.objects.filter(slug=options['company']).first()
+        if company is None:
+            raise CommandError(f'Компания {options["company"]} не найдена')
+        file_format = import_format(options['path'])
+        if file_format is None:
+            raise CommandError('Поддерживаются только файлы .csv и .xlsx')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                report = import_members(
+                    company, file, file_format,
+                    dry_run=options['dry_run'], chunk_size=options['chunk_size'],
+                )
+        except ImportFileError as error:
+            raise CommandError(str(error))
+
+        for error in report.errors:
+            self.stdout.write(f'  строка {error["line"]}: {error["message"]}')
+        summary = ', '.join(f'{status}: {count}' for status, count in report.counts.items())
+        if report.dry_run:
+            self.stdout.write(self.style.WARNING(f'Пробный запуск, изменения не сохранены. {summary}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+        if options['invites'] and report.invites:
+            with open(options['invites'], 'w', newline='', encoding='utf-8') as output:
+                writer = csv.writer(output)
+                writer.writerow(['username', 'email', 'url'])
+                for invite in report.invites:
+                    writer.writerow([invite['username'], invite['email'], options['base_url'] + invite['path']])
+            self.stdout.write(f'Приглашения сохранены в {options["invites"]}: {len(report.invites)}')
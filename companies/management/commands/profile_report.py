@@ -0,0 +1,68 @@
+import fnmatch
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from companies.profiler import CATEGORIES, DUMP_SUFFIX, get_config, hot_functions, read_dump
+
+
+class Command(BaseCommand):
+    help = 'Объединяет сохраненные профили запросов и показывает самые горячие функции'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Каталог профилей (по умолчанию PROFILER["DIR"])')
+        parser.add_argument('--top', type=int, default=20, help='Сколько функций показать')
+        parser.add_argument('--view', help='Только представления по шаблону имени URL (fnmatch)')
+        parser.add_argument('--tenant', help='Только указанная компания (slug)')
+        parser.add_argument('--category', choices=CATEGORIES, help='Только стеки указанной категории')
+        parser.add_argument('--sort', choices=['self', 'total'], default='self', help='Собственные или общие выборки')
+        parser.add_argument('--collapsed', metavar='FILE', help='Сохранить объединенные стеки для flamegraph')
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'] or get_config()['DIR'])
+        paths = sorted(directory.glob(f'*{DUMP_SUFFIX}'))
+        if not paths:
+            raise CommandError(f'В {directory} нет профилей')
+
+        merged = Counter()
+        requests = 0
+        interval_ms = None
+        for path in paths:
+            metadata, stacks = read_dump(path)
+            if options['view'] and not fnmatch.fnmatchcase(metadata.get('view', ''), options['view']):
+                continue
+            if options['tenant'] and metadata.get('tenant') != options['tenant']:
+                continue
+            if options['category']:
+                stacks = {stack: count for stack, count in stacks.items()
+                          if stack.startswith(options['category'] + ';')}
+            merged.update(stacks)
+            requests += 1
+            interval_ms = interval_ms or float(metadata.get('interval_ms', 0)) or None
+
+        if not merged:
+            raise CommandError('Нет профилей, подходящих под фильтры')
+
+        own, total, categories = hot_functions(merged)
+        samples = sum(categories.values())
+        to_ms = (lambda count: f'{count * interval_ms:.0f}') if interval_ms else str
+
+        self.stdout.write(f'Запросов: {requests}, выборок: {samples}')
+        self.stdout.write('По категориям: ' + ', '.join(
+            f'{category} {categories[category] * 100 / samples:.1f}% ({to_ms(categories[category])} мс)'
+            for category in CATEGORIES if categories[category]
+        ))
+
+        ranking = own if options['sort'] == 'self' else total
+        self.stdout.write(f'\n{"собств.":>8}{"общее":>8}{"мс":>9}  функция')
+        for function, count in ranking.most_common(options['top']):
+            self.stdout.write(
+                f'{own[function] * 100 / samples:>7.1f}%{total[function] * 100 / samples:>7.1f}%'
+                f'{to_ms(count):>9}  {function}'
+            )
+
+        if options['collapsed']:
+            with open(options['collapsed'], 'w', encoding='utf-8') as stream:
+                for stack, count in merged.most_common():
+                    stream.write(f'{stack} {count}\n')
+            self.stdout.write(self.style.SUCCESS(f'\nОбъединенные стеки сохранены в {options["collapsed"]}'))
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand
+from companies import querystats
+
+
+SORT_FIELDS = ['queries', 'avg_queries', 'max_queries', 'db_time_ms', 'duplicates', 'requests', 'slowest_ms']
+
+
+class Command(BaseCommand):
+    help = 'Показывает статистику SQL-запросов по представлениям и компаниям (QUERY_STATS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', choices=SORT_FIELDS, default='queries', help='Поле сортировки')
+        parser.add_argument('--limit', type=int, default=20, help='Сколько строк показать')
+        parser.add_argument('--view', help='Только указанное имя URL (например, companies:dashboard)')
+        parser.add_argument('--tenant', help='Только указанная компания (slug)')
+        parser.add_argument('--by-view', action='store_true', help='Суммировать по представлениям без разбивки по компаниям')
+        parser.add_argument('--json', action='store_true', help='Вывести JSON')
+        parser.add_argument('--reset', action='store_true', help='Удалить накопленную статистику')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            querystats.clear()
+            self.stdout.write(self.style.SUCCESS('Статистика очищена'))
+            return
+
+        entries = querystats.collect()
+        if options['view']:
+            entries = [entry for entry in entries if entry['view'] == options['view']]
+        if options['tenant']:
+            entries = [entry for entry in entries if entry['tenant'] == options['tenant']]
+        if options['by_view']:
+            for entry in entries:
+                entry['tenant'] = querystats.OTHER_TENANT
+            entries = querystats.merge([entries])
+        entries.sort(key=lambda entry: entry[options['sort']], reverse=True)
+        entries = entries[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(entries, indent=2, ensure_ascii=False))
+            return
+
+        if not entries:
+            self.stdout.write(self.style.WARNING(
+                f'Статистики нет (QUERY_STATS_ENABLED, каталог {querystats.get_config()["DIR"]})'
+            ))
+            return
+
+        self.stdout.write(
+            f'{"представление":<40}{"компания":<20}{"запр.":>7}{"SQL":>8}{"ср.":>7}'
+            f'{"макс.":>7}{"БД, мс":>10}{"дубл.":>7}{"медл., мс":>11}'
+        )
+        for entry in entries:
+            self.stdout.write(
+                f'{entry["view"][:39]:<40}{entry["tenant"][:19]:<20}{entry["requests"]:>7}'
+                f'{entry["queries"]:>8}{entry["avg_queries"]:>7}{entry["max_queries"]:>7}'
+                f'{entry["db_time_ms"]:>10}{entry["duplicates"]:>7}{entry["slowest_ms"]:>11}'
+            )
+        slowest = max(entries, key=lambda entry: entry['slowest_ms'])
+        if slowest['slowest_sql']:
+            self.stdout.write(f'\nСамый медленный запрос ({slowest["view"]}, {slowest["slowest_ms"]} мс):')
+            self.stdout.write(slowest['slowest_sql'])
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from companies.models import Company
+from companies.statistics import reconcile_statistics
+
+
+class Command(BaseCommand):
+    help = 'Сверяет материализованные счетчики компаний с фактическими данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company',
+            action='append',
+            dest='companies',
+            metavar='SLUG',
+            help='Проверить только указанную компанию (можно указать несколько раз)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['companies']:
+            companies = companies.filter(slug__in=options['companies'])
+
+        drift = reconcile_statistics(companies, dry_run=options['dry_run'])
+
+        for company_id, field, stored, actual in drift:
+            self.stdout.write(f'  {company_id}: {field} {stored} -> {actual}')
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Найдено расхождений: {len(drift)} (не исправлены)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено расхождений: {len(drift)}'))
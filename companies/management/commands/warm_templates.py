@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from companies.warmup import is_cached, warm_templates
+
+
+class Command(BaseCommand):
+    help = (
+        'Компилирует все шаблоны проекта: проверяет их и показывает время разбора. '
+        'Сам прогрев выполняется в воркере при запуске (WARM_TEMPLATES)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='include_third_party',
+            help='Включить шаблоны сторонних приложений (admin, rest_framework и т.д.)',
+        )
+        parser.add_argument('--slowest', type=int, default=5, help='Показать N самых медленных шаблонов')
+
+    def handle(self, *args, **options):
+        if not is_cached():
+            self.stdout.write(self.style.WARNING(
+                'Кэширующий загрузчик не используется: шаблоны разбираются заново при каждом запросе'
+            ))
+
+        results = warm_templates(include_third_party=options['include_third_party'])
+        failed = [(name, error) for name, _, error in results if error]
+        total_ms = sum(seconds for _, seconds, _ in results) * 1000
+
+        if options['verbosity'] > 1:
+            for name, seconds, error in results:
+                self.stdout.write(f'  {seconds * 1000:8.2f} мс  {name}{"  " + error if error else ""}')
+        elif options['slowest']:
+            for name, seconds, _ in sorted(results, key=lambda result: -result[1])[:options['slowest']]:
+                self.stdout.write(f'  {seconds * 1000:8.2f} мс  {name}')
+
+        for name, error in failed:
+            self.stderr.write(f'  {name}: {error}')
+        if failed:
+            raise CommandError(f'Шаблонов с ошибками: {len(failed)} из {len(results)}')
+        self.stdout.write(self.style.SUCCESS(f'Скомпилировано шаблонов: {len(results)} за {total_ms:.1f} мс'))
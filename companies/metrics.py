@@ -0,0 +1,269 @@
+"""
+Метрики в текстовом формате Prometheus.
+
+MetricsMiddleware (настройка METRICS['ENABLED']) записывает в счетчики и
+гистограммы процесса время запросов по имени URL и статусу, число и время
+SQL-запросов, записи сессий; шаблоны измеряет InstrumentedDjangoTemplates,
+обращения к кэшу тенанта - companies.cache. Несколько воркеров объединяются
+через файлы: каждый процесс раз в FLUSH_INTERVAL секунд сохраняет снимок в
+DIR/<pid>-<время запуска>.json, а эндпоинт /ops/metrics/ суммирует снимки
+всех процессов (как multiprocess-режим prometheus_client; каталог следует
+очищать при развертывании).
+
+Метрики по компаниям ограничены дважды. При записи процесс заводит серии
+не больше чем для MAX_TENANTS компаний (первых встреченных), запросы
+остальных сразу учитываются под меткой tenant="other" - так память процесса
+и размер снимков не растут с числом компаний. При выводе остаются
+TOP_TENANTS самых активных компаний из суммы снимков, остальные также
+сворачиваются в "other".
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'DIR': Path(settings.BASE_DIR) / 'logs' / 'metrics',
+    'FLUSH_INTERVAL': 5.0,
+    'TOP_TENANTS': 20,
+    'MAX_TENANTS': 100,
+    'TOKEN': '',
+}
+
+PREFIX = 'purchases_'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# имя: (тип, описание, границы корзин гистограммы)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Время обработки запроса', DURATION_BUCKETS),
+    'db_queries_per_request': ('histogram', 'Число SQL-запросов на HTTP-запрос', QUERY_COUNT_BUCKETS),
+    'db_query_duration_seconds_total': ('counter', 'Суммарное время SQL-запросов', None),
+    'template_render_duration_seconds': ('histogram', 'Время отрисовки шаблона', DURATION_BUCKETS),
+    'session_writes_total': ('counter', 'Запросы, сохранившие сессию', None),
+    'cache_lookups_total': ('counter', 'Обращения к кэшу тенанта', None),
+    'cache_hit_ratio': ('gauge', 'Доля попаданий в кэш тенанта', None),
+    'tenant_requests_total': ('counter', 'Запросы по компаниям', None),
+    'tenant_request_duration_seconds_total': ('counter', 'Время запросов по компаниям', None),
+    'tenant_db_queries_total': ('counter', 'SQL-запросы по компаниям', None),
+}
+
+TENANT_METRICS = [name for name in METRICS if name.startswith('tenant_')]
+
+NO_TENANT = 'none'
+OTHER_TENANT = 'other'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+def is_enabled():
+    return getattr(settings, 'METRICS', {}).get('ENABLED', False)
+
+
+class Registry:
+    """Счетчики и гистограммы процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.tenants = set()
+        self._flushed_at = time.monotonic()
+        self.filename = f'{os.getpid()}-{time.time_ns()}.json'
+
+    def tenant_label(self, tenant, limit):
+        """Метка компании или "other", если серии уже заведены для limit компаний"""
+        if tenant in self.tenants or tenant in (NO_TENANT, OTHER_TENANT):
+            return tenant
+        with self._lock:
+            if len(self.tenants) < limit:
+                self.tenants.add(tenant)
+                return tenant
+        return OTHER_TENANT
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.tenants.clear()
+
+    def flush(self, directory=None):
+        """Сохраняет снимок процесса в каталог метрик"""
+        directory = Path(directory or get_config()['DIR'])
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / self.filename
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self.snapshot(), ensure_ascii=False), encoding='utf-8')
+        os.replace(temporary, path)
+        self._flushed_at = time.monotonic()
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= get_config()['FLUSH_INTERVAL']:
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('Не удалось сохранить метрики процесса')
+
+
+registry = Registry()
+
+
+def observe_request(view_name, status, tenant, duration, recorder, session_written):
+    """Записывает метрики одного HTTP-запроса"""
+    labels = {'view': view_name, 'status': str(status)}
+    registry.observe('http_request_duration_seconds', duration, labels)
+    registry.observe('db_queries_per_request', recorder.count, {'view': view_name})
+    registry.inc('db_query_duration_seconds_total', {'view': view_name}, recorder.duration_ms / 1000)
+    if session_written:
+        registry.inc('session_writes_total', {'view': view_name})
+
+    tenant_labels = {'tenant': registry.tenant_label(tenant or NO_TENANT, get_config()['MAX_TENANTS'])}
+    registry.inc('tenant_requests_total', tenant_labels)
+    registry.inc('tenant_request_duration_seconds_total', tenant_labels, duration)
+    registry.inc('tenant_db_queries_total', tenant_labels, recorder.count)
+
+
+def observe_template(template_name, duration):
+    if is_enabled():
+        registry.observe('template_render_duration_seconds', duration, {'template': template_name or '<string>'})
+
+
+def record_cache_lookup(namespace, hit):
+    if is_enabled():
+        registry.inc('cache_lookups_total', {'namespace': namespace, 'result': 'hit' if hit else 'miss'})
+
+
+def merge(snapshots):
+    """Суммирует снимки процессов: возвращает (counters, histograms)"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            current = histograms.get(key)
+            histograms[key] = values if current is None else [a + b for a, b in zip(current, values)]
+    return counters, histograms
+
+
+def bound_tenants(counters, top):
+    """Оставляет метки top самых активных компаний, остальные сворачивает в other"""
+    requests = {
+        dict(labels)['tenant']: value
+        for (name, labels), value in counters.items() if name == 'tenant_requests_total'
+    }
+    kept = set(sorted(requests, key=requests.get, reverse=True)[:top])
+    bounded = {}
+    for (name, labels), value in counters.items():
+        if name in TENANT_METRICS and dict(labels)['tenant'] not in kept:
+            labels = (('tenant', OTHER_TENANT),)
+        bounded[(name, labels)] = bounded.get((name, labels), 0) + value
+    return bounded
+
+
+def _hit_ratios(counters):
+    lookups = {}
+    for (name, labels), value in counters.items():
+        if name == 'cache_lookups_total':
+            labels = dict(labels)
+            hits, total = lookups.get(labels['namespace'], (0, 0))
+            lookups[labels['namespace']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+    return {
+        ('cache_hit_ratio', (('namespace', namespace),)): hits / total
+        for namespace, (hits, total) in lookups.items() if total
+    }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def render(snapshots, top_tenants=None):
+    """Формирует текст в формате Prometheus из снимков процессов"""
+    if top_tenants is None:
+        top_tenants = get_config()['TOP_TENANTS']
+    counters, histograms = merge(snapshots)
+    counters = bound_tenants(counters, top_tenants)
+    gauges = _hit_ratios(counters)
+
+    series = {}
+    for (name, labels), value in sorted({**counters, **gauges}.items()):
+        series.setdefault(name, []).append(f'{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}')
+    for (name, labels), values in sorted(histograms.items()):
+        lines = series.setdefault(name, [])
+        for bound, count in zip(METRICS[name][2], values):
+            lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels + (("le", bound),))} {count}')
+        lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {values[-1]}')
+        lines.append(f'{PREFIX}{name}_sum{_format_labels(labels)} {_format_value(values[-2])}')
+        lines.append(f'{PREFIX}{name}_count{_format_labels(labels)} {values[-1]}')
+
+    output = []
+    for name, (kind, description, _) in METRICS.items():
+        if name in series:
+            output.append(f'# HELP {PREFIX}{name} {description}')
+            output.append(f'# TYPE {PREFIX}{name} {kind}')
+            output.extend(series[name])
+    return '\n'.join(output) + '\n'
+
+
+def collect(directory=None):
+    """Возвращает снимки всех процессов (текущий процесс сохраняется заново)"""
+    directory = Path(directory or get_config()['DIR'])
+    registry.flush(directory)
+    snapshots = []
+    for path in sorted(directory.glob('*.json')):
+        try:
+            snapshots.append(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue
+    return snapshots
@@ -1,7 +1,19 @@
+import logging
+import time
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils.deprecation import MiddlewareMixin
-from .models import Company, CompanyMembership
+from .cache import get_active_company, get_active_membership, get_user_company_slugs
+from .metrics import is_enabled as metrics_enabled, observe_request, registry as metrics_registry
+from .profiler import RequestProfile, get_config as get_profiler_config, sampler, should_profile
+from .querystats import NO_TENANT, QueryRecorder, get_config as get_query_stats_config, query_stats
+from .session import remember_company
+
+
+logger = logging.getLogger(__name__)
 
 
 class CompanyMiddleware(MiddlewareMixin):
@@ -15,6 +27,7 @@ class CompanyMiddleware(MiddlewareMixin):
             '/static/',
             '/media/',
             '/__debug__/',
+            '/ops/',
             '/favicon.ico',
         ]
         
@@ -49,51 +62,36 @@ class CompanyMiddleware(MiddlewareMixin):
             company_slug = path_parts[1]
             # Проверяем, что это не служебные URL-ы
             if company_slug not in ['register']:
-                try:
-                    current_company = Company.objects.get(slug=company_slug, is_active=True)
-                except Company.DoesNotExist:
-                    pass
+                current_company = get_active_company(company_slug)
         
         # Если компания не найдена в URL, проверяем сессию
         if not current_company:
             try:
                 if 'current_company_slug' in request.session:
-                    current_company = Company.objects.get(
-                        slug=request.session['current_company_slug'], 
-                        is_active=True
-                    )
-            except (Company.DoesNotExist, KeyError):
-                # Очищаем неактуальную информацию из сессии
-                try:
-                    request.session.pop('current_company_slug', None)
-                    request.session.pop('current_company_id', None)
-                except:
-                    # Игнорируем ошибки сессии
-                    pass
+                    current_company = get_active_company(request.session['current_company_slug'])
+                    if not current_company:
+                        # Очищаем неактуальную информацию из сессии
+                        request.session.pop('current_company_slug', None)
+                        request.session.pop('current_company_id', None)
             except:
                 # Игнорируем любые другие ошибки с сессией
                 pass
         
         # Если у пользователя есть доступ к компании, сохраняем её в request
         if current_company:
-            try:
-                membership = CompanyMembership.objects.get(
-                    company=current_company, 
-                    user=request.user, 
-                    is_active=True
-                )
+            membership = get_active_membership(current_company, request.user)
+            if membership:
                 request.current_company = current_company
                 request.current_membership = membership
                 
                 # Обновляем сессию только если она не заблокирована
+                # (запись происходит только при смене компании)
                 try:
-                    request.session['current_company_id'] = str(current_company.id)
-                    request.session['current_company_slug'] = current_company.slug
+                    remember_company(request.session, current_company)
                 except:
                     # Игнорируем ошибки сессии (может быть во время аутентификации)
                     pass
-                
-            except CompanyMembership.DoesNotExist:
+            else:
                 # У пользователя нет доступа к этой компании
                 if request.path.startswith(f'/companies/{current_company.slug}/'):
                     return redirect('companies:unified_login')
@@ -101,16 +99,11 @@ class CompanyMiddleware(MiddlewareMixin):
         # Если пользователь авторизован, но не выбрал компанию
         if not hasattr(request, 'current_company'):
             # Проверяем, есть ли у пользователя доступ к каким-либо компаниям
-            user_companies = CompanyMembership.objects.filter(
-                user=request.user, 
-                is_active=True
-            ).select_related('company')
+            user_company_slugs = get_user_company_slugs(request.user)
             
-            if user_companies.exists():
-                # Если у пользователя есть доступ только к одной компании, перенаправляем туда
-                if user_companies.count() == 1:
-                    company = user_companies.first().company
-                    return redirect('companies:dashboard', company_slug=company.slug)
+            # Если у пользователя есть доступ только к одной компании, перенаправляем туда
+            if len(user_company_slugs) == 1:
+                return redirect('companies:dashboard', company_slug=user_company_slugs[0])
             
             # Перенаправляем на единую форму входа
             if not request.path.startswith('/companies/'):
@@ -141,3 +134,100 @@ class CompanyContextMiddleware(MiddlewareMixin):
             })
         
         return response
+
+
+class QueryStatsMiddleware:
+    """
+    Считает SQL-запросы каждого запроса по имени URL и компании
+    (включается настройкой QUERY_STATS['ENABLED']). Должен стоять перед
+    CompanyMiddleware, чтобы учитывались и запросы самих middleware.
+    """
+    
+    def __init__(self, get_response):
+        if not get_query_stats_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        company = getattr(request, 'current_company', None)
+        query_stats.record(view_name, company.slug if company else NO_TENANT, recorder)
+        query_stats.maybe_flush()
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Записывает метрики Prometheus по каждому запросу (настройка METRICS).
+    Стоит перед CompanyMiddleware, чтобы учитывались и его SQL-запросы.
+    """
+    
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        
+        match = request.resolver_match
+        company = getattr(request, 'current_company', None)
+        session = getattr(request, 'session', None)
+        observe_request(
+            match.view_name if match else 'unresolved',
+            response.status_code,
+            company.slug if company else None,
+            duration,
+            recorder,
+            session_written=session is not None and session.modified,
+        )
+        metrics_registry.maybe_flush()
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Семплирующий профилировщик выбранных запросов (настройка PROFILER).
+    Должен стоять после CompanyMiddleware: выбор зависит от компании запроса.
+    """
+    
+    def __init__(self, get_response):
+        if not get_profiler_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            profile = sampler.stop()
+            if profile is not None:
+                self.finish(profile)
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = get_profiler_config()
+        company = getattr(request, 'current_company', None)
+        tenant = company.slug if company else NO_TENANT
+        view_name = request.resolver_match.view_name
+        if should_profile(config, view_name, tenant):
+            sampler.start(RequestProfile(view_name, tenant, config['MAX_DEPTH']), config['INTERVAL'])
+        return None
+    
+    def finish(self, profile):
+        config = get_profiler_config()
+        duration_ms = (time.perf_counter() - profile.started) * 1000
+        if duration_ms < config['SLOW_MS'] or not profile.samples:
+            return
+        try:
+            profile.dump(config['DIR'], duration_ms, config['INTERVAL'], config['MAX_FILES'])
+        except OSError:
+            logger.exception('Не удалось сохранить профиль запроса')
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.5 on 2025-09-28 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+ROLE_LEVELS = {
+    'viewer': 1,
+    'employee': 2,
+    'manager': 3,
+    'admin': 4,
+    'owner': 5,
+}
+
+PERMISSION_FIELDS = [
+    ('can_manage_users', 1 << 0),
+    ('can_manage_orders', 1 << 1),
+    ('can_manage_products', 1 << 2),
+    ('can_manage_suppliers', 1 << 3),
+    ('can_view_reports', 1 << 4),
+]
+
+
+def _role_level(field_name):
+    return Case(
+        *[When(**{field_name: role}, then=Value(level)) for role, level in ROLE_LEVELS.items()],
+        default=Value(0),
+    )
+
+
+def backfill_levels(apps, schema_editor):
+    """Заполняет уровень роли и маску прав существующих записей одним UPDATE на таблицу"""
+    CompanyMembership = apps.get_model('companies', 'CompanyMembership')
+    CompanyMenuSection = apps.get_model('companies', 'CompanyMenuSection')
+    
+    permissions = sum(
+        Case(When(**{field: True}, then=Value(bit)), default=Value(0))
+        for field, bit in PERMISSION_FIELDS
+    )
+    CompanyMembership.objects.update(role_level=_role_level('role'), permissions=permissions)
+    CompanyMenuSection.objects.update(required_level=_role_level('required_role'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0002_companymenusection'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companymembership',
+            name='permissions',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Маска прав'),
+        ),
+        migrations.AddField(
+            model_name='companymembership',
+            name='role_level',
+            field=models.PositiveSmallIntegerField(default=2, editable=False, verbose_name='Уровень роли'),
+        ),
+        migrations.AddField(
+            model_name='companymenusection',
+            name='required_level',
+            field=models.PositiveSmallIntegerField(default=2, editable=False, verbose_name='Минимальный уровень роли'),
+        ),
+        migrations.RunPython(backfill_levels, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='companymembership',
+            index=models.Index(fields=['company', 'is_active', 'role_level', 'permissions'], name='companies_membership_level'),
+        ),
+        migrations.AddIndex(
+            model_name='companymenusection',
+            index=models.Index(fields=['company', 'is_active', 'required_level'], name='companies_menu_level'),
+        ),
+    ]
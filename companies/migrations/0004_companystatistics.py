@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2025-09-28 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def create_statistics(apps, schema_editor):
+    """Заполняет счетчики существующих компаний"""
+    Company = apps.get_model('companies', 'Company')
+    CompanyStatistics = apps.get_model('companies', 'CompanyStatistics')
+    
+    members = Company.objects.annotate(
+        total=Count('memberships', distinct=True),
+        active=Count('memberships', filter=Q(memberships__is_active=True), distinct=True),
+    ).values_list('pk', 'total', 'active')
+    sections = dict(
+        (pk, (total, active)) for pk, total, active in Company.objects.annotate(
+            total=Count('menu_sections', distinct=True),
+            active=Count('menu_sections', filter=Q(menu_sections__is_active=True), distinct=True),
+        ).values_list('pk', 'total', 'active')
+    )
+    CompanyStatistics.objects.bulk_create([
+        CompanyStatistics(
+            company_id=pk,
+            members_count=total,
+            active_members_count=active,
+            menu_sections_count=sections[pk][0],
+            active_menu_sections_count=sections[pk][1],
+        )
+        for pk, total, active in members
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0003_membership_role_level_permissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyStatistics',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='companies.company')),
+                ('members_count', models.PositiveIntegerField(default=0, verbose_name='Всего участников')),
+                ('active_members_count', models.PositiveIntegerField(default=0, verbose_name='Активных участников')),
+                ('menu_sections_count', models.PositiveIntegerField(default=0, verbose_name='Разделов меню')),
+                ('active_menu_sections_count', models.PositiveIntegerField(default=0, verbose_name='Активных разделов меню')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Статистика компании',
+                'verbose_name_plural': 'Статистика компаний',
+            },
+        ),
+        migrations.RunPython(create_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2025-09-28 12:00
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0004_companystatistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, verbose_name='Время события')),
+                ('event', models.CharField(db_index=True, max_length=100, verbose_name='Событие')),
+                ('level', models.PositiveSmallIntegerField(verbose_name='Уровень')),
+                ('company_id', models.UUIDField(blank=True, db_index=True, null=True, verbose_name='ID компании')),
+                ('user_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID пользователя')),
+                ('data', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Данные')),
+            ],
+            options={
+                'verbose_name': 'Событие компании',
+                'verbose_name_plural': 'События компаний',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
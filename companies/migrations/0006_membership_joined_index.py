@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2025-09-28 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0005_companyevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='companymembership',
+            index=models.Index(fields=['company', 'joined_at'], name='companies_membership_joined'),
+        ),
+    ]
@@ -1,10 +1,14 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
-from django.utils.text import slugify
+from django.core.serializers.json import DjangoJSONEncoder
 from django.urls import reverse
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 import uuid
+from functools import partial
+
+from .events import log_event
+from .slugs import SLUG_ALLOCATION_ATTEMPTS, allocate_company_slug, is_generated_slug
 
 
 class Company(models.Model):
@@ -57,20 +61,46 @@ class Company(models.Model):
         return self.name
     
     def save(self, *args, **kwargs):
+        # Явно заданный slug и обновление существующей компании сохраняем как есть
+        if not self._state.adding or (self.slug and not is_generated_slug(self.slug, self.name)):
+            return super().save(*args, **kwargs)
+        
         if not self.slug:
-            base_slug = slugify(self.name, allow_unicode=True)
-            slug = base_slug
-            counter = 1
-            while Company.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+            self.slug = allocate_company_slug(self.name)
+        
+        # Параллельная регистрация могла занять тот же slug - выделяем следующий
+        for attempt in range(SLUG_ALLOCATION_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if (attempt == SLUG_ALLOCATION_ATTEMPTS - 1 or
+                        not Company.objects.filter(slug=self.slug).exists()):
+                    raise
+                self.slug = allocate_company_slug(self.name)
     
     def get_absolute_url(self):
         return reverse('companies:dashboard', kwargs={'company_slug': self.slug})
 
 
+class CompanyMembershipQuerySet(models.QuerySet):
+    """Запросы к членствам с проверкой уровня роли и прав на стороне SQL"""
+    
+    def active(self):
+        return self.filter(is_active=True)
+    
+    def with_role_at_least(self, role):
+        """Членства с ролью не ниже role (имя роли или числовой уровень)"""
+        level = CompanyMembership.ROLE_LEVELS[role] if isinstance(role, str) else role
+        return self.filter(role_level__gte=level)
+    
+    def with_permission(self, permission):
+        """Членства, у которых установлены все биты permission"""
+        return self.alias(
+            granted_permissions=models.F('permissions').bitand(permission)
+        ).filter(granted_permissions=permission)
+
+
 class CompanyMembership(models.Model):
     """Модель членства пользователя в компании"""
     
@@ -82,6 +112,39 @@ class CompanyMembership(models.Model):
         ('viewer', 'Наблюдатель'),
     ]
     
+    # Иерархия ролей: чем больше число, тем шире права
+    ROLE_LEVELS = {
+        'viewer': 1,
+        'employee': 2,
+        'manager': 3,
+        'admin': 4,
+        'owner': 5,
+    }
+    
+    # Биты маски прав доступа
+    PERM_MANAGE_USERS = 1 << 0
+    PERM_MANAGE_ORDERS = 1 << 1
+    PERM_MANAGE_PRODUCTS = 1 << 2
+    PERM_MANAGE_SUPPLIERS = 1 << 3
+    PERM_VIEW_REPORTS = 1 << 4
+    
+    PERMISSION_FIELDS = {
+        'can_manage_users': PERM_MANAGE_USERS,
+        'can_manage_orders': PERM_MANAGE_ORDERS,
+        'can_manage_products': PERM_MANAGE_PRODUCTS,
+        'can_manage_suppliers': PERM_MANAGE_SUPPLIERS,
+        'can_view_reports': PERM_VIEW_REPORTS,
+    }
+    
+    # Права, которые роль получает автоматически
+    ROLE_PERMISSIONS = {
+        'owner': PERM_MANAGE_USERS | PERM_MANAGE_ORDERS | PERM_MANAGE_PRODUCTS | PERM_MANAGE_SUPPLIERS | PERM_VIEW_REPORTS,
+        'admin': PERM_MANAGE_USERS | PERM_MANAGE_ORDERS | PERM_MANAGE_PRODUCTS | PERM_MANAGE_SUPPLIERS | PERM_VIEW_REPORTS,
+        'manager': PERM_MANAGE_ORDERS | PERM_MANAGE_PRODUCTS | PERM_VIEW_REPORTS,
+        'employee': PERM_MANAGE_ORDERS,
+        'viewer': 0,
+    }
+    
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='memberships')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='company_memberships')
     role = models.CharField(max_length=20, choices=ROLES, default='employee', verbose_name="Роль")
@@ -93,45 +156,66 @@ class CompanyMembership(models.Model):
     can_manage_suppliers = models.BooleanField(default=False, verbose_name="Может управлять поставщиками")
     can_view_reports = models.BooleanField(default=False, verbose_name="Может просматривать отчеты")
     
+    # Компактное представление роли и прав для проверок одним сравнением
+    role_level = models.PositiveSmallIntegerField(default=2, editable=False, verbose_name="Уровень роли")
+    permissions = models.PositiveIntegerField(default=0, editable=False, verbose_name="Маска прав")
+    
     is_active = models.BooleanField(default=True, verbose_name="Активное членство")
     joined_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата присоединения")
     
+    objects = CompanyMembershipQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Членство в компании"
         verbose_name_plural = "Членства в компаниях"
         unique_together = ['company', 'user']
+        indexes = [
+            models.Index(
+                fields=['company', 'is_active', 'role_level', 'permissions'],
+                name='companies_membership_level'
+            ),
+            # Keyset-пагинация списка участников по дате присоединения
+            models.Index(fields=['company', 'joined_at'], name='companies_membership_joined'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.company.name} ({self.get_role_display()})"
     
     def save(self, *args, **kwargs):
-        # Автоматически назначаем права в зависимости от роли
-        if self.role in ['owner', 'admin']:
-            self.can_manage_users = True
-            self.can_manage_orders = True
-            self.can_manage_products = True
-            self.can_manage_suppliers = True
-            self.can_view_reports = True
-        elif self.role == 'manager':
-            self.can_manage_orders = True
-            self.can_manage_products = True
-            self.can_view_reports = True
-        elif self.role == 'employee':
-            self.can_manage_orders = True
-        
+        self.apply_role_defaults()
         super().save(*args, **kwargs)
     
+    def apply_role_defaults(self):
+        """
+        Автоматически назначает права в зависимости от роли и пересчитывает
+        уровень роли и маску прав. Вызывается из save(); при bulk_create
+        и bulk_update нужно вызывать вручную.
+        """
+        role_permissions = self.ROLE_PERMISSIONS.get(self.role, 0)
+        permissions = 0
+        for field, bit in self.PERMISSION_FIELDS.items():
+            if role_permissions & bit:
+                setattr(self, field, True)
+            if getattr(self, field):
+                permissions |= bit
+        self.permissions = permissions
+        self.role_level = self.ROLE_LEVELS.get(self.role, 0)
+    
+    def has_permission(self, permission):
+        """Проверяет, установлены ли все биты permission"""
+        return self.permissions & permission == permission
+    
     def has_full_admin_rights(self):
         """Проверяет, имеет ли пользователь полные административные права в компании"""
-        return self.role in ['owner', 'admin'] and self.is_active
+        return self.is_active and self.role_level >= self.ROLE_LEVELS['admin']
     
     def can_manage_company_settings(self):
         """Может ли пользователь управлять настройками компании"""
-        return self.role == 'owner' and self.is_active
+        return self.is_active and self.role_level >= self.ROLE_LEVELS['owner']
     
     def can_invite_users(self):
         """Может ли пользователь приглашать новых пользователей"""
-        return self.role in ['owner', 'admin'] and self.can_manage_users and self.is_active
+        return self.has_full_admin_rights() and self.has_permission(self.PERM_MANAGE_USERS)
 
 
 class CompanySettings(models.Model):
@@ -159,6 +243,30 @@ class CompanySettings(models.Model):
         return f"Настройки {self.company.name}"
 
 
+class CompanyStatistics(models.Model):
+    """
+    Материализованные счетчики компании для дашборда.
+    Обновляются F-выражениями из сигналов (companies.statistics),
+    расхождения исправляет команда reconcile_company_stats.
+    """
+    
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    
+    members_count = models.PositiveIntegerField(default=0, verbose_name="Всего участников")
+    active_members_count = models.PositiveIntegerField(default=0, verbose_name="Активных участников")
+    menu_sections_count = models.PositiveIntegerField(default=0, verbose_name="Разделов меню")
+    active_menu_sections_count = models.PositiveIntegerField(default=0, verbose_name="Активных разделов меню")
+    
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+    
+    class Meta:
+        verbose_name = "Статистика компании"
+        verbose_name_plural = "Статистика компаний"
+    
+    def __str__(self):
+        return f"Статистика {self.company.name}"
+
+
 @receiver(post_save, sender=Company)
 def create_company_defaults(sender, instance, created, **kwargs):
     """
@@ -168,6 +276,9 @@ def create_company_defaults(sender, instance, created, **kwargs):
         # Создаем настройки компании
         CompanySettings.objects.get_or_create(company=instance)
         
+        # Строка счетчиков должна существовать до создания членства владельца
+        CompanyStatistics.objects.get_or_create(company=instance)
+        
         # Создаем членство владельца если его еще нет
         # (это может быть полезно если компания создается программно)
         membership, membership_created = CompanyMembership.objects.get_or_create(
@@ -179,8 +290,15 @@ def create_company_defaults(sender, instance, created, **kwargs):
             }
         )
         
-        if membership_created:
-            print(f"✅ Создан владелец компании: {instance.owner.username} для {instance.name}")
+        # Только после фиксации: откаченное создание (например, повтор с
+        # другим slug в точке сохранения) не должно попадать в журнал
+        transaction.on_commit(partial(
+            log_event,
+            'company.created',
+            company_id=instance.pk,
+            user_id=instance.owner_id,
+            owner_membership_created=membership_created,
+        ))
 
 
 @receiver(post_save, sender=CompanyMembership)
@@ -189,28 +307,40 @@ def log_membership_creation(sender, instance, created, **kwargs):
     Логирует создание нового членства в компании
     """
     if created:
-        role_display = instance.get_role_display()
-        print(f"✅ Новый пользователь добавлен в компанию: {instance.user.username} ({role_display}) -> {instance.company.name}")
-        
-        # Автоматически устанавливаем расширенные права для админов
-        if instance.role in ['owner', 'admin']:
-            print(f"🔐 Назначены полные административные права для {instance.user.username}")
-            
-        # Логируем специфические права
-        permissions = []
-        if instance.can_manage_users:
-            permissions.append("управление пользователями")
-        if instance.can_manage_orders:
-            permissions.append("управление заказами")
-        if instance.can_manage_products:
-            permissions.append("управление товарами")
-        if instance.can_manage_suppliers:
-            permissions.append("управление поставщиками")
-        if instance.can_view_reports:
-            permissions.append("просмотр отчетов")
-            
-        if permissions:
-            print(f"📋 Права доступа: {', '.join(permissions)}")
+        # Событие уходит в буферизованный журнал после фиксации транзакции:
+        # права передаются маской, строки и связанные объекты на пути
+        # сохранения не формируются
+        transaction.on_commit(partial(
+            log_event,
+            'membership.created',
+            company_id=instance.company_id,
+            user_id=instance.user_id,
+            role=instance.role,
+            permissions=instance.permissions,
+        ))
+
+
+class CompanyEvent(models.Model):
+    """
+    Запись журнала событий (только добавление).
+    Пишется пачками фоновым потоком companies.events, поэтому не имеет
+    внешних ключей: события переживают удаление компании или пользователя.
+    """
+    
+    created_at = models.DateTimeField(db_index=True, verbose_name="Время события")
+    event = models.CharField(max_length=100, db_index=True, verbose_name="Событие")
+    level = models.PositiveSmallIntegerField(verbose_name="Уровень")
+    company_id = models.UUIDField(null=True, blank=True, db_index=True, verbose_name="ID компании")
+    user_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID пользователя")
+    data = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder, verbose_name="Данные")
+    
+    class Meta:
+        verbose_name = "Событие компании"
+        verbose_name_plural = "События компаний"
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M:%S} {self.event}"
 
 
 class CompanyMenuSection(models.Model):
@@ -269,6 +399,7 @@ class CompanyMenuSection(models.Model):
         default='employee',
         verbose_name="Минимальная роль для доступа"
     )
+    required_level = models.PositiveSmallIntegerField(default=2, editable=False, verbose_name="Минимальный уровень роли")
     
     # Временные метки
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
@@ -279,10 +410,20 @@ class CompanyMenuSection(models.Model):
         verbose_name_plural = "Разделы меню компании"
         ordering = ['order', 'title']
         unique_together = ['company', 'title']
+        indexes = [
+            models.Index(
+                fields=['company', 'is_active', 'required_level'],
+                name='companies_menu_level'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.company.name} - {self.title}"
     
+    def save(self, *args, **kwargs):
+        self.required_level = CompanyMembership.ROLE_LEVELS.get(self.required_role, 0)
+        super().save(*args, **kwargs)
+    
     def get_full_url(self):
         """Возвращает полный URL для раздела"""
         if self.section_type == 'external':
@@ -297,6 +438,10 @@ class CompanyMenuSection(models.Model):
             return f"/companies/{self.company.slug}/iframe/{self.id}/"
         return self.url
     
+    def level_can_access(self, role_level):
+        """Проверяет, достаточно ли уровня роли для доступа к этому разделу"""
+        return role_level >= self.required_level
+    
     def user_can_access(self, user):
         """Проверяет, может ли пользователь получить доступ к этому разделу"""
         try:
@@ -305,20 +450,7 @@ class CompanyMenuSection(models.Model):
                 user=user, 
                 is_active=True
             )
-            
-            # Определяем иерархию ролей
-            role_hierarchy = {
-                'viewer': 1,
-                'employee': 2, 
-                'manager': 3,
-                'admin': 4,
-                'owner': 5
-            }
-            
-            user_level = role_hierarchy.get(membership.role, 0)
-            required_level = role_hierarchy.get(self.required_role, 0)
-            
-            return user_level >= required_level
+            return self.level_can_access(membership.role_level)
             
         except CompanyMembership.DoesNotExist:
             return False
@@ -0,0 +1,12 @@
+from django.urls import path
+from . import ops_views
+
+app_name = 'ops'
+
+urlpatterns = [
+    # Статистика SQL-запросов по представлениям
+    path('query-stats/', ops_views.query_stats_view, name='query_stats'),
+    
+    # Метрики в формате Prometheus
+    path('metrics/', ops_views.metrics_view, name='metrics'),
+]
@@ -0,0 +1,47 @@
+"""
+Служебные представления для сотрудников: статистика производительности.
+"""
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils.crypto import constant_time_compare
+
+from . import metrics, querystats
+
+
+@staff_member_required
+def query_stats_view(request):
+    """Статистика SQL-запросов всех процессов в JSON"""
+    # Сначала сохраняем свежий снимок текущего процесса
+    if querystats.query_stats.entries:
+        querystats.query_stats.flush()
+    entries = querystats.collect()
+
+    sort = request.GET.get('sort', 'queries')
+    if entries and sort not in entries[0]:
+        sort = 'queries'
+    entries.sort(key=lambda entry: entry[sort], reverse=True)
+
+    view_name = request.GET.get('view')
+    if view_name:
+        entries = [entry for entry in entries if entry['view'] == view_name]
+    tenant = request.GET.get('tenant')
+    if tenant:
+        entries = [entry for entry in entries if entry['tenant'] == tenant]
+
+    return JsonResponse({'enabled': querystats.get_config()['ENABLED'], 'entries': entries})
+
+
+def metrics_view(request):
+    """Метрики всех процессов в текстовом формате Prometheus"""
+    token = metrics.get_config()['TOKEN']
+    if token:
+        authorization = request.headers.get('Authorization', '')
+        if not constant_time_compare(authorization, f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden()
+
+    return HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
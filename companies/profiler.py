@@ -0,0 +1,220 @@
+"""
+Семплирующий профилировщик запросов.
+
+ProfilerMiddleware выбирает запросы по настройке PROFILER: компании по slug,
+имена URL по шаблону (fnmatch) или доля всего трафика. Пока выбранный запрос
+выполняется, фоновый поток раз в INTERVAL секунд снимает его стек через
+sys._current_frames(). Каждый стек относится к одной категории: orm (в стеке
+есть django.db), template (django.template) или view. Если запрос оказался
+медленнее SLOW_MS, стеки сохраняются в DIR в формате collapsed stacks
+(«кадр;кадр;кадр число»), пригодном для flamegraph.pl и speedscope; первая
+строка файла - комментарий с метаданными запроса. В каталоге хранится не
+больше MAX_FILES файлов, старые удаляются.
+
+    PROFILER = {
+        'ENABLED': True,
+        'COMPANIES': ['acme'],
+        'URL_NAMES': ['companies:dashboard', 'company_users:*'],
+        'SAMPLE_RATE': 0.01,
+        'SLOW_MS': 500,
+    }
+"""
+import fnmatch
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'COMPANIES': [],
+    'URL_NAMES': [],
+    'SAMPLE_RATE': 0.0,
+    'INTERVAL': 0.005,
+    'SLOW_MS': 500,
+    'DIR': Path(settings.BASE_DIR) / 'logs' / 'profiles',
+    'MAX_FILES': 200,
+    'MAX_DEPTH': 128,
+}
+
+CATEGORIES = ['view', 'template', 'orm']
+
+DUMP_SUFFIX = '.collapsed'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PROFILER', {})}
+
+
+def should_profile(config, view_name, tenant):
+    """Решает, профилировать ли запрос к представлению view_name компании tenant"""
+    if tenant and tenant in config['COMPANIES']:
+        return True
+    if view_name and any(fnmatch.fnmatchcase(view_name, pattern) for pattern in config['URL_NAMES']):
+        return True
+    return config['SAMPLE_RATE'] > 0 and random.random() < config['SAMPLE_RATE']
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _category(modules):
+    if any(module.startswith('django.db.') for module in modules):
+        return 'orm'
+    if any(module.startswith('django.template.') for module in modules):
+        return 'template'
+    return 'view'
+
+
+class RequestProfile:
+    """Стеки, собранные для одного запроса"""
+
+    def __init__(self, view_name, tenant, max_depth=None):
+        self.view_name = view_name
+        self.tenant = tenant
+        self.max_depth = max_depth or DEFAULTS['MAX_DEPTH']
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.categories = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def samples(self):
+        return sum(self.categories.values())
+
+    def add(self, frame):
+        names = []
+        modules = []
+        while frame is not None and len(names) < self.max_depth:
+            names.append(_frame_name(frame))
+            modules.append(frame.f_globals.get('__name__', ''))
+            frame = frame.f_back
+        category = _category(modules)
+        stack = ';'.join([category, *reversed(names)])
+        with self._lock:
+            self.stacks[stack] += 1
+            self.categories[category] += 1
+
+    def dump(self, directory, duration_ms, interval, max_files):
+        """Сохраняет стеки в файл collapsed stacks и удаляет старые файлы"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            stacks = list(self.stacks.items())
+            categories = dict(self.categories)
+
+        header = ' '.join([
+            f'view={self.view_name}',
+            f'tenant={self.tenant}',
+            f'duration_ms={round(duration_ms)}',
+            f'interval_ms={interval * 1000:g}',
+            *(f'{category}_samples={categories.get(category, 0)}' for category in CATEGORIES),
+        ])
+        lines = [f'# {header}'] + [f'{stack} {count}' for stack, count in stacks]
+        path = directory / f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{next(_dump_numbers)}{DUMP_SUFFIX}'
+        path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        _rotate(directory, max_files)
+        return path
+
+
+_dump_numbers = itertools.count(1)
+
+
+def _rotate(directory, max_files):
+    dumps = sorted(directory.glob(f'*{DUMP_SUFFIX}'), key=lambda path: path.stat().st_mtime)
+    for path in dumps[:max(0, len(dumps) - max_files)]:
+        path.unlink(missing_ok=True)
+
+
+class Sampler:
+    """Фоновый поток, снимающий стеки потоков с активными профилями"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.interval = DEFAULTS['INTERVAL']
+
+    def start(self, profile, interval=None):
+        with self._lock:
+            if interval:
+                self.interval = interval
+            self._active[threading.get_ident()] = profile
+            self._wakeup.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            profile = self._active.pop(threading.get_ident(), None)
+            if not self._active:
+                self._wakeup.clear()
+        return profile
+
+    def _run(self):
+        while True:
+            # Без активных профилей поток спит и не тратит процессор
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, profile in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    profile.add(frame)
+
+
+sampler = Sampler()
+
+
+def read_dump(path):
+    """Читает файл профиля: возвращает (метаданные, {стек: число})"""
+    metadata = {}
+    stacks = {}
+    with open(path, encoding='utf-8') as stream:
+        for line in stream:
+            line = line.rstrip('\n')
+            if line.startswith('#'):
+                for item in line[1:].split():
+                    key, _, value = item.partition('=')
+                    metadata[key] = value
+                continue
+            stack, _, count = line.rpartition(' ')
+            if stack:
+                stacks[stack] = stacks.get(stack, 0) + int(count)
+    return metadata, stacks
+
+
+def hot_functions(stacks):
+    """
+    Считает по стекам собственные (функция на вершине стека) и общие
+    (функция где-либо в стеке) выборки. Возвращает (self, total, categories).
+    """
+    own = Counter()
+    total = Counter()
+    categories = Counter()
+    for stack, count in stacks.items():
+        category, *frames = stack.split(';')
+        categories[category] += count
+        if frames:
+            own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return own, total, categories
@@ -0,0 +1,217 @@
+"""
+Учет SQL-запросов по представлениям.
+
+QueryStatsMiddleware (включается настройкой QUERY_STATS['ENABLED']) оборачивает
+запрос в connection.execute_wrapper и копит в памяти процесса статистику по
+паре (имя URL, компания): число запросов, время в БД, повторяющиеся запросы
+и самый медленный запрос. Раз в FLUSH_INTERVAL секунд процесс сохраняет свой
+снимок в файл DIR/<pid>.json; команда query_stats и эндпоинт /ops/query-stats/
+объединяют снимки всех процессов.
+
+Декоратор query_budget задает представлению бюджет запросов: при превышении
+пишется предупреждение или выбрасывается QueryBudgetExceeded.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'DIR': Path(settings.BASE_DIR) / 'logs' / 'query_stats',
+    'FLUSH_INTERVAL': 10.0,
+    'BUDGET_ACTION': 'log',      # 'log' или 'raise'
+    'MAX_ENTRIES': 2000,         # сверх этого компании сворачиваются в OTHER_TENANT
+    'MAX_SQL_LENGTH': 1000,
+}
+
+NO_TENANT = '-'
+OTHER_TENANT = '*'
+
+SUM_FIELDS = ['requests', 'queries', 'db_time_ms', 'duplicates']
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_STATS', {})}
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление выполнило больше SQL-запросов, чем разрешает его бюджет"""
+
+
+class QueryRecorder:
+    """Обертка execute_wrapper: считает запросы одного HTTP-запроса"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration_ms = 0.0
+        self.duplicates = 0
+        self.slowest_ms = 0.0
+        self.slowest_sql = ''
+        self._seen = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.duration_ms += elapsed
+            key = hash((sql, repr(params)))
+            if key in self._seen:
+                self.duplicates += 1
+            else:
+                self._seen.add(key)
+            if elapsed > self.slowest_ms:
+                self.slowest_ms = elapsed
+                self.slowest_sql = sql
+
+
+class QueryStats:
+    """Статистика запросов процесса по паре (имя URL, компания)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries = {}
+        self._flushed_at = time.monotonic()
+
+    def record(self, view_name, tenant, recorder):
+        config = get_config()
+        with self._lock:
+            key = (view_name, tenant)
+            if key not in self.entries and len(self.entries) >= config['MAX_ENTRIES']:
+                key = (view_name, OTHER_TENANT)
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = _empty_entry(*key)
+            entry['requests'] += 1
+            entry['queries'] += recorder.count
+            entry['db_time_ms'] += recorder.duration_ms
+            entry['duplicates'] += recorder.duplicates
+            entry['max_queries'] = max(entry['max_queries'], recorder.count)
+            if recorder.slowest_ms > entry['slowest_ms']:
+                entry['slowest_ms'] = recorder.slowest_ms
+                entry['slowest_sql'] = recorder.slowest_sql[:config['MAX_SQL_LENGTH']]
+
+    def snapshot(self):
+        with self._lock:
+            return [dict(entry) for entry in self.entries.values()]
+
+    def reset(self):
+        with self._lock:
+            self.entries.clear()
+
+    def flush(self, directory=None):
+        """Сохраняет снимок процесса в DIR/<pid>.json"""
+        directory = Path(directory or get_config()['DIR'])
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{os.getpid()}.json'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self.snapshot(), ensure_ascii=False), encoding='utf-8')
+        os.replace(temporary, path)
+        self._flushed_at = time.monotonic()
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= get_config()['FLUSH_INTERVAL']:
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('Не удалось сохранить статистику SQL-запросов')
+
+
+query_stats = QueryStats()
+
+
+def _empty_entry(view_name, tenant):
+    return {
+        'view': view_name,
+        'tenant': tenant,
+        'requests': 0,
+        'queries': 0,
+        'max_queries': 0,
+        'db_time_ms': 0.0,
+        'duplicates': 0,
+        'slowest_ms': 0.0,
+        'slowest_sql': '',
+    }
+
+
+def merge(snapshots):
+    """Объединяет снимки нескольких процессов в один список записей"""
+    merged = {}
+    for snapshot in snapshots:
+        for entry in snapshot:
+            key = (entry['view'], entry['tenant'])
+            target = merged.get(key)
+            if target is None:
+                target = merged[key] = _empty_entry(*key)
+            for field in SUM_FIELDS:
+                target[field] += entry[field]
+            target['max_queries'] = max(target['max_queries'], entry['max_queries'])
+            if entry['slowest_ms'] > target['slowest_ms']:
+                target['slowest_ms'] = entry['slowest_ms']
+                target['slowest_sql'] = entry['slowest_sql']
+
+    for entry in merged.values():
+        entry['avg_queries'] = round(entry['queries'] / entry['requests'], 2) if entry['requests'] else 0
+        entry['db_time_ms'] = round(entry['db_time_ms'], 2)
+        entry['slowest_ms'] = round(entry['slowest_ms'], 2)
+    return list(merged.values())
+
+
+def collect(directory=None):
+    """Возвращает объединенную статистику всех процессов"""
+    directory = Path(directory or get_config()['DIR'])
+    snapshots = []
+    for path in sorted(directory.glob('*.json')):
+        try:
+            snapshots.append(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            # Файл мог быть удален или перезаписан другим процессом
+            continue
+    return merge(snapshots)
+
+
+def clear(directory=None):
+    """Удаляет сохраненные снимки и статистику текущего процесса"""
+    query_stats.reset()
+    directory = Path(directory or get_config()['DIR'])
+    for path in directory.glob('*.json'):
+        path.unlink(missing_ok=True)
+
+
+def query_budget(max_queries, action=None):
+    """
+    Декоратор представления: @query_budget(10) пишет предупреждение, если
+    представление выполнило больше 10 SQL-запросов; action='raise' (или
+    QUERY_STATS['BUDGET_ACTION']) выбрасывает QueryBudgetExceeded.
+    Запросы, выполняемые при чтении потокового ответа, не учитываются.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                response = view(request, *args, **kwargs)
+            if recorder.count > max_queries:
+                message = (
+                    f'{view.__module__}.{view.__name__}: {recorder.count} SQL-запросов '
+                    f'при бюджете {max_queries} ({request.path})'
+                )
+                if (action or get_config()['BUDGET_ACTION']) == 'raise':
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
@@ -0,0 +1,91 @@
+"""
+Работа с сессией в контексте компании: сохранение текущей компании,
+данные для автоматического входа после регистрации и токены приглашений.
+"""
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core import signing
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+AUTO_LOGIN_SALT = 'companies.auto_login'
+
+# Сколько секунд действителен токен автовхода
+AUTO_LOGIN_MAX_AGE = 300
+
+
+def remember_company(session, company):
+    """
+    Сохраняет текущую компанию в сессии, только если она изменилась.
+    Присваивание помечает сессию изменённой и вызывает запись в хранилище,
+    поэтому на каждом запросе его избегаем.
+    """
+    company_id = str(company.id)
+    if (session.get('current_company_id') != company_id or
+            session.get('current_company_slug') != company.slug):
+        session['current_company_id'] = company_id
+        session['current_company_slug'] = company.slug
+
+
+def make_auto_login_token(user, company):
+    """Создает подписанный токен автовхода (без пароля пользователя)"""
+    return signing.dumps(
+        {'user_id': user.pk, 'company_slug': company.slug},
+        salt=AUTO_LOGIN_SALT,
+        compress=True,
+    )
+
+
+def read_auto_login_token(token):
+    """Возвращает данные токена автовхода или None, если токен недействителен"""
+    try:
+        return signing.loads(token, salt=AUTO_LOGIN_SALT, max_age=AUTO_LOGIN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+class InviteTokenGenerator(PasswordResetTokenGenerator):
+    """
+    Токен приглашения: как токен сброса пароля, но со своей солью, чтобы
+    токены не подходили друг к другу. Перестает действовать после установки
+    пароля, срок - PASSWORD_RESET_TIMEOUT.
+    """
+    key_salt = 'companies.session.InviteTokenGenerator'
+
+
+invite_token_generator = InviteTokenGenerator()
+
+
+def make_invite_token(user):
+    """Возвращает (uidb64, token) для ссылки приглашения"""
+    return urlsafe_base64_encode(force_bytes(user.pk)), invite_token_generator.make_token(user)
+
+
+def invite_path_template(company):
+    """
+    Путь ссылки приглашения в компанию с местами {uidb64} и {token}: reverse()
+    вызывается один раз на всю пачку пользователей
+    """
+    return reverse('companies:accept_invite', kwargs={
+        'company_slug': company.slug, 'uidb64': '__uidb64__', 'token': '__token__',
+    }).replace('__uidb64__', '{uidb64}').replace('__token__', '{token}')
+
+
+def invite_path(template, user):
+    """Путь ссылки приглашения пользователя по шаблону invite_path_template()"""
+    uidb64, token = make_invite_token(user)
+    return template.format(uidb64=uidb64, token=token)
+
+
+def read_invite_token(uidb64, token):
+    """Возвращает приглашенного пользователя или None, если токен недействителен"""
+    try:
+        user_id = int(urlsafe_base64_decode(uidb64).decode())
+    except (TypeError, ValueError, OverflowError, UnicodeDecodeError):
+        return None
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None or not invite_token_generator.check_token(user, token):
+        return None
+    return user
@@ -0,0 +1,58 @@
+"""
+Выделение уникальных slug-ов для компаний.
+
+Следующий свободный суффикс вычисляется одним запросом по всем slug-ам
+с тем же префиксом, а Company.save() повторяет вставку при конфликте
+уникальности, если две регистрации получили один и тот же slug.
+"""
+import re
+
+from django.utils.text import slugify
+
+
+# Запас под суффикс вида "-123456" в поле длиной 100 символов
+SLUG_BASE_MAX_LENGTH = 90
+
+# Сколько раз Company.save() пробует выделить новый slug при гонке
+SLUG_ALLOCATION_ATTEMPTS = 5
+
+DEFAULT_SLUG = 'company'
+
+
+def company_base_slug(name):
+    """Возвращает базовый slug для названия компании"""
+    base = slugify(name, allow_unicode=True)[:SLUG_BASE_MAX_LENGTH].strip('-')
+    return base or DEFAULT_SLUG
+
+
+def is_generated_slug(slug, name):
+    """Проверяет, что slug получен из названия (base или base-N)"""
+    base = company_base_slug(name)
+    return re.fullmatch(rf'{re.escape(base)}(-[0-9]+)?', slug or '') is not None
+
+
+def allocate_company_slug(name):
+    """
+    Возвращает свободный slug для названия компании одним запросом:
+    base, если он свободен, иначе base-N с N на единицу больше максимального
+    занятого суффикса.
+    """
+    from .models import Company
+
+    base = company_base_slug(name)
+    taken = Company.objects.filter(slug__startswith=base).values_list('slug', flat=True)
+
+    base_taken = False
+    max_suffix = 0
+    suffix_pattern = re.compile(rf'{re.escape(base)}-([0-9]+)')
+    for slug in taken:
+        if slug == base:
+            base_taken = True
+            continue
+        match = suffix_pattern.fullmatch(slug)
+        if match:
+            max_suffix = max(max_suffix, int(match.group(1)))
+
+    if not base_taken:
+        return base
+    return f"{base}-{max_suffix + 1}"
@@ -0,0 +1,180 @@
+"""
+Материализованные счетчики компаний.
+
+Сигналы членств и разделов меню атомарно изменяют строку CompanyStatistics
+F-выражениями, поэтому дашборд читает все числа из одной строки вместо
+COUNT(*) по таблицам, растущим вместе с компанией. Массовые операции
+(bulk_create, update) сигналов не вызывают и должны вызывать
+adjust_counters() сами; расхождения исправляет reconcile_statistics().
+
+Изменение активности существующей записи учитывается, только если условный
+UPDATE ... WHERE is_active = <прежнее значение> действительно изменил строку
+(claim_activity): два устаревших экземпляра одной записи не вычтут единицу
+дважды.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Company, CompanyMembership, CompanyMenuSection, CompanyStatistics
+
+
+COUNTER_FIELDS = [
+    'members_count',
+    'active_members_count',
+    'menu_sections_count',
+    'active_menu_sections_count',
+]
+
+
+def adjust_counters(company_id, **deltas):
+    """
+    Атомарно изменяет счетчики компании: adjust_counters(id, members_count=1).
+    Если строки счетчиков еще нет, ничего не делает - она будет посчитана
+    целиком при первом чтении.
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if updates:
+        CompanyStatistics.objects.filter(company_id=company_id).update(**updates)
+
+
+def claim_activity(queryset, is_active):
+    """
+    Переводит записи queryset в состояние is_active условным UPDATE и
+    возвращает изменение числа активных записей - только по строкам, которые
+    UPDATE действительно изменил
+    """
+    changed = queryset.filter(is_active=not is_active).update(is_active=is_active)
+    return changed if is_active else -changed
+
+
+def get_company_statistics(company):
+    """Возвращает счетчики компании, при отсутствии строки пересчитывает их"""
+    statistics = CompanyStatistics.objects.filter(company=company).first()
+    if statistics is None:
+        reconcile_statistics(Company.objects.filter(pk=company.pk))
+        statistics = CompanyStatistics.objects.get(company=company)
+    return statistics
+
+
+def count_actual(companies):
+    """Возвращает фактические значения счетчиков: {company_id: {поле: значение}}"""
+    membership_counts = companies.annotate(
+        members_count=Count('memberships', distinct=True),
+        active_members_count=Count('memberships', filter=Q(memberships__is_active=True), distinct=True),
+    ).values_list('pk', 'members_count', 'active_members_count')
+    section_counts = companies.annotate(
+        menu_sections_count=Count('menu_sections', distinct=True),
+        active_menu_sections_count=Count('menu_sections', filter=Q(menu_sections__is_active=True), distinct=True),
+    ).values_list('pk', 'menu_sections_count', 'active_menu_sections_count')
+
+    actual = {}
+    for pk, members, active_members in membership_counts:
+        actual[pk] = {'members_count': members, 'active_members_count': active_members}
+    for pk, sections, active_sections in section_counts:
+        actual[pk].update({'menu_sections_count': sections, 'active_menu_sections_count': active_sections})
+    return actual
+
+
+def reconcile_statistics(companies=None, dry_run=False):
+    """
+    Сверяет счетчики с фактическими данными и исправляет расхождения.
+    Возвращает список (company_id, поле, было, стало).
+    """
+    if companies is None:
+        companies = Company.objects.all()
+
+    actual = count_actual(companies)
+    stored = CompanyStatistics.objects.in_bulk(list(actual))
+
+    drift = []
+    to_create = []
+    to_update = []
+    for company_id, values in actual.items():
+        statistics = stored.get(company_id)
+        if statistics is None:
+            statistics = CompanyStatistics(company_id=company_id)
+            to_create.append(statistics)
+        else:
+            to_update.append(statistics)
+        for field in COUNTER_FIELDS:
+            current = getattr(statistics, field)
+            if current != values[field]:
+                drift.append((company_id, field, current, values[field]))
+                setattr(statistics, field, values[field])
+
+    if not dry_run:
+        CompanyStatistics.objects.bulk_create(to_create, batch_size=500)
+        changed = {company_id for company_id, *_ in drift}
+        CompanyStatistics.objects.bulk_update(
+            [statistics for statistics in to_update if statistics.company_id in changed],
+            COUNTER_FIELDS,
+            batch_size=500,
+        )
+    return drift
+
+
+def _on_saving(sender, instance, update_fields, active_field):
+    # Новая запись учитывается после вставки; сохранение без is_active активность не меняет
+    if instance.pk is None or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    with transaction.atomic():
+        delta = claim_activity(sender.objects.filter(pk=instance.pk), instance.is_active)
+        adjust_counters(instance.company_id, **{active_field: delta})
+
+
+def _on_saved(instance, created, total_field, active_field):
+    if created:
+        adjust_counters(instance.company_id, **{total_field: 1, active_field: int(instance.is_active)})
+
+
+def _on_deleting(sender, instance, total_field, active_field):
+    # Выполняется в транзакции удаления; повторное удаление той же записи ничего не вычтет
+    queryset = sender.objects.filter(pk=instance.pk)
+    active = claim_activity(queryset, False)
+    instance._counter_deltas = {total_field: -1 if active or queryset.exists() else 0, active_field: active}
+
+
+def _on_deleted(instance):
+    adjust_counters(instance.company_id, **instance.__dict__.pop('_counter_deltas', {}))
+
+
+@receiver(pre_save, sender=CompanyMembership)
+def claim_membership_activity(sender, instance, update_fields=None, **kwargs):
+    _on_saving(sender, instance, update_fields, 'active_members_count')
+
+
+@receiver(post_save, sender=CompanyMembership)
+def count_membership_save(sender, instance, created, **kwargs):
+    _on_saved(instance, created, 'members_count', 'active_members_count')
+
+
+@receiver(pre_delete, sender=CompanyMembership)
+def claim_membership_delete(sender, instance, **kwargs):
+    _on_deleting(sender, instance, 'members_count', 'active_members_count')
+
+
+@receiver(post_delete, sender=CompanyMembership)
+def count_membership_delete(sender, instance, **kwargs):
+    _on_deleted(instance)
+
+
+@receiver(pre_save, sender=CompanyMenuSection)
+def claim_menu_section_activity(sender, instance, update_fields=None, **kwargs):
+    _on_saving(sender, instance, update_fields, 'active_menu_sections_count')
+
+
+@receiver(post_save, sender=CompanyMenuSection)
+def count_menu_section_save(sender, instance, created, **kwargs):
+    _on_saved(instance, created, 'menu_sections_count', 'active_menu_sections_count')
+
+
+@receiver(pre_delete, sender=CompanyMenuSection)
+def claim_menu_section_delete(sender, instance, **kwargs):
+    _on_deleting(sender, instance, 'menu_sections_count', 'active_menu_sections_count')
+
+
+@receiver(post_delete, sender=CompanyMenuSection)
+def count_menu_section_delete(sender, instance, **kwargs):
+    _on_deleted(instance)
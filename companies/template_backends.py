@@ -0,0 +1,33 @@
+"""
+Шаблонный движок Django с замером времени отрисовки для метрик.
+Подключается в TEMPLATES вместо DjangoTemplates, когда включены METRICS.
+"""
+import time
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .metrics import observe_template
+
+
+class InstrumentedTemplate(Template):
+    """Шаблон, сообщающий время своей отрисовки (включая {% include %})"""
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            observe_template(self.template.name, time.perf_counter() - started)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
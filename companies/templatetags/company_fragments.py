@@ -0,0 +1,57 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from companies.cache import get_menu_sections
+from companies.fragments import render_fragment
+
+
+register = template.Library()
+
+SIDEBAR_TEMPLATE = 'companies/sidebar.html'
+
+# Пункт боковой панели и условие его активности по имени URL
+SIDEBAR_ITEMS = [
+    ('dashboard', lambda url_name: url_name == 'dashboard'),
+    ('users', lambda url_name: 'users' in url_name),
+    ('orders', lambda url_name: 'orders' in url_name),
+    ('products', lambda url_name: 'products' in url_name),
+    ('suppliers', lambda url_name: 'suppliers' in url_name),
+    ('departments', lambda url_name: 'departments' in url_name),
+    ('settings', lambda url_name: url_name == 'settings'),
+]
+
+
+def active_items(request):
+    """Активные пункты боковой панели для текущего URL"""
+    match = getattr(request, 'resolver_match', None)
+    url_name = (match.url_name if match else None) or ''
+    return [item for item, is_active in SIDEBAR_ITEMS if is_active(url_name)]
+
+
+@register.simple_tag(takes_context=True)
+def company_sidebar(context):
+    """
+    Боковая панель текущей компании. HTML зависит только от компании, уровня
+    роли и активного пункта, поэтому берется из кэша фрагментов; разделы меню
+    читаются только при отрисовке.
+    """
+    request = context.get('request')
+    company = getattr(request, 'current_company', None)
+    membership = getattr(request, 'current_membership', None)
+    if company is None or membership is None:
+        return ''
+    active = active_items(request)
+
+    def get_context():
+        sections = context.get('custom_menu_sections')
+        if sections is None:
+            sections = get_menu_sections(company, membership.role_level)
+        return {
+            'company': company,
+            'active': active,
+            'custom_menu_sections': sections,
+            'can_manage_menu': membership.has_full_admin_rights(),
+        }
+
+    variant = f'{membership.role_level}:{int(membership.has_full_admin_rights())}:{",".join(active)}'
+    return mark_safe(render_fragment(SIDEBAR_TEMPLATE, company.pk, variant, get_context))
@@ -1,7 +1,55 @@
-from django.test import TestCase
+import csv
+import io
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import TestCase, RequestFactory, override_settings
 from django.contrib.auth.models import User
-from django.urls import reverse
-from .models import Company, CompanyMembership, CompanySettings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import resolve, reverse
+from . import querystats
+from . import metrics, profiler
+from .events import event_log, log_event
+from .export import HEADERS, export_members
+from .imports import ImportFileError, MemberImporter, import_members, read_rows
+from .loadgen import LoadDataGenerator
+from .middleware import CompanyMiddleware, QueryStatsMiddleware
+from .template_backends import InstrumentedDjangoTemplates
+from .benchmarks import compare, failed, run_benchmarks
+from .cache import get_menu_sections, is_shared_cache, tenant_cache_timeout
+from .conditional import touch_company_data
+from .models import Company, CompanyMembership, CompanySettings, CompanyMenuSection, CompanyStatistics
+from .session import make_auto_login_token
+from .slugs import allocate_company_slug
+from .statistics import get_company_statistics, reconcile_statistics
+from users import search
+from users.models import UserProfile
+
+
+# Журнал событий в тестах ничего не пишет на диск
+null_event_log = override_settings(COMPANY_EVENT_LOG={'SINKS': ['null']})
+
+
+def setUpModule():
+    null_event_log.enable()
+    event_log.configure()
+
+
+def tearDownModule():
+    event_log.flush()
+    null_event_log.disable()
+    event_log.configure()
 
 
 class CompanyModelTest(TestCase):
@@ -107,3 +155,1168 @@ class CompanyViewsTest(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Дашборд компании')
+
+
+class TenantCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='testpass123')
+        self.company = Company.objects.create(
+            name='Кэш компания',
+            company_type='LLC',
+            owner=self.user
+        )
+        self.middleware = CompanyMiddleware(lambda request: None)
+    
+    def _request(self, path):
+        request = RequestFactory().get(path)
+        request.user = self.user
+        request.session = SessionStore()
+        return request
+    
+    def test_warm_request_does_not_hit_database(self):
+        """Тест что повторное разрешение компании обходится без запросов к БД"""
+        path = f'/companies/{self.company.slug}/dashboard/'
+        self.middleware.process_request(self._request(path))
+        
+        request = self._request(path)
+        with self.assertNumQueries(0):
+            self.middleware.process_request(request)
+        self.assertEqual(request.current_company, self.company)
+        self.assertEqual(request.current_membership.role, 'owner')
+    
+    def test_membership_change_invalidates_cache(self):
+        """Тест что деактивация членства сбрасывает кэш"""
+        path = f'/companies/{self.company.slug}/dashboard/'
+        self.middleware.process_request(self._request(path))
+        
+        membership = CompanyMembership.objects.get(company=self.company, user=self.user)
+        membership.is_active = False
+        membership.save()
+        
+        request = self._request(path)
+        response = self.middleware.process_request(request)
+        self.assertFalse(hasattr(request, 'current_company'))
+        self.assertEqual(response.status_code, 302)
+    
+    def test_local_cache_expires_change_from_other_process(self):
+        """Тест что с кэшем в памяти процесса изменение в другом воркере действует через секунды"""
+        from django.conf import settings
+        self.assertFalse(is_shared_cache())
+        path = f'/companies/{self.company.slug}/dashboard/'
+        self.middleware.process_request(self._request(path))
+        # Другой воркер: строка изменена, а кэш этого процесса не инвалидирован
+        CompanyMembership.objects.filter(company=self.company, user=self.user).update(is_active=False)
+
+        request = self._request(path)
+        with mock.patch('time.time', return_value=time.time() + settings.COMPANY_LOCAL_CACHE_TIMEOUT + 1):
+            self.middleware.process_request(request)
+        self.assertFalse(hasattr(request, 'current_company'))
+
+    def test_shared_cache_keeps_configured_timeout(self):
+        """Тест что полный таймаут кэша тенанта действует только с общим бэкендом"""
+        from django.conf import settings
+        self.assertEqual(tenant_cache_timeout(), settings.COMPANY_LOCAL_CACHE_TIMEOUT)
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }):
+            self.assertTrue(is_shared_cache())
+            self.assertEqual(tenant_cache_timeout(), settings.COMPANY_CACHE_TIMEOUT)
+
+    def test_company_slug_change_invalidates_cache(self):
+        """Тест что смена slug компании сбрасывает старый ключ"""
+        old_path = f'/companies/{self.company.slug}/dashboard/'
+        self.middleware.process_request(self._request(old_path))
+        
+        self.company.slug = 'new-slug'
+        self.company.save()
+        
+        request = self._request(old_path)
+        self.middleware.process_request(request)
+        self.assertFalse(hasattr(request, 'current_company'))
+    
+    def test_session_written_only_when_company_changes(self):
+        """Тест что компания сохраняется в сессии только при её смене"""
+        path = f'/companies/{self.company.slug}/dashboard/'
+        request = self._request(path)
+        self.middleware.process_request(request)
+        self.assertTrue(request.session.modified)
+        self.assertEqual(request.session['current_company_slug'], self.company.slug)
+        
+        session = request.session
+        session.save()
+        request = self._request(path)
+        request.session = SessionStore(session.session_key)
+        self.middleware.process_request(request)
+        self.assertFalse(request.session.modified)
+
+
+class AutoLoginTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='newowner', password='testpass123')
+        self.company = Company.objects.create(
+            name='New Company',
+            company_type='LLC',
+            owner=self.user
+        )
+    
+    def test_auto_login_with_token(self):
+        """Тест автовхода по подписанному токену"""
+        session = self.client.session
+        session['auto_login_token'] = make_auto_login_token(self.user, self.company)
+        session.save()
+        
+        response = self.client.get(reverse('companies:auto_login'))
+        self.assertRedirects(
+            response,
+            reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}),
+            fetch_redirect_response=False
+        )
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+        self.assertNotIn('auto_login_token', self.client.session)
+    
+    def test_auto_login_rejects_tampered_token(self):
+        """Тест что поддельный токен не авторизует пользователя"""
+        session = self.client.session
+        session['auto_login_token'] = make_auto_login_token(self.user, self.company) + 'x'
+        session.save()
+        
+        response = self.client.get(reverse('companies:auto_login'))
+        self.assertRedirects(response, reverse('companies:unified_login'), fetch_redirect_response=False)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class MenuSectionResolverTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='menuowner', password='testpass123')
+        self.company = Company.objects.create(
+            name='Menu Company',
+            company_type='LLC',
+            owner=self.user
+        )
+        for title, role in [('Для всех', 'viewer'), ('Сотрудникам', 'employee'), ('Админам', 'admin')]:
+            CompanyMenuSection.objects.create(
+                company=self.company,
+                created_by=self.user,
+                title=title,
+                url='/custom/',
+                required_role=role
+            )
+    
+    def test_sections_filtered_by_role(self):
+        """Тест что роль видит только разделы своего уровня и ниже"""
+        titles = [section.title for section in get_menu_sections(self.company, CompanyMembership.ROLE_LEVELS['employee'])]
+        self.assertEqual(sorted(titles), ['Для всех', 'Сотрудникам'])
+        self.assertEqual(len(get_menu_sections(self.company, CompanyMembership.ROLE_LEVELS['owner'])), 3)
+    
+    def test_sections_cached_per_role(self):
+        """Тест что повторный запрос меню обходится без обращений к БД"""
+        get_menu_sections(self.company, CompanyMembership.ROLE_LEVELS['admin'])
+        with self.assertNumQueries(0):
+            sections = get_menu_sections(self.company, CompanyMembership.ROLE_LEVELS['admin'])
+            urls = [section.get_full_url() for section in sections]
+        self.assertEqual(len(urls), 3)
+    
+    def test_toggle_invalidates_cache(self):
+        """Тест что отключение раздела сбрасывает кэш меню"""
+        self.assertEqual(len(get_menu_sections(self.company, CompanyMembership.ROLE_LEVELS['viewer'])), 1)
+        section = CompanyMenuSection.objects.get(title='Для всех')
+        section.is_active = False
+        section.save()
+        self.assertEqual(get_menu_sections(self.company, CompanyMembership.ROLE_LEVELS['viewer']), [])
+    
+    def test_dashboard_shows_sections_for_role(self):
+        """Тест что дашборд отображает разделы, доступные роли"""
+        self.client.login(username='menuowner', password='testpass123')
+        response = self.client.get(
+            reverse('companies:dashboard', kwargs={'company_slug': self.company.slug})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['custom_menu_sections']), 3)
+
+
+class MembershipPermissionsTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='permowner', password='testpass123')
+        self.company = Company.objects.create(
+            name='Permissions Company',
+            company_type='LLC',
+            owner=self.owner
+        )
+        self.manager = CompanyMembership.objects.create(
+            company=self.company,
+            user=User.objects.create_user(username='manager', password='testpass123'),
+            role='manager'
+        )
+    
+    def test_role_level_and_mask(self):
+        """Тест что уровень роли и маска прав вычисляются при сохранении"""
+        self.assertEqual(self.manager.role_level, CompanyMembership.ROLE_LEVELS['manager'])
+        self.assertTrue(self.manager.has_permission(CompanyMembership.PERM_MANAGE_PRODUCTS))
+        self.assertFalse(self.manager.has_permission(CompanyMembership.PERM_MANAGE_USERS))
+        self.assertFalse(self.manager.has_full_admin_rights())
+        
+        self.manager.can_manage_users = True
+        self.manager.save()
+        self.assertTrue(self.manager.has_permission(CompanyMembership.PERM_MANAGE_USERS))
+    
+    def test_permission_query(self):
+        """Тест выборки участников по праву и уровню роли в SQL"""
+        memberships = CompanyMembership.objects.filter(company=self.company)
+        self.assertEqual(
+            memberships.with_permission(CompanyMembership.PERM_VIEW_REPORTS).count(), 2
+        )
+        self.assertEqual(
+            list(memberships.with_permission(CompanyMembership.PERM_MANAGE_USERS)
+                 .with_role_at_least('admin').values_list('user__username', flat=True)),
+            ['permowner']
+        )
+
+
+class CompanySlugAllocationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='slugowner', password='testpass123')
+    
+    def _create(self, **kwargs):
+        return Company.objects.create(company_type='LLC', owner=self.user, **kwargs)
+    
+    def test_next_suffix_single_query(self):
+        """Тест что следующий свободный суффикс находится одним запросом"""
+        for _ in range(3):
+            self._create(name='Acme')
+        self._create(name='Acme Group')
+        with self.assertNumQueries(1):
+            slug = allocate_company_slug('Acme')
+        self.assertEqual(slug, 'acme-3')
+    
+    def test_stale_slug_is_reallocated(self):
+        """Тест что устаревший (уже занятый) сгенерированный slug перевыделяется"""
+        self._create(name='Acme')
+        company = self._create(name='Acme', slug='acme')
+        self.assertEqual(company.slug, 'acme-1')
+    
+    def test_explicit_slug_conflict_raises(self):
+        """Тест что конфликт явно заданного slug не маскируется"""
+        self._create(name='Acme', slug='custom')
+        with self.assertRaises(IntegrityError):
+            self._create(name='Other', slug='custom')
+
+
+class CompanyStatisticsTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='statsowner', password='testpass123')
+        self.company = Company.objects.create(
+            name='Stats Company',
+            company_type='LLC',
+            owner=self.owner
+        )
+    
+    def _statistics(self):
+        return CompanyStatistics.objects.get(company=self.company)
+    
+    def test_counters_follow_memberships(self):
+        """Тест что счетчики участников обновляются сигналами"""
+        member = CompanyMembership.objects.create(
+            company=self.company,
+            user=User.objects.create_user(username='member', password='testpass123'),
+            role='employee'
+        )
+        statistics = self._statistics()
+        self.assertEqual(statistics.members_count, 2)
+        self.assertEqual(statistics.active_members_count, 2)
+        
+        member = CompanyMembership.objects.get(pk=member.pk)
+        member.is_active = False
+        member.save()
+        member.save()
+        self.assertEqual(self._statistics().active_members_count, 1)
+        
+        member.delete()
+        statistics = self._statistics()
+        self.assertEqual(statistics.members_count, 1)
+        self.assertEqual(statistics.active_members_count, 1)
+    
+    def test_stale_instances_do_not_decrement_twice(self):
+        """Тест что два устаревших экземпляра одного членства вычитают единицу один раз"""
+        member = CompanyMembership.objects.create(
+            company=self.company,
+            user=User.objects.create_user(username='member', password='testpass123'),
+            role='employee'
+        )
+        first = CompanyMembership.objects.get(pk=member.pk)
+        second = CompanyMembership.objects.get(pk=member.pk)
+        for stale in (first, second):
+            stale.is_active = False
+            stale.save()
+        self.assertEqual(self._statistics().active_members_count, 1)
+        
+        owner_membership = CompanyMembership.objects.get(company=self.company, user=self.owner)
+        owner_membership.is_active = False
+        owner_membership.save()
+        self.assertEqual(self._statistics().active_members_count, 0)
+        
+        # Повторное удаление уже удаленной записи счетчики не меняет
+        first.delete()
+        second.delete()
+        statistics = self._statistics()
+        self.assertEqual((statistics.members_count, statistics.active_members_count), (1, 0))
+        self.assertEqual(reconcile_statistics(Company.objects.filter(pk=self.company.pk), dry_run=True), [])
+    
+    def test_reconcile_fixes_drift(self):
+        """Тест что сверка исправляет расхождения после массовых операций"""
+        CompanyMembership.objects.filter(company=self.company).update(is_active=False)
+        drift = reconcile_statistics(Company.objects.filter(pk=self.company.pk))
+        self.assertEqual(drift, [(self.company.pk, 'active_members_count', 1, 0)])
+        self.assertEqual(self._statistics().active_members_count, 0)
+    
+    def test_missing_row_is_rebuilt(self):
+        """Тест что отсутствующая строка счетчиков пересчитывается при чтении"""
+        CompanyStatistics.objects.filter(company=self.company).delete()
+        self.assertEqual(get_company_statistics(self.company).members_count, 1)
+
+
+class MemorySink:
+    """Приемник журнала событий для тестов"""
+    events = []
+    
+    def __init__(self, config):
+        pass
+    
+    def write(self, events):
+        MemorySink.events.extend(events)
+
+
+@override_settings(COMPANY_EVENT_LOG={
+    'SINKS': ['companies.tests.MemorySink'],
+    'FLUSH_INTERVAL': 0.01,
+})
+class EventLogTest(TestCase):
+    def setUp(self):
+        event_log.flush()
+        event_log.configure()
+        MemorySink.events = []
+    
+    def tearDown(self):
+        event_log.flush()
+        event_log.configure()
+    
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        # Приемники модуля (null) вместо MemorySink класса
+        event_log.configure()
+    
+    def test_membership_creation_is_logged(self):
+        """Тест что создание компании и членства попадает в журнал событий"""
+        owner = User.objects.create_user(username='eventowner', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True):
+            company = Company.objects.create(name='Event Company', company_type='LLC', owner=owner)
+        self.assertTrue(event_log.flush())
+        
+        events = {event['event']: event for event in MemorySink.events}
+        self.assertEqual(events['membership.created']['data']['role'], 'owner')
+        self.assertEqual(events['membership.created']['user_id'], owner.pk)
+        self.assertEqual(events['company.created']['company_id'], company.pk)
+    
+    def test_rolled_back_creation_is_not_logged(self):
+        """Тест что откаченное создание компании не попадает в журнал"""
+        owner = User.objects.create_user(username='eventowner', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    Company.objects.create(name='Event Company', company_type='LLC', owner=owner)
+                    raise IntegrityError('откат')
+            except IntegrityError:
+                pass
+        self.assertEqual(callbacks, [])
+        event_log.flush()
+        self.assertEqual(MemorySink.events, [])
+    
+    @override_settings(COMPANY_EVENT_LOG={
+        'SINKS': ['companies.tests.MemorySink'],
+        'LEVEL': 'WARNING',
+    })
+    def test_level_filter(self):
+        """Тест что события ниже настроенного уровня отбрасываются"""
+        event_log.configure()
+        log_event('test.info', level='INFO')
+        log_event('test.warning', level='WARNING')
+        event_log.flush()
+        self.assertEqual([event['event'] for event in MemorySink.events], ['test.warning'])
+
+    def test_database_sink_rejected_on_sqlite(self):
+        """Тест что приемник db не настраивается поверх SQLite"""
+        with override_settings(COMPANY_EVENT_LOG={'SINKS': ['db']}):
+            with self.assertRaises(ImproperlyConfigured):
+                event_log.configure()
+
+
+class LoadDataGeneratorTest(TestCase):
+    """Тесты генератора данных для нагрузочного тестирования"""
+    
+    def setUp(self):
+        cache.clear()
+        self.generator = LoadDataGenerator(companies=3, members=5, sections=2, seed=7, chunk_size=10)
+    
+    def test_generates_consistent_data(self):
+        """Тест что созданные данные полны и согласованы со счетчиками"""
+        totals = self.generator.run()
+        
+        self.assertEqual(totals['companies'], 3)
+        self.assertEqual(totals['users'], 15)
+        companies = Company.objects.filter(slug__startswith=self.generator.slug_prefix)
+        self.assertEqual(companies.count(), 3)
+        self.assertEqual(CompanySettings.objects.filter(company__in=companies).count(), 3)
+        self.assertEqual(reconcile_statistics(companies, dry_run=True), [])
+        
+        owners = CompanyMembership.objects.filter(company__in=companies, role='owner')
+        self.assertEqual(owners.count(), 3)
+        self.assertTrue(all(membership.has_full_admin_rights() for membership in owners))
+        self.assertFalse(CompanyMembership.objects.filter(company__in=companies, permissions=0, role='admin').exists())
+    
+    def test_clear(self):
+        """Тест что clear() удаляет только созданные генератором данные"""
+        other = User.objects.create_user(username='keepme', password='testpass123')
+        self.generator.run()
+        generated = self._snapshot()
+        
+        companies, users = self.generator.clear()
+        
+        self.assertEqual(companies, 3)
+        self.assertEqual(users, 15)
+        self.assertFalse(Company.objects.filter(slug__startswith=self.generator.slug_prefix).exists())
+        self.assertTrue(User.objects.filter(pk=other.pk).exists())
+        # Повторный запуск с тем же seed создает те же данные без конфликтов
+        self.assertEqual(self.generator.run()['users'], 15)
+        self.assertEqual(self._snapshot(), generated)
+    
+    def _snapshot(self):
+        companies = Company.objects.filter(slug__startswith=self.generator.slug_prefix)
+        users = User.objects.filter(username__startswith=self.generator.username_prefix)
+        return (
+            list(companies.order_by('slug').values_list('pk', 'slug', 'company_type', 'owner__username')),
+            list(users.order_by('username').values_list('username', 'first_name', 'date_joined')),
+            list(CompanyMembership.objects.filter(company__in=companies)
+                 .order_by('user__username').values_list('user__username', 'role', 'is_active')),
+        )
+
+
+class EndpointBenchmarkTest(TestCase):
+    """Тесты бенчмарка эндпоинтов"""
+    
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=1, members=5, sections=2, seed=11)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.user = User.objects.get(pk=self.company.owner_id)
+    
+    def test_run_and_compare(self):
+        """Тест что замеры собираются и рост числа запросов считается регрессией"""
+        results = run_benchmarks(self.company, self.user, iterations=2, warmup=0,
+                                 only=['unified_login', 'company_dashboard'])
+        
+        dashboard = results['company_dashboard']
+        self.assertEqual(dashboard['status'], 200)
+        self.assertGreater(dashboard['queries'], 0)
+        self.assertGreater(dashboard['bytes'], 0)
+        self.assertEqual(compare(results, {'endpoints': results}), [])
+        
+        baseline = {'endpoints': {'company_dashboard': {**dashboard, 'queries': dashboard['queries'] - 1}}}
+        regressions = compare(results, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('SQL', regressions[0])
+        
+        # Ответ с ошибкой - регрессия даже при такой же базовой линии
+        broken = {**results, 'company_dashboard': {**dashboard, 'status': 500}}
+        self.assertEqual(failed(broken), {'company_dashboard': 500})
+        self.assertEqual(compare(broken, {'endpoints': broken}), ['company_dashboard: статус 500'])
+
+
+class QueryStatsTest(TestCase):
+    """Тесты учета SQL-запросов по представлениям"""
+    
+    def setUp(self):
+        cache.clear()
+        querystats.query_stats.reset()
+        self.factory = RequestFactory()
+        self.owner = User.objects.create_user(username='statsowner', password='testpass123', is_staff=True)
+        self.company = Company.objects.create(name='Stats Company', company_type='LLC', owner=self.owner)
+    
+    def tearDown(self):
+        querystats.query_stats.reset()
+    
+    @override_settings(QUERY_STATS={'ENABLED': True, 'FLUSH_INTERVAL': 3600})
+    def test_middleware_records_queries_per_view_and_tenant(self):
+        """Тест что middleware учитывает запросы по имени URL и компании"""
+        def view(request):
+            request.current_company = self.company
+            list(User.objects.filter(pk=self.owner.pk))
+            list(User.objects.filter(pk=self.owner.pk))
+            return HttpResponse()
+        
+        request = self.factory.get('/')
+        request.resolver_match = resolve(reverse('companies:dashboard', args=[self.company.slug]))
+        QueryStatsMiddleware(view)(request)
+        
+        entry, = querystats.query_stats.snapshot()
+        self.assertEqual(entry['view'], 'companies:dashboard')
+        self.assertEqual(entry['tenant'], self.company.slug)
+        self.assertEqual(entry['queries'], 2)
+        self.assertEqual(entry['duplicates'], 1)
+        self.assertIn('auth_user', entry['slowest_sql'])
+    
+    def test_middleware_disabled_by_default(self):
+        """Тест что без настройки middleware не подключается"""
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryStatsMiddleware(lambda request: HttpResponse())
+    
+    def test_query_budget(self):
+        """Тест что превышение бюджета пишется в лог или выбрасывает исключение"""
+        def view(request):
+            list(User.objects.all())
+            list(Company.objects.all())
+            return HttpResponse()
+        request = self.factory.get('/')
+        
+        with self.assertLogs('companies.querystats', level='WARNING'):
+            querystats.query_budget(1)(view)(request)
+        with self.assertRaises(querystats.QueryBudgetExceeded):
+            querystats.query_budget(1, action='raise')(view)(request)
+        querystats.query_budget(2, action='raise')(view)(request)
+    
+    def test_ops_endpoint(self):
+        """Тест что JSON со статистикой доступен только сотрудникам"""
+        employee = User.objects.create_user(username='statsemployee', password='testpass123')
+        self.client.force_login(employee)
+        response = self.client.get(reverse('ops:query_stats'))
+        self.assertEqual(response.status_code, 302)
+        
+        recorder = querystats.QueryRecorder()
+        recorder.count = 3
+        querystats.query_stats.record('companies:dashboard', self.company.slug, recorder)
+        self.client.force_login(self.owner)
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(QUERY_STATS={'DIR': directory}):
+            response = self.client.get(reverse('ops:query_stats'))
+        self.assertEqual(response.status_code, 200)
+        entry, = response.json()['entries']
+        self.assertEqual(entry['queries'], 3)
+        self.assertEqual(entry['avg_queries'], 3)
+
+
+class ProfilerTest(TestCase):
+    """Тесты семплирующего профилировщика"""
+    
+    def test_should_profile(self):
+        """Тест выбора запросов по компании, имени URL и доле трафика"""
+        config = {**profiler.DEFAULTS, 'COMPANIES': ['acme'], 'URL_NAMES': ['company_users:*']}
+        self.assertTrue(profiler.should_profile(config, 'companies:dashboard', 'acme'))
+        self.assertTrue(profiler.should_profile(config, 'company_users:users_list', 'other'))
+        self.assertFalse(profiler.should_profile(config, 'companies:dashboard', 'other'))
+        self.assertTrue(profiler.should_profile({**config, 'SAMPLE_RATE': 1.0}, 'companies:dashboard', 'other'))
+    
+    def test_sampling_dump_and_report(self):
+        """Тест что стеки собираются, сохраняются и объединяются в отчет"""
+        profile = profiler.RequestProfile('companies:dashboard', 'acme')
+        profiler.sampler.start(profile, interval=0.001)
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline or not profile.samples:
+            User.objects.filter(username__startswith='x').count()
+        self.assertIs(profiler.sampler.stop(), profile)
+        self.assertGreater(profile.categories['orm'], 0)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            for _ in range(3):
+                profile.dump(directory, 250, 0.001, max_files=2)
+            path, *others = sorted(Path(directory).glob('*.collapsed'))
+            self.assertEqual(len(others), 1)
+            
+            metadata, stacks = profiler.read_dump(path)
+            self.assertEqual(metadata['view'], 'companies:dashboard')
+            self.assertEqual(metadata['tenant'], 'acme')
+            self.assertEqual(sum(stacks.values()), profile.samples)
+            own, total, categories = profiler.hot_functions(stacks)
+            self.assertEqual(sum(own.values()), sum(categories.values()))
+            self.assertTrue(any(name.startswith('django.db.') for name in total))
+            
+            output = io.StringIO()
+            call_command('profile_report', dir=directory, category='orm', stdout=output)
+            self.assertIn('orm 100.0%', output.getvalue())
+
+
+class MetricsTest(TestCase):
+    """Тесты метрик Prometheus"""
+    
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(METRICS={
+            'ENABLED': True, 'DIR': self.directory.name, 'TOKEN': 'secret', 'TOP_TENANTS': 1,
+        })
+        self.settings_override.enable()
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.directory.cleanup()
+        metrics.registry.reset()
+    
+    def scrape(self):
+        response = self.client.get(reverse('ops:metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+    
+    def test_request_metrics(self):
+        """Тест что middleware записывает время запроса и SQL-запросы по имени URL"""
+        self.client.get(reverse('companies:unified_login'))
+        
+        text = self.scrape()
+        self.assertIn('# TYPE purchases_http_request_duration_seconds histogram', text)
+        self.assertIn(
+            'purchases_http_request_duration_seconds_count{status="200",view="companies:unified_login"} 1', text
+        )
+        self.assertIn('purchases_db_queries_per_request_bucket{view="companies:unified_login",le="+Inf"} 1', text)
+        self.assertIn('purchases_tenant_requests_total{tenant="none"}', text)
+    
+    def test_endpoint_requires_token(self):
+        """Тест что метрики недоступны без токена"""
+        self.assertEqual(self.client.get(reverse('ops:metrics')).status_code, 403)
+        response = self.client.get(reverse('ops:metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+    
+    def test_tenants_are_bounded_and_processes_merged(self):
+        """Тест что метки компаний ограничены и снимки процессов суммируются"""
+        recorder = querystats.QueryRecorder()
+        for tenant in ['big', 'big', 'small', 'tiny']:
+            metrics.observe_request('companies:dashboard', 200, tenant, 0.01, recorder, session_written=False)
+        metrics.record_cache_lookup('company', True)
+        metrics.record_cache_lookup('company', False)
+        snapshot = metrics.registry.snapshot()
+        
+        text = metrics.render([snapshot, snapshot], top_tenants=1)
+        self.assertIn('purchases_tenant_requests_total{tenant="big"} 4', text)
+        self.assertIn('purchases_tenant_requests_total{tenant="other"} 4', text)
+        self.assertNotIn('tenant="small"', text)
+        self.assertIn('purchases_cache_hit_ratio{namespace="company"} 0.5', text)
+    
+    def test_tenant_series_are_capped_when_recording(self):
+        """Тест что процесс не заводит серии больше чем для MAX_TENANTS компаний"""
+        from django.conf import settings
+        
+        recorder = querystats.QueryRecorder()
+        with override_settings(METRICS={**settings.METRICS, 'MAX_TENANTS': 2}):
+            for tenant in ['a', 'b', 'c', 'd', None, 'a']:
+                metrics.observe_request('companies:dashboard', 200, tenant, 0.01, recorder, session_written=False)
+        tenants = {
+            dict(labels)['tenant']: value
+            for name, labels, value in metrics.registry.snapshot()['counters'] if name == 'tenant_requests_total'
+        }
+        self.assertEqual(tenants, {'a': 2, 'b': 1, 'other': 2, 'none': 1})
+    
+    def test_template_render_time(self):
+        """Тест что инструментированный движок измеряет отрисовку шаблонов"""
+        backend = InstrumentedDjangoTemplates({'NAME': 'test', 'DIRS': [], 'APP_DIRS': False, 'OPTIONS': {}})
+        self.assertEqual(backend.from_string('{{ value }}').render({'value': 'ok'}), 'ok')
+        self.assertIn('purchases_template_render_duration_seconds_count{template="<string>"} 1', self.scrape())
+
+
+@override_settings(COMPANY_CONDITIONAL_GET='on')
+class ConditionalGetTest(TestCase):
+    """Тесты ETag/Last-Modified по поколению данных компании"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=1, members=3, sections=1, seed=11)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.owner = User.objects.get(pk=self.company.owner_id)
+        self.client.force_login(self.owner)
+        self.dashboard_url = reverse('companies:dashboard', kwargs={'company_slug': self.company.slug})
+        self.client.get(self.dashboard_url)
+
+    def assert_not_modified(self, url, etag):
+        with self.assertNumQueries(2):  # сессия и пользователь
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_dashboard_not_modified_until_change(self):
+        """Тест 304 для дашборда и нового ETag после изменения раздела меню"""
+        response = self.client.get(self.dashboard_url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assert_not_modified(self.dashboard_url, etag)
+
+        section = CompanyMenuSection.objects.get(company=self.company)
+        section.title = 'Новый заголовок'
+        section.save()
+        response = self.client.get(self.dashboard_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_api_list_and_detail(self):
+        """Тест 304 для списка и карточки пользователя API v1"""
+        member = CompanyMembership.objects.filter(company=self.company).exclude(user=self.owner).first().user
+        for url in ['/api/v1/users/', f'/api/v1/users/{member.pk}/']:
+            etag = self.client.get(url)['ETag']
+            self.assert_not_modified(url, etag)
+
+        etag = self.client.get('/api/v1/users/')['ETag']
+        member.first_name = 'Пётр'
+        member.save()
+        self.assertEqual(self.client.get('/api/v1/users/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Вход пользователя (last_login) не меняет данные
+        etag = self.client.get('/api/v1/users/')['ETag']
+        member.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get('/api/v1/users/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_variant_and_pending_messages(self):
+        """Тест что ETag зависит от параметров и не выдается при непоказанных сообщениях"""
+        self.assertNotEqual(
+            self.client.get('/api/v1/users/')['ETag'],
+            self.client.get('/api/v1/users/', {'page_size': 1})['ETag'],
+        )
+
+        employee = CompanyMembership.objects.filter(company=self.company, role='employee').first().user
+        self.client.force_login(employee)
+        etag = self.client.get(self.dashboard_url)['ETag']
+        # Нет прав на настройки - сообщение об ошибке и редирект на дашборд
+        self.client.get(reverse('companies:settings', kwargs={'company_slug': self.company.slug}))
+        response = self.client.get(self.dashboard_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.client.get(self.dashboard_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+    @override_settings(COMPANY_CONDITIONAL_GET='auto')
+    def test_auto_mode_disabled_with_local_cache(self):
+        """Тест что с кэшем в памяти процесса условные GET выключены"""
+        response = self.client.get(self.dashboard_url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    @override_settings(COMPANY_CONDITIONAL_GET='auto')
+    def test_shared_cache_sees_change_from_other_process(self):
+        """Тест что с общим кэшем запись через другой воркер делает ETag устаревшим"""
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }):
+            etag = self.client.get(self.dashboard_url)['ETag']
+            self.assert_not_modified(self.dashboard_url, etag)
+            # Отдельный экземпляр бэкенда с тем же хранилищем - кэш другого процесса
+            with mock.patch('companies.cache.cache', FileBasedCache(directory, {})):
+                touch_company_data(self.company.pk)
+            self.assertEqual(self.client.get(self.dashboard_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class MemberExportTest(TestCase):
+    """Тесты потоковой выгрузки участников компании"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=2, members=5, sections=0, seed=12)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.owner = User.objects.get(pk=self.company.owner_id)
+        member = CompanyMembership.objects.filter(company=self.company, role='employee').first().user
+        member.first_name = '=СУММ(A1)'
+        member.save()
+        member.profile.department = 'Снабжение'
+        member.profile.save()
+        self.member = member
+        self.url = reverse('companies:export_members', kwargs={'company_slug': self.company.slug})
+        self.client.force_login(self.owner)
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        """Тест CSV: все участники компании, профиль, роль и флаги прав"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('.csv', response['Content-Disposition'])
+        text = self.content(response).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(text)))
+        self.assertEqual(rows[0], HEADERS)
+        self.assertEqual(len(rows) - 1, CompanyMembership.objects.filter(company=self.company).count())
+
+        row = next(row for row in rows if row[1] == self.member.username)
+        values = dict(zip(HEADERS, row))
+        # Значение, похожее на формулу, экранируется
+        self.assertEqual(values['Имя'], "'=СУММ(A1)")
+        self.assertEqual(values['Подразделение'], 'Снабжение')
+        self.assertEqual(values['Роль'], 'Сотрудник')
+        self.assertEqual(values['Может управлять заказами'], 'да')
+        self.assertEqual(values['Может управлять пользователями'], 'нет')
+
+    def test_xlsx(self):
+        """Тест XLSX: корректный архив, лист читается openpyxl"""
+        from openpyxl import load_workbook
+
+        response = self.client.get(self.url, {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        content = self.content(response)
+        self.assertIsNone(zipfile.ZipFile(io.BytesIO(content)).testzip())
+
+        rows = list(load_workbook(io.BytesIO(content), read_only=True).active.values)
+        self.assertEqual(list(rows[0]), HEADERS)
+        self.assertEqual(len(rows) - 1, CompanyMembership.objects.filter(company=self.company).count())
+        row = dict(zip(HEADERS, next(row for row in rows if row[1] == self.member.username)))
+        self.assertEqual(row['ID пользователя'], self.member.pk)
+        self.assertIs(row['Может управлять заказами'], True)
+        self.assertEqual(row['Имя'], '=СУММ(A1)')
+
+    def test_streams_in_batches(self):
+        """Тест что выгрузка отдается кусками, а не одним блоком"""
+        chunks = list(export_members(self.company, 'csv', chunk_size=2))
+        # Заголовок и по куску на каждые две строки
+        members = CompanyMembership.objects.filter(company=self.company).count()
+        self.assertEqual(len(chunks), 1 + (members + 1) // 2)
+        content = b''.join(export_members(self.company, 'xlsx', chunk_size=2))
+        self.assertIsNone(zipfile.ZipFile(io.BytesIO(content)).testzip())
+
+    def test_requires_admin(self):
+        """Тест что выгрузка доступна только администраторам компании"""
+        self.client.force_login(self.member)
+        response = self.client.get(self.url)
+        self.assertRedirects(
+            response, reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}),
+            fetch_redirect_response=False,
+        )
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(self.url, {'format': 'pdf'}).status_code, 404)
+
+
+class MemberImportTest(TestCase):
+    """Тесты массового импорта участников"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=2, members=4, sections=0, seed=13)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.other_company = Company.objects.get(slug=f'{generator.slug_prefix}1')
+        self.owner = User.objects.get(pk=self.company.owner_id)
+        self.member = CompanyMembership.objects.filter(
+            company=self.company, role='employee').exclude(user=self.owner).first().user
+        self.outsider = CompanyMembership.objects.filter(
+            company=self.other_company).exclude(user_id=self.other_company.owner_id).first().user
+        get_company_statistics(self.company)
+
+    def csv_file(self, text):
+        return io.BytesIO(text.encode('utf-8-sig'))
+
+    def run_import(self, text, **kwargs):
+        return import_members(self.company, self.csv_file(text), 'csv', **kwargs)
+
+    def test_export_round_trip_is_unchanged(self):
+        """Тест что загрузка собственной выгрузки ничего не меняет"""
+        content = b''.join(export_members(self.company, 'csv'))
+        with self.assertNumQueries(3):
+            report = import_members(self.company, io.BytesIO(content), 'csv')
+        members = CompanyMembership.objects.filter(company=self.company).count()
+        self.assertEqual(report.counts['unchanged'], members)
+        self.assertEqual(report.counts['error'], 0)
+
+        content = b''.join(export_members(self.company, 'xlsx'))
+        report = import_members(self.company, io.BytesIO(content), 'xlsx')
+        self.assertEqual(report.counts['unchanged'], members)
+
+    def test_create_add_update(self):
+        """Тест создания, добавления и изменения участников"""
+        report = self.run_import(
+            'username;first_name;last_name;email;department;Роль;is_active\n'
+            'new_one;Анна;Смирнова;anna@example.com;Снабжение;Менеджер;да\n'
+            f'{self.outsider.username};Другое;Имя;;;сотрудник;\n'
+            f'{self.member.username};{self.member.first_name};{self.member.last_name};'
+            f'{self.member.email};Логистика;manager;нет\n'
+        )
+        self.assertEqual(report.counts, {'created': 1, 'added': 1, 'updated': 1, 'unchanged': 0, 'error': 0})
+
+        user = User.objects.get(username='new_one')
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(user.profile.department, 'Снабжение')
+        membership = CompanyMembership.objects.get(company=self.company, user=user)
+        self.assertEqual(membership.role_level, CompanyMembership.ROLE_LEVELS['manager'])
+        self.assertTrue(membership.has_permission(CompanyMembership.PERM_VIEW_REPORTS))
+
+        # Личные данные пользователя другой компании не меняются
+        self.outsider.refresh_from_db()
+        self.assertNotEqual(self.outsider.first_name, 'Другое')
+        self.assertTrue(CompanyMembership.objects.filter(company=self.company, user=self.outsider).exists())
+
+        membership = CompanyMembership.objects.get(company=self.company, user=self.member)
+        self.assertEqual((membership.role, membership.is_active), ('manager', False))
+        self.assertEqual(UserProfile.objects.get(user=self.member).department, 'Логистика')
+
+        # Счетчики и поисковый индекс обновлены без сигналов
+        self.assertEqual(reconcile_statistics(Company.objects.filter(pk=self.company.pk), dry_run=True), [])
+        self.assertEqual([found.username for found in search.search(User.objects.all(), 'Смирнова')], ['new_one'])
+
+        # Приглашение: пароль задается по ссылке, после этого ссылка не действует
+        path = report.invites[0]['path']
+        self.assertEqual(self.client.get(path).status_code, 200)
+        response = self.client.post(path, {'new_password1': 'Zx9-import-pass', 'new_password2': 'Zx9-import-pass'})
+        self.assertRedirects(
+            response, reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}),
+            fetch_redirect_response=False,
+        )
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('Zx9-import-pass'))
+        self.assertRedirects(self.client.get(path), reverse('companies:unified_login'), fetch_redirect_response=False)
+
+    def test_dry_run(self):
+        """Тест что пробный запуск только считает изменения"""
+        text = f'username,role\nnew_two,employee\n{self.member.username},manager\n'
+        users = User.objects.count()
+        report = self.run_import(text, dry_run=True)
+        self.assertEqual((report.counts['created'], report.counts['updated']), (1, 1))
+        self.assertEqual(report.invites, [])
+        self.assertEqual(User.objects.count(), users)
+        self.assertEqual(CompanyMembership.objects.get(company=self.company, user=self.member).role, 'employee')
+
+    def test_errors(self):
+        """Тест ошибок в строках: остальные строки импортируются"""
+        report = self.run_import(
+            'username,email,role,can_view_reports\n'
+            'bad user!,,employee,\n'
+            'ok_user,not-an-email,employee,\n'
+            'ok_user2,,boss,\n'
+            'ok_user3,,owner,\n'
+            'ok_user4,,employee,может быть\n'
+            'ok_user5,,employee,да\n'
+            'ok_user5,,employee,\n'
+        )
+        self.assertEqual(report.counts['created'], 1)
+        self.assertEqual(sorted(error['line'] for error in report.errors), [2, 3, 4, 5, 6, 8])
+        self.assertTrue(CompanyMembership.objects.get(user__username='ok_user5').can_view_reports)
+
+        with self.assertRaises(ImportFileError):
+            list(read_rows(self.csv_file('email\nx@example.com\n'), 'csv'))
+
+    def test_admin_cannot_grant_admin(self):
+        """Тест что администратор не назначает роль администратора"""
+        admin = CompanyMembership.objects.get(company=self.company, user=self.owner)
+        admin.role = 'admin'
+        admin.apply_role_defaults()
+        report = MemberImporter(self.company, actor=admin).run(
+            read_rows(self.csv_file(f'username,role\nnew_admin,admin\n{self.member.username},admin\n'), 'csv')
+        )
+        self.assertEqual(report.counts['error'], 2)
+        self.assertFalse(User.objects.filter(username='new_admin').exists())
+
+    def test_admin_cannot_edit_protected_personal_data(self):
+        """Тест что администратор не меняет личные данные владельца и других администраторов"""
+        admin = CompanyMembership.objects.get(company=self.company, user=self.member)
+        admin.role = 'admin'
+        admin.apply_role_defaults()
+        admin.save()
+        other_admin = CompanyMembership.objects.filter(
+            company=self.company, role='employee').exclude(user=self.owner).exclude(user=self.member).first()
+        other_admin.role = 'admin'
+        other_admin.apply_role_defaults()
+        other_admin.save()
+        employee = CompanyMembership.objects.filter(company=self.company, role='employee').first().user
+        owner_email = self.owner.email
+
+        report = MemberImporter(self.company, actor=admin).run(read_rows(self.csv_file(
+            'username,email,first_name\n'
+            f'{self.owner.username},attacker@evil.test,Hacked\n'
+            f'{other_admin.user.username},attacker2@evil.test,Hacked\n'
+            f'{employee.username},employee@example.com,Новое\n'
+        ), 'csv'))
+        self.assertEqual((report.counts['error'], report.counts['updated']), (2, 1))
+        self.owner.refresh_from_db()
+        self.assertEqual((self.owner.email, self.owner.first_name != 'Hacked'), (owner_email, True))
+        self.assertNotEqual(User.objects.get(pk=other_admin.user_id).first_name, 'Hacked')
+        self.assertEqual(User.objects.get(pk=employee.pk).first_name, 'Новое')
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Тест что число запросов зависит от пачек, а не от строк"""
+        def queries(count, offset):
+            text = 'username,email\n' + ''.join(
+                f'bulk_{offset + index},bulk_{offset + index}@example.com\n' for index in range(count)
+            )
+            with CaptureQueriesContext(connection) as context:
+                self.run_import(text)
+            return len(context)
+
+        self.assertEqual(queries(3, 0), queries(30, 100))
+
+    def test_api_endpoint(self):
+        """Тест загрузки файла через API v1"""
+        self.client.force_login(self.owner)
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+        upload = SimpleUploadedFile('members.csv', b'username,role\napi_user,employee\n', 'text/csv')
+        response = self.client.post('/api/v1/users/import/', {'file': upload, 'dry_run': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['dry_run'])
+        self.assertEqual(response.json()['counts']['created'], 1)
+
+        upload = SimpleUploadedFile('members.csv', b'username,role\napi_user,employee\n', 'text/csv')
+        response = self.client.post('/api/v1/users/import/', {'file': upload})
+        self.assertTrue(response.json()['invites'][0]['url'].startswith('http://testserver/companies/'))
+
+        upload = SimpleUploadedFile('members.txt', b'username\n', 'text/plain')
+        self.assertEqual(self.client.post('/api/v1/users/import/', {'file': upload}).status_code, 400)
+
+        self.client.force_login(self.member)
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+        upload = SimpleUploadedFile('members.csv', b'username\nx_user\n', 'text/csv')
+        self.assertEqual(self.client.post('/api/v1/users/import/', {'file': upload}).status_code, 403)
+
+
+class FragmentCacheTest(TestCase):
+    """Тесты кэша фрагментов боковой панели"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=1, members=4, sections=2, seed=14)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.owner = User.objects.get(pk=self.company.owner_id)
+        self.dashboard_url = reverse('companies:dashboard', kwargs={'company_slug': self.company.slug})
+        self.settings_url = reverse('companies:settings', kwargs={'company_slug': self.company.slug})
+        self.client.force_login(self.owner)
+        self.client.get(self.dashboard_url)
+
+    def sidebar_renders(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        rendered = [template.name for template in response.templates]
+        return response, rendered.count('companies/sidebar.html'), len(context)
+
+    def test_sidebar_reused_and_invalidated(self):
+        """Тест что панель берется из кэша до изменения раздела меню"""
+        response, renders, _ = self.sidebar_renders(self.dashboard_url)
+        self.assertEqual(renders, 0)
+        self.assertContains(response, 'Раздел 1')
+        self.assertContains(response, 'sidebar-link active')
+
+        section = CompanyMenuSection.objects.get(company=self.company, title='Раздел 1')
+        section.title = 'Закупки 2025'
+        section.save()
+        response, renders, _ = self.sidebar_renders(self.dashboard_url)
+        self.assertEqual(renders, 1)
+        self.assertContains(response, 'Закупки 2025')
+        self.assertEqual(self.sidebar_renders(self.dashboard_url)[1], 0)
+
+        CompanySettings.objects.get_or_create(company=self.company)[0].save()
+        self.assertEqual(self.sidebar_renders(self.dashboard_url)[1], 1)
+
+    def test_variants(self):
+        """Тест отдельных фрагментов для активного пункта и роли"""
+        manage_menu_url = reverse('companies:manage_menu', kwargs={'company_slug': self.company.slug})
+        response, renders, _ = self.sidebar_renders(self.settings_url)
+        self.assertEqual(renders, 1)
+        self.assertContains(response, manage_menu_url)
+
+        viewer = CompanyMembership.objects.filter(company=self.company, is_active=True).exclude(user=self.owner).first()
+        viewer.role = 'viewer'
+        viewer.save()
+        self.client.force_login(viewer.user)
+        response, renders, _ = self.sidebar_renders(self.dashboard_url)
+        self.assertEqual(renders, 1)
+        self.assertNotContains(response, manage_menu_url)
+
+    def test_template_version_in_key(self):
+        """Тест что другая версия шаблона не использует старый фрагмент"""
+        from . import fragments
+
+        self.sidebar_renders(self.dashboard_url)
+        fragments._versions['companies/sidebar.html'] = 'other'
+        try:
+            self.assertEqual(self.sidebar_renders(self.dashboard_url)[1], 1)
+        finally:
+            fragments._versions.clear()
+
+
+PRODUCTION_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'DIRS': [Path(__file__).resolve().parent.parent / 'templates'],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        'loaders': [('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ])],
+    },
+}]
+
+
+class WarmTemplatesTest(TestCase):
+    """Тесты прогрева шаблонов"""
+
+    def test_template_names(self):
+        """Тест что берутся шаблоны проекта и приложений, но не сторонних пакетов"""
+        from .warmup import template_names
+
+        names = template_names()
+        self.assertIn('base.html', names)
+        self.assertIn('companies/sidebar.html', names)
+        self.assertNotIn('admin/base.html', names)
+        self.assertIn('admin/base.html', template_names(include_third_party=True))
+
+    @override_settings(TEMPLATES=PRODUCTION_TEMPLATES)
+    def test_warm_fills_cached_loader(self):
+        """Тест что после прогрева шаблоны берутся из кэша загрузчика"""
+        from django.template import engines
+        from .warmup import is_cached, warm_templates
+
+        self.assertTrue(is_cached())
+        results = warm_templates()
+        self.assertEqual([name for name, _, error in results if error], [])
+        loader = engines.all()[0].engine.template_loaders[0]
+        self.assertEqual(len(loader.get_template_cache), len(results))
+
+        out = io.StringIO()
+        call_command('warm_templates', stdout=out)
+        self.assertIn(f'Скомпилировано шаблонов: {len(results)}', out.getvalue())
+
+
+class SQLiteProductionModeTest(TestCase):
+    """Тесты настроек SQLite для SQLITE_MODE=production"""
+
+    def test_connection_pragmas_and_immediate_transactions(self):
+        """Тест что PRAGMA задаются при подключении, а транзакция сразу берет блокировку записи"""
+        import sqlite3
+        from django.conf import settings
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'production.sqlite3'
+            wrapper = DatabaseWrapper(
+                {**connection.settings_dict, 'NAME': str(path), 'OPTIONS': settings.SQLITE_PRODUCTION_OPTIONS},
+                alias='sqlite_production',
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store'):
+                        cursor.execute(f'PRAGMA {name}')
+                        pragmas[name] = cursor.fetchone()[0]
+                    cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+                self.assertEqual(pragmas['journal_mode'], 'wal')
+                self.assertEqual(pragmas['synchronous'], 1)  # NORMAL
+                self.assertEqual(pragmas['busy_timeout'], settings.SQLITE_PRAGMAS['busy_timeout'])
+                self.assertEqual(pragmas['cache_size'], settings.SQLITE_PRAGMAS['cache_size'])
+                self.assertEqual(pragmas['temp_store'], 2)  # MEMORY
+
+                # Так начинает транзакцию transaction.atomic()
+                wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                other = sqlite3.connect(path, timeout=0)
+                try:
+                    with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+                        other.execute('BEGIN IMMEDIATE')
+                finally:
+                    other.close()
+                wrapper.rollback()
+                wrapper.set_autocommit(True)
+            finally:
+                wrapper.close()
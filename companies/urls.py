@@ -20,6 +20,9 @@ urlpatterns = [
     # Вход в конкретную компанию
     path('<slug:company_slug>/', views.company_login, name='login'),
     
+    # Принятие приглашения (пользователи из импорта)
+    path('<slug:company_slug>/invite/<str:uidb64>/<str:token>/', views.accept_invite, name='accept_invite'),
+    
     # Дашборд компании
     path('<slug:company_slug>/dashboard/', views.company_dashboard, name='dashboard'),
     
@@ -28,6 +31,7 @@ urlpatterns = [
     
     # Управление пользователями компании
     path('<slug:company_slug>/users/', views.company_users_list, name='users_list'),
+    path('<slug:company_slug>/users/export/', views.export_company_members, name='export_members'),
     path('<slug:company_slug>/users/invite/', views.invite_user, name='invite_user'),
     path('<slug:company_slug>/users/<int:user_id>/edit/', views.edit_user_membership, name='edit_user'),
     path('<slug:company_slug>/users/<int:user_id>/remove/', views.remove_user_from_company, name='remove_user'),
@@ -1,13 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
+from django.contrib.auth.forms import SetPasswordForm
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.db import transaction
 from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
 from django.views.decorators.csrf import csrf_exempt
 
 from .models import Company, CompanyMembership, CompanySettings, CompanyMenuSection
+from .cache import get_active_company, get_active_membership, get_menu_sections
+from .conditional import company_conditional
+from .export import EXPORT_FORMATS, export_filename, export_members
+from .statistics import get_company_statistics
+from .querystats import query_budget
+from .session import remember_company, make_auto_login_token, read_auto_login_token, read_invite_token
 from .forms import (CompanyRegistrationForm, CompanyLoginForm, UnifiedLoginForm, 
                    InviteUserForm, EditMembershipForm, MenuSectionForm, MenuSectionQuickForm)
 
@@ -122,6 +131,7 @@ def company_register(request):
                     # Создаем компанию (настройки и членство владельца создаются автоматически через сигналы)
                     company = Company.objects.create(
                         name=form.cleaned_data['company_name'],
+                        slug=form.cleaned_data['company_slug'],
                         company_type=form.cleaned_data['company_type'],
                         description=form.cleaned_data['description'],
                         phone=form.cleaned_data['phone'],
@@ -134,11 +144,11 @@ def company_register(request):
                     
                     # Вместо аутентификации в том же запросе, создаем сессию с данными для автовхода
                     if not request.user.is_authenticated:
-                        # Сохраняем данные для автоматического входа в новой сессии
+                        # Сохраняем данные для автоматического входа в новой сессии.
+                        # Храним только подписанный токен: пароль не должен попадать
+                        # в сессию (в режиме signed_cookies она читается клиентом)
                         request.session.flush()  # Очищаем текущую сессию
-                        request.session['auto_login_username'] = form.cleaned_data['username']
-                        request.session['auto_login_password'] = form.cleaned_data['password']
-                        request.session['auto_login_company_slug'] = company.slug
+                        request.session['auto_login_token'] = make_auto_login_token(user, company)
                         request.session.save()
                     
                     messages.success(request, f'Компания "{company.name}" успешно зарегистрирована!')
@@ -169,8 +179,7 @@ def company_login(request, company_slug):
                 )
                 login(request, user)
                 # Сохраняем текущую компанию в сессии
-                request.session['current_company_id'] = str(company.id)
-                request.session['current_company_slug'] = company.slug
+                remember_company(request.session, company)
                 
                 messages.success(request, f'Добро пожаловать в {company.name}!')
                 return redirect('companies:dashboard', company_slug=company.slug)
@@ -187,44 +196,35 @@ def company_login(request, company_slug):
 
 
 @login_required
+@company_conditional
+@query_budget(10)
 def company_dashboard(request, company_slug):
     """Дашборд компании"""
-    company = get_object_or_404(Company, slug=company_slug, is_active=True)
+    # Компания и членство обычно уже определены CompanyMiddleware
+    company = get_active_company(company_slug)
+    if not company:
+        raise Http404('Компания не найдена')
     
     # Проверяем доступ пользователя к компании
-    try:
-        membership = CompanyMembership.objects.get(
-            company=company, user=request.user, is_active=True
-        )
-    except CompanyMembership.DoesNotExist:
+    membership = get_active_membership(company, request.user)
+    if not membership:
         messages.error(request, 'У вас нет доступа к этой компании.')
         return redirect('companies:select')
     
-    # Обновляем текущую компанию в сессии
-    request.session['current_company_id'] = str(company.id)
-    request.session['current_company_slug'] = company.slug
-    
-    # Подсчитываем статистику
-    active_users_count = CompanyMembership.objects.filter(
-        company=company, 
-        is_active=True
-    ).count()
+    # Обновляем текущую компанию в сессии (только если она изменилась)
+    remember_company(request.session, company)
     
-    # Получаем пользовательские разделы меню, доступные текущему пользователю
-    custom_menu_sections = []
-    all_menu_sections = CompanyMenuSection.objects.filter(
-        company=company, 
-        is_active=True
-    ).order_by('order', 'title')
+    # Статистика читается из одной строки материализованных счетчиков
+    statistics = get_company_statistics(company)
     
-    for section in all_menu_sections:
-        if section.user_can_access(request.user):
-            custom_menu_sections.append(section)
+    # Разделы меню, доступные роли; читаются, только если боковой панели нет в кэше фрагментов
+    custom_menu_sections = SimpleLazyObject(lambda: get_menu_sections(company, membership.role_level))
     
     context = {
         'company': company,
         'membership': membership,
-        'active_users_count': active_users_count,
+        'active_users_count': statistics.active_members_count,
+        'statistics': statistics,
         'custom_menu_sections': custom_menu_sections,
     }
     return render(request, 'companies/dashboard.html', context)
@@ -240,7 +240,7 @@ def company_settings_view(request, company_slug):
         membership = CompanyMembership.objects.get(
             company=company, user=request.user, is_active=True
         )
-        if membership.role not in ['owner', 'admin']:
+        if not membership.has_full_admin_rights():
             messages.error(request, 'У вас нет прав для изменения настроек компании.')
             return redirect('companies:dashboard', company_slug=company.slug)
     except CompanyMembership.DoesNotExist:
@@ -272,7 +272,7 @@ def company_users_list(request, company_slug):
         current_membership = CompanyMembership.objects.get(
             company=company, user=request.user, is_active=True
         )
-        if not current_membership.can_manage_users:
+        if not current_membership.has_permission(CompanyMembership.PERM_MANAGE_USERS):
             messages.error(request, 'У вас нет прав для управления пользователями.')
             return redirect('companies:dashboard', company_slug=company.slug)
     except CompanyMembership.DoesNotExist:
@@ -290,6 +290,36 @@ def company_users_list(request, company_slug):
     return render(request, 'companies/users_list.html', context)
 
 
+@login_required
+def export_company_members(request, company_slug):
+    """Потоковая выгрузка участников компании в CSV или XLSX"""
+    company = get_active_company(company_slug)
+    if not company:
+        raise Http404('Компания не найдена')
+    
+    membership = get_active_membership(company, request.user)
+    if not membership:
+        messages.error(request, 'У вас нет доступа к этой компании.')
+        return redirect('companies:select')
+    if not membership.has_full_admin_rights():
+        messages.error(request, 'У вас нет прав для выгрузки участников.')
+        return redirect('companies:dashboard', company_slug=company.slug)
+    
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise Http404('Неизвестный формат выгрузки')
+    
+    response = StreamingHttpResponse(
+        export_members(company, export_format),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(company, export_format)}"'
+    # Выгрузка не кэшируется и не буферизуется прокси
+    response['Cache-Control'] = 'private, no-store'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def invite_user(request, company_slug):
     """Приглашение нового пользователя в компанию"""
@@ -362,7 +392,7 @@ def edit_user_membership(request, company_slug, user_id):
         current_membership = CompanyMembership.objects.get(
             company=company, user=request.user, is_active=True
         )
-        if not current_membership.can_manage_users:
+        if not current_membership.has_permission(CompanyMembership.PERM_MANAGE_USERS):
             messages.error(request, 'У вас нет прав для редактирования пользователей.')
             return redirect('companies:users_list', company_slug=company.slug)
     except CompanyMembership.DoesNotExist:
@@ -377,8 +407,9 @@ def edit_user_membership(request, company_slug, user_id):
     )
     
     # Проверяем, может ли текущий пользователь редактировать этого пользователя
-    if (current_membership.role == 'admin' and 
-        membership_to_edit.role in ['owner', 'admin']):
+    admin_level = CompanyMembership.ROLE_LEVELS['admin']
+    if (current_membership.role_level == admin_level and 
+        membership_to_edit.role_level >= admin_level):
         messages.error(request, 'Вы не можете редактировать пользователей с ролью владельца или админа.')
         return redirect('companies:users_list', company_slug=company.slug)
     
@@ -421,7 +452,7 @@ def remove_user_from_company(request, company_slug, user_id):
         current_membership = CompanyMembership.objects.get(
             company=company, user=request.user, is_active=True
         )
-        if not current_membership.can_manage_users:
+        if not current_membership.has_permission(CompanyMembership.PERM_MANAGE_USERS):
             messages.error(request, 'У вас нет прав для удаления пользователей.')
             return redirect('companies:users_list', company_slug=company.slug)
     except CompanyMembership.DoesNotExist:
@@ -439,12 +470,13 @@ def remove_user_from_company(request, company_slug, user_id):
         return redirect('companies:users_list', company_slug=company.slug)
     
     # Проверяем ограничения
-    if membership_to_remove.role == 'owner':
+    if membership_to_remove.role_level >= CompanyMembership.ROLE_LEVELS['owner']:
         messages.error(request, 'Нельзя удалить владельца компании.')
         return redirect('companies:users_list', company_slug=company.slug)
     
-    if (current_membership.role == 'admin' and 
-        membership_to_remove.role == 'admin'):
+    admin_level = CompanyMembership.ROLE_LEVELS['admin']
+    if (current_membership.role_level == admin_level and 
+        membership_to_remove.role_level == admin_level):
         messages.error(request, 'Админ не может удалять других админов.')
         return redirect('companies:users_list', company_slug=company.slug)
     
@@ -688,24 +720,47 @@ def toggle_menu_section(request, company_slug, section_id):
 
 def auto_login(request):
     """Автоматический вход после регистрации компании"""
-    # Получаем данные автовхода из сессии
-    username = request.session.get('auto_login_username')
-    password = request.session.get('auto_login_password')
-    company_slug = request.session.get('auto_login_company_slug')
-    
-    if username and password and company_slug:
-        # Очищаем данные автовхода из сессии
-        request.session.pop('auto_login_username', None)
-        request.session.pop('auto_login_password', None)
-        request.session.pop('auto_login_company_slug', None)
-        
-        # Аутентифицируем пользователя
-        user = authenticate(username=username, password=password)
+    # Получаем и сразу удаляем токен автовхода из сессии
+    token = request.session.pop('auto_login_token', None)
+    payload = read_auto_login_token(token) if token else None
+    
+    if payload:
+        user = User.objects.filter(pk=payload['user_id'], is_active=True).first()
         if user:
-            login(request, user)
+            login(request, user, backend='django.contrib.auth.backends.ModelBackend')
             messages.success(request, 'Добро пожаловать! Регистрация завершена успешно.')
-            return redirect('companies:dashboard', company_slug=company_slug)
+            return redirect('companies:dashboard', company_slug=payload['company_slug'])
     
     # Если что-то пошло не так, возвращаем на главную
     messages.error(request, 'Ошибка автоматического входа. Попробуйте войти вручную.')
     return redirect('companies:unified_login')
+
+
+def accept_invite(request, company_slug, uidb64, token):
+    """Принятие приглашения: пользователь из импорта или после сброса пароля задает себе пароль"""
+    company = get_active_company(company_slug)
+    if not company:
+        raise Http404('Компания не найдена')
+    
+    user = read_invite_token(uidb64, token)
+    if user is None or not get_active_membership(company, user):
+        messages.error(request, 'Ссылка приглашения недействительна или устарела.')
+        return redirect('companies:unified_login')
+    
+    if request.method == 'POST':
+        form = SetPasswordForm(user, request.POST)
+        if form.is_valid():
+            form.save()
+            login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+            remember_company(request.session, company)
+            messages.success(request, f'Добро пожаловать в {company.name}!')
+            return redirect('companies:dashboard', company_slug=company.slug)
+    else:
+        form = SetPasswordForm(user)
+    
+    context = {
+        'company': company,
+        'form': form,
+        'invited_user': user,
+    }
+    return render(request, 'companies/accept_invite.html', context)
@@ -0,0 +1,92 @@
+"""
+Прогрев шаблонов: компиляция всех шаблонов проекта до первого запроса.
+
+С кэширующим загрузчиком (TEMPLATE_PROFILE=production) каждый шаблон
+разбирается один раз на процесс - но при первом обращении к нему, то есть
+за счет первых запросов холодного воркера. warm_templates() загружает все
+шаблоны из DIRS и каталогов templates/ приложений проекта заранее; её
+вызывает purchases_project.wsgi при WARM_TEMPLATES. Прогревать нужно в том
+процессе, который обслуживает запросы (с gunicorn --preload - в мастере до
+fork), команда warm_templates лишь проверяет шаблоны и показывает время.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders import cached
+from django.template.utils import get_app_template_dirs
+
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SUFFIXES = {'.html', '.txt', '.xml'}
+
+
+def template_dirs(include_third_party=False):
+    """Каталоги шаблонов: DIRS и templates/ приложений (сторонних - по запросу)"""
+    dirs = []
+    for backend in engines.all():
+        if isinstance(backend, DjangoTemplates):
+            dirs.extend(Path(directory) for directory in backend.engine.dirs)
+    base_dir = Path(settings.BASE_DIR).resolve()
+    for directory in get_app_template_dirs('templates'):
+        directory = Path(directory).resolve()
+        if include_third_party or base_dir in directory.parents:
+            dirs.append(directory)
+    return list(dict.fromkeys(dirs))
+
+
+def template_names(include_third_party=False):
+    """Имена всех шаблонов в каталогах template_dirs() без повторов"""
+    names = []
+    for directory in template_dirs(include_third_party):
+        for path in sorted(directory.rglob('*')):
+            if path.is_file() and path.suffix in TEMPLATE_SUFFIXES:
+                names.append(path.relative_to(directory).as_posix())
+    return list(dict.fromkeys(names))
+
+
+def is_cached():
+    """Сохраняют ли движки скомпилированные шаблоны (кэширующий загрузчик)"""
+    return any(
+        isinstance(loader, cached.Loader)
+        for backend in engines.all() if isinstance(backend, DjangoTemplates)
+        for loader in backend.engine.template_loaders
+    )
+
+
+def warm_templates(names=None, include_third_party=False):
+    """
+    Компилирует шаблоны во всех движках Django. Возвращает список
+    (имя, секунды, ошибка или None).
+    """
+    if names is None:
+        names = template_names(include_third_party)
+    results = []
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for name in names:
+            started = time.perf_counter()
+            try:
+                backend.get_template(name)
+                error = None
+            except Exception as exc:  # шаблон с ошибкой не должен мешать запуску воркера
+                error = f'{exc.__class__.__name__}: {exc}'
+            results.append((name, time.perf_counter() - started, error))
+    return results
+
+
+def warm_on_startup():
+    """Прогрев при запуске воркера (WSGI/ASGI), если включен WARM_TEMPLATES"""
+    if not getattr(settings, 'WARM_TEMPLATES', False):
+        return
+    started = time.perf_counter()
+    results = warm_templates()
+    for name, _, error in results:
+        if error:
+            logger.warning('Шаблон %s не скомпилирован: %s', name, error)
+    logger.info('Прогрето шаблонов: %d за %.1f мс', len(results), (time.perf_counter() - started) * 1000)
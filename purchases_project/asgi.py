@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'purchases_project.settings')
 
 application = get_asgi_application()
+
+# Компилируем шаблоны до первого запроса (WARM_TEMPLATES, см. companies.warmup)
+from companies.warmup import warm_on_startup  # noqa: E402
+
+warm_on_startup()
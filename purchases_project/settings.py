@@ -75,14 +75,33 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'companies.middleware.QueryStatsMiddleware',  # Учет SQL-запросов (QUERY_STATS_ENABLED)
+    'companies.middleware.MetricsMiddleware',  # Метрики Prometheus (METRICS_ENABLED)
     'companies.middleware.CompanyMiddleware',  # Middleware для работы с компаниями
     'companies.middleware.CompanyContextMiddleware',  # Контекст компании в шаблонах
+    'companies.middleware.ProfilerMiddleware',  # Семплирующий профилировщик (PROFILER_ENABLED)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'purchases_project.urls'
 
+# TEMPLATE_PROFILE выбирает настройки шаблонов:
+#   debug      - загрузчики Django по умолчанию (измененные шаблоны перечитываются),
+#                контекст-процессор debug
+#   production - явный кэширующий загрузчик (каждый шаблон разбирается один раз
+#                на процесс) и только нужные в работе контекст-процессоры;
+#                при WARM_TEMPLATES воркер компилирует все шаблоны проекта
+#                при запуске (purchases_project.wsgi, команда warm_templates)
+
+TEMPLATE_PROFILE = env('TEMPLATE_PROFILE', default='debug' if DEBUG else 'production')
+
+TEMPLATE_CONTEXT_PROCESSORS = [
+    'django.template.context_processors.request',
+    'django.contrib.auth.context_processors.auth',
+    'django.contrib.messages.context_processors.messages',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -91,28 +110,195 @@ TEMPLATES = [
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
+                *TEMPLATE_CONTEXT_PROCESSORS,
             ],
         },
     },
 ]
 
+if TEMPLATE_PROFILE == 'production':
+    # loaders нельзя задать вместе с APP_DIRS
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS'] = {
+        'context_processors': TEMPLATE_CONTEXT_PROCESSORS,
+        'debug': False,
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    }
+
+WARM_TEMPLATES = env.bool('WARM_TEMPLATES', default=TEMPLATE_PROFILE == 'production')
+
 WSGI_APPLICATION = 'purchases_project.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLITE_MODE выбирает режим работы SQLite:
+#   default    - настройки SQLite по умолчанию (журнал отката, DEFERRED-транзакции)
+#   production - для нескольких воркеров: WAL (читатели не блокируют писателя),
+#                synchronous=NORMAL, ожидание блокировки вместо "database is
+#                locked", mmap и кэш страниц; PRAGMA выполняются при каждом
+#                подключении. Транзакции начинаются с BEGIN IMMEDIATE: блокировка
+#                записи берется сразу, а не при первой записи внутри транзакции,
+#                когда SQLite уже не может дождаться её и сразу возвращает ошибку.
+# Сравнение режимов под нагрузкой - команда benchmark_sqlite.
+
+SQLITE_MODE = env('SQLITE_MODE', default='default' if DEBUG else 'production')
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': env.int('SQLITE_BUSY_TIMEOUT', default=5000),  # мс
+    'mmap_size': env.int('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024),  # байт
+    'cache_size': env.int('SQLITE_CACHE_SIZE', default=-20000),  # отрицательное - в КиБ
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+    'transaction_mode': 'IMMEDIATE',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS if SQLITE_MODE == 'production' else {},
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Кэш по умолчанию (locmem) свой у каждого процесса: инвалидация после записи
+# не доходит до других воркеров. Для нескольких воркеров нужен общий CACHE_URL
+# (redis://, memcached://); с locmem кэш тенанта живет COMPANY_LOCAL_CACHE_TIMEOUT.
+
+# Время жизни кэша разрешения компаний и членств (секунды)
+COMPANY_CACHE_TIMEOUT = env.int('COMPANY_CACHE_TIMEOUT', default=300)
+COMPANY_LOCAL_CACHE_TIMEOUT = env.int('COMPANY_LOCAL_CACHE_TIMEOUT', default=5)
+
+# Условные GET (ETag/Last-Modified) по поколению данных компании (companies.conditional):
+#   auto - только с общим CACHE_URL: с locmem воркер не видит изменений, сделанных
+#          через другие воркеры, и отдавал бы 304 на устаревшие данные
+#   on   - всегда (один процесс или общий кэш)
+#   off  - никогда
+COMPANY_CONDITIONAL_GET = env('COMPANY_CONDITIONAL_GET', default='auto')
+
+# Время жизни кэша отрисованных фрагментов шаблонов компании (боковая панель).
+# Фрагменты инвалидируются поколением компании, таймаут лишь ограничивает объем кэша
+COMPANY_FRAGMENT_CACHE_TIMEOUT = env.int('COMPANY_FRAGMENT_CACHE_TIMEOUT', default=3600)
+
+
+# Журнал событий компаний (companies.events): пишется фоновым потоком пачками
+COMPANY_EVENT_LOG = {
+    'LEVEL': env('EVENT_LOG_LEVEL', default='INFO'),
+    # 'db' только не на SQLite: запись из фонового потока конкурирует за блокировку записи
+    'SINKS': env.list('EVENT_LOG_SINKS', default=['jsonl']),
+    'JSONL_PATH': env('EVENT_LOG_PATH', default=str(BASE_DIR / 'logs' / 'events.jsonl')),
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'QUEUE_SIZE': 10000,
+}
+
+
+# Учет SQL-запросов по представлениям (companies.querystats): статистика
+# копится в памяти процесса и сбрасывается в DIR раз в FLUSH_INTERVAL секунд
+QUERY_STATS = {
+    'ENABLED': env.bool('QUERY_STATS_ENABLED', default=False),
+    'DIR': env('QUERY_STATS_DIR', default=str(BASE_DIR / 'logs' / 'query_stats')),
+    'FLUSH_INTERVAL': 10.0,
+    'BUDGET_ACTION': env('QUERY_BUDGET_ACTION', default='log'),
+}
+
+
+# Семплирующий профилировщик запросов (companies.profiler): профилируются
+# запросы выбранных компаний, имен URL (fnmatch) и доля SAMPLE_RATE остальных;
+# стеки запросов медленнее SLOW_MS сохраняются в DIR, отчет - profile_report
+PROFILER = {
+    'ENABLED': env.bool('PROFILER_ENABLED', default=False),
+    'COMPANIES': env.list('PROFILER_COMPANIES', default=[]),
+    'URL_NAMES': env.list('PROFILER_URL_NAMES', default=[]),
+    'SAMPLE_RATE': env.float('PROFILER_SAMPLE_RATE', default=0.0),
+    'INTERVAL': env.float('PROFILER_INTERVAL', default=0.005),
+    'SLOW_MS': env.int('PROFILER_SLOW_MS', default=500),
+    'DIR': env('PROFILER_DIR', default=str(BASE_DIR / 'logs' / 'profiles')),
+    'MAX_FILES': env.int('PROFILER_MAX_FILES', default=200),
+}
+
+
+# Метрики Prometheus (companies.metrics) на /ops/metrics/: процессы сохраняют
+# снимки в DIR, эндпоинт их суммирует. Доступ по заголовку
+# "Authorization: Bearer <TOKEN>", без токена - только для сотрудников
+METRICS = {
+    'ENABLED': env.bool('METRICS_ENABLED', default=False),
+    'DIR': env('METRICS_DIR', default=str(BASE_DIR / 'logs' / 'metrics')),
+    'FLUSH_INTERVAL': 5.0,
+    'TOP_TENANTS': env.int('METRICS_TOP_TENANTS', default=20),
+    # Сколько компаний процесс учитывает отдельными сериями, остальные - "other"
+    'MAX_TENANTS': env.int('METRICS_MAX_TENANTS', default=100),
+    'TOKEN': env('METRICS_TOKEN', default=''),
+}
+
+if METRICS['ENABLED']:
+    # Замер времени отрисовки шаблонов
+    TEMPLATES[0]['BACKEND'] = 'companies.template_backends.InstrumentedDjangoTemplates'
+
+
+# Sessions and messages
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/#configuring-the-session-engine
+#
+# SESSION_MODE выбирает хранилище сессий:
+#   db             - таблица django_session (по умолчанию)
+#   cached_db      - кэш с записью в БД (чтение из кэша)
+#   cache          - только кэш (требует общего CACHE_URL для нескольких воркеров)
+#   signed_cookies - подписанная cookie, сервер ничего не хранит
+
+SESSION_MODE = env('SESSION_MODE', default='db')
+
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_MODE]
+
+if SESSION_MODE == 'signed_cookies':
+    # Сообщения храним в отдельной cookie, чтобы не раздувать cookie сессии
+    MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+else:
+    # Сообщения сначала пишутся в cookie и попадают в сессию только при переполнении
+    MESSAGE_STORAGE = 'django.contrib.messages.storage.fallback.FallbackStorage'
+
+
+# Email
+# https://docs.djangoproject.com/en/5.2/topics/email/
+#
+# Письма со ссылками для нового пароля (массовый сброс паролей в API).
+# В режиме отладки письма выводятся в консоль
+
+EMAIL_BACKEND = env(
+    'EMAIL_BACKEND',
+    default='django.core.mail.backends.console.EmailBackend' if DEBUG else 'django.core.mail.backends.smtp.EmailBackend',
+)
+EMAIL_HOST = env('EMAIL_HOST', default='localhost')
+EMAIL_PORT = env.int('EMAIL_PORT', default=25)
+EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', default=False)
+DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='webmaster@localhost')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -159,9 +345,29 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
+# JSON API: API_JSON=orjson - рендерер и парсер на orjson (api.renderers,
+# api.parsers; без установленного orjson работают как стандартные),
+# API_JSON=stdlib - стандартные JSONRenderer/JSONParser DRF
+API_JSON = env('API_JSON', default='orjson')
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    'DEFAULT_RENDERER_CLASSES': [
+        {
+            'orjson': 'api.renderers.ORJSONRenderer',
+            'stdlib': 'rest_framework.renderers.JSONRenderer',
+        }[API_JSON],
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        {
+            'orjson': 'api.parsers.ORJSONParser',
+            'stdlib': 'rest_framework.parsers.JSONParser',
+        }[API_JSON],
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
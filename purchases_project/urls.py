@@ -44,6 +44,9 @@ urlpatterns = [
     
     # API аутентификация
     path('api-auth/', include('rest_framework.urls')),
+    
+    # Служебные эндпоинты для сотрудников (статистика, метрики)
+    path('ops/', include('companies.ops_urls')),
 ]
 
 # Добавляем статические файлы для разработки
@@ -8,6 +8,10 @@ export interface User {
   is_authenticated: boolean
   is_active?: boolean
   date_joined?: string
+  // Поля строки списка API v1 (/api/v1/users/)
+  full_name?: string
+  position?: string | null
+  department_name?: string | null
 }
 
 // Типы компании
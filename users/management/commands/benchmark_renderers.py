@@ -0,0 +1,95 @@
+import io
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.contrib.auth.models import User
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.parsers import ORJSONParser
+from api.renderers import ORJSONRenderer, orjson
+from api.v1.users.serializers import UserListSerializer
+from companies.loadgen import LoadDataGenerator
+from companies.models import CompanyMembership
+from users.serializers import UserSerializer
+
+
+RENDERERS = [('drf', JSONRenderer(), JSONParser()), ('orjson', ORJSONRenderer(), ORJSONParser())]
+
+
+def _timed(function, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 2)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает стандартный JSONRenderer/JSONParser DRF с orjson на больших '
+        'списках пользователей и членств'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Строк в каждом списке')
+        parser.add_argument('--iterations', type=int, default=20, help='Замеров на случай')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson не установлен, ORJSONRenderer работает как JSONRenderer'))
+
+        # Данные генерируются в отдельной тестовой базе
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            payloads = self.build_payloads(options['rows'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(
+            f'{"список":<14}{"рендерер":<10}{"рендер, мс":>12}{"разбор, мс":>12}{"байт":>11}{"ускорение":>11}'
+        )
+        for name, data in payloads.items():
+            expected = None
+            baseline_ms = None
+            for renderer_name, renderer, parser in RENDERERS:
+                body = renderer.render(data)
+                # Результат должен совпадать со стандартным рендерером
+                if expected is None:
+                    expected = json.loads(body)
+                elif json.loads(body) != expected:
+                    self.stderr.write(f'  {name}: ответ {renderer_name} отличается от drf')
+
+                render_ms = _timed(lambda: renderer.render(data), options['iterations'])
+                parse_ms = _timed(lambda: parser.parse(io.BytesIO(body)), options['iterations'])
+                baseline_ms = baseline_ms or render_ms
+                self.stdout.write(
+                    f'{name:<14}{renderer_name:<10}{render_ms:>12}{parse_ms:>12}{len(body):>11}'
+                    f'{baseline_ms / render_ms:>10.1f}x'
+                )
+
+    def build_payloads(self, rows):
+        self.stdout.write(f'Генерация данных: {rows} пользователей...')
+        LoadDataGenerator(companies=1, members=rows, sections=0, prefix='bench').run()
+        users = User.objects.order_by('pk').select_related('profile')[:rows]
+        return {
+            # Строки из values(): datetime и типы БД как есть
+            'users_values': list(UserListSerializer.list_rows(User.objects.order_by('pk'))[:rows]),
+            # Вывод ModelSerializer: вложенный профиль, даты уже строками
+            'users_nested': UserSerializer(users, many=True).data,
+            # Членства: UUID компании, datetime, маска прав
+            'memberships': list(
+                CompanyMembership.objects.order_by('pk').values(
+                    'id', 'company_id', 'user_id', 'role', 'role_level', 'permissions',
+                    'is_active', 'joined_at',
+                )[:rows]
+            ),
+        }
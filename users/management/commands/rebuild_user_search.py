@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс поиска пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Сколько пользователей индексировать за один проход (по умолчанию 5000)',
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stdout.write(self.style.WARNING(
+                'Полнотекстовый индекс недоступен для этой базы, поиск работает через icontains'
+            ))
+            return
+
+        started = time.monotonic()
+        total = search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано пользователей: {total} за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2025-09-30 12:00
+
+from django.conf import settings
+from django.db import OperationalError, migrations
+
+
+def _fold(column):
+    return f"replace(replace(u.{column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+CREATE_SQL = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5('
+    'username, first_name, last_name, email, companies, '
+    "tokenize=\"unicode61 remove_diacritics 2 tokenchars '_'\", "
+    "prefix='1 2 3')"
+)
+
+POPULATE_SQL = (
+    'INSERT INTO users_search(rowid, username, first_name, last_name, email, companies) '
+    f"SELECT u.id, {_fold('username')}, {_fold('first_name')}, {_fold('last_name')}, {_fold('email')}, "
+    # Токен компании - UUID без дефисов, как users.search.company_token
+    "COALESCE((SELECT group_concat('c' || lower(replace(m.company_id, '-', '')), ' ') "
+    'FROM companies_companymembership m '
+    "WHERE m.user_id = u.id), '') "
+    'FROM auth_user u'
+)
+
+
+def create_search_index(apps, schema_editor):
+    # Полнотекстовый индекс есть только на SQLite с FTS5, иначе поиск идет через icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(CREATE_SQL)
+    except OperationalError:
+        return
+    schema_editor.execute(POPULATE_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS users_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_userprofile_department'),
+        ('companies', '0006_membership_joined_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -21,8 +21,11 @@ class UserProfile(models.Model):
 
 
 @receiver(post_save, sender=User)
-def manage_user_profile(sender, instance, created, **kwargs):
+def manage_user_profile(sender, instance, created, update_fields=None, **kwargs):
     """Автоматически создает или обновляет профиль пользователя"""
+    # Вход пользователя сохраняет только last_login - профиль не трогаем
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
     if created:
         # Создаем профиль для нового пользователя
         UserProfile.objects.create(user=instance)
@@ -0,0 +1,199 @@
+"""
+Полнотекстовый поиск пользователей.
+
+На SQLite пользователи индексируются в виртуальной таблице FTS5 users_search
+(rowid = id пользователя): логин, имя, фамилия, почта и токены компаний
+пользователя («c<uuid без дефисов>»). Запрос «ив пет» превращается в «"ив"* AND "пет"*»,
+поэтому поиск идет по началу слов через индекс префиксов, а не перебором
+LIKE '%...%' по всей таблице. Токенизатор unicode61 сам приводит регистр, в
+том числе кириллицы, а «ё» заменяется на «е» при индексации и в запросе.
+Ограничение компанией - условие на столбец companies в том же MATCH.
+
+Индекс обновляют сигналы User и CompanyMembership; массовые операции
+(bulk_create, _raw_delete) должны вызывать index_users()/remove_users() сами,
+полная перестройка - команда rebuild_user_search. На других СУБД (или если
+SQLite собран без FTS5) используется прежний поиск через icontains.
+"""
+import re
+from uuid import UUID
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Case, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from companies.models import CompanyMembership
+
+
+TABLE = 'users_search'
+
+# Столбцы индекса и их веса в bm25 (логин и фамилия важнее почты)
+COLUMNS = ['username', 'first_name', 'last_name', 'email', 'companies']
+WEIGHTS = [10.0, 5.0, 8.0, 2.0, 0.0]
+
+CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+    f'{", ".join(COLUMNS)}, '
+    "tokenize=\"unicode61 remove_diacritics 2 tokenchars '_'\", "
+    "prefix='1 2 3')"
+)
+
+# Поля пользователя, при изменении которых нужно обновить индекс
+INDEXED_FIELDS = {'username', 'first_name', 'last_name', 'email'}
+
+# Поля для поиска без полнотекстового индекса
+FALLBACK_FIELDS = ['username', 'first_name', 'last_name', 'email']
+
+_WORD_RE = re.compile(r'\w+')
+
+_available = {}
+
+
+def fold(text):
+    """Приводит «ё» к «е» (регистр приводит сам токенизатор)"""
+    return (text or '').replace('ё', 'е').replace('Ё', 'Е')
+
+
+def company_token(company_id):
+    # UUID без дефисов - в таком виде SQLite хранит company_id (см. миграцию 0004)
+    return f'c{UUID(str(company_id)).hex}'
+
+
+def build_query(text, company_id=None):
+    """Строит выражение MATCH или возвращает None, если в запросе нет слов"""
+    words = _WORD_RE.findall(fold(text))
+    if not words:
+        return None
+    query = ' AND '.join(f'"{word}"*' for word in words)
+    if company_id is not None:
+        query = f'companies : "{company_token(company_id)}" AND ({query})'
+    return query
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    """Есть ли индекс в базе using (результат проверки запоминается)"""
+    connection = connections[using]
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _available:
+        _available[key] = (
+            connection.vendor == 'sqlite' and TABLE in connection.introspection.table_names()
+        )
+    return _available[key]
+
+
+def _documents(user_ids):
+    companies = {}
+    memberships = CompanyMembership.objects.filter(user_id__in=user_ids).values_list('user_id', 'company_id')
+    for user_id, company_id in memberships:
+        companies.setdefault(user_id, []).append(company_token(company_id))
+    users = User.objects.filter(pk__in=user_ids).values_list('pk', *FALLBACK_FIELDS)
+    for pk, *values in users:
+        yield [pk, *(fold(value) for value in values), ' '.join(companies.get(pk, []))]
+
+
+def remove_users(user_ids, using=DEFAULT_DB_ALIAS):
+    user_ids = list(user_ids)
+    if not user_ids or not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE rowid IN ({", ".join(["%s"] * len(user_ids))})', user_ids
+        )
+
+
+def index_users(user_ids, using=DEFAULT_DB_ALIAS):
+    """Добавляет или обновляет записи индекса для пользователей user_ids"""
+    user_ids = list(user_ids)
+    if not user_ids or not is_available(using):
+        return
+    remove_users(user_ids, using)
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {TABLE}(rowid, {", ".join(COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)',
+            list(_documents(user_ids)),
+        )
+
+
+def rebuild(chunk_size=5000, using=DEFAULT_DB_ALIAS):
+    """Перестраивает индекс целиком, возвращает число проиндексированных пользователей"""
+    if not is_available(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    total = 0
+    last_pk = 0
+    while True:
+        user_ids = list(
+            User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not user_ids:
+            break
+        index_users(user_ids, using)
+        total += len(user_ids)
+        last_pk = user_ids[-1]
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+    return total
+
+
+def filter_users(queryset, text, company_id=None):
+    """Оставляет в queryset пользователей, подходящих под запрос text"""
+    query = build_query(text, company_id)
+    if query is None:
+        return queryset
+    if is_available(queryset.db):
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', [query]))
+
+    condition = Q()
+    for word in text.split():
+        condition &= Q(*[Q(**{f'{field}__icontains': word}) for field in FALLBACK_FIELDS], _connector=Q.OR)
+    queryset = queryset.filter(condition)
+    if company_id is not None:
+        queryset = queryset.filter(company_memberships__company_id=company_id)
+    return queryset
+
+
+def ranked_ids(text, company_id=None, limit=20, using=DEFAULT_DB_ALIAS):
+    """Возвращает id лучших совпадений по bm25 или None, если индекса нет"""
+    query = build_query(text, company_id)
+    if query is None:
+        return []
+    if not is_available(using):
+        return None
+    weights = ', '.join(str(weight) for weight in WEIGHTS)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY bm25({TABLE}, {weights}) LIMIT %s',
+            [query, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search(queryset, text, company_id=None, limit=20):
+    """Пользователи из queryset по убыванию релевантности (не больше limit)"""
+    ids = ranked_ids(text, company_id, limit, queryset.db)
+    if ids is None:
+        return list(filter_users(queryset, text, company_id).order_by('username')[:limit])
+    order = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+    return list(queryset.filter(pk__in=ids).order_by(order)) if ids else []
+
+
+@receiver(post_save, sender=User)
+def index_saved_user(sender, instance, created, update_fields=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    # Вход пользователя сохраняет только last_login - индекс не меняется
+    if created or update_fields is None or INDEXED_FIELDS & set(update_fields):
+        index_users([instance.pk], using)
+
+
+@receiver(post_delete, sender=User)
+def remove_deleted_user(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    remove_users([instance.pk], using)
+
+
+@receiver([post_save, post_delete], sender=CompanyMembership)
+def index_membership_user(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    # Токены компаний меняются только при появлении и удалении членства
+    if kwargs.get('created', True):
+        index_users([instance.user_id], using)
@@ -1,3 +1,489 @@
-from django.test import TestCase
+import base64
+import datetime
+import decimal
+import io
+import json
+import re
+import uuid
 
-# Create your tests here.
+from django.contrib.auth.models import Permission, User
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from api.parsers import ORJSONParser
+from api.renderers import ORJSONRenderer
+from companies.events import event_log
+from companies.loadgen import LoadDataGenerator
+from companies.models import Company, CompanyMembership
+from users import search
+
+
+# События, которые тесты порождают через сигналы, не попадают в logs/
+null_event_log = override_settings(COMPANY_EVENT_LOG={'SINKS': ['null']})
+
+
+def setUpModule():
+    null_event_log.enable()
+    event_log.configure()
+
+
+def tearDownModule():
+    event_log.flush()
+    null_event_log.disable()
+    event_log.configure()
+
+
+class UsersListViewTest(TestCase):
+    """Тесты постраничного списка пользователей компании"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=2, members=7, sections=0, seed=5)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.owner = User.objects.get(pk=self.company.owner_id)
+        self.owner.user_permissions.add(Permission.objects.get(codename='view_user', content_type__app_label='auth'))
+        self.client.force_login(self.owner)
+        self.url = reverse('company_users:users_list', kwargs={'company_slug': self.company.slug})
+
+    def get_page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        usernames = re.findall(r'data-username="([^"]+)"', content)
+        next_url = re.search(r'href="(\?[^"]*cursor=[^"]+)"', content)
+        return usernames, next_url and next_url.group(1).replace('&amp;', '&')
+
+    def test_keyset_pages_cover_company_members(self):
+        """Тест что страницы по курсору покрывают всех участников компании без повторов"""
+        expected = list(
+            CompanyMembership.objects.filter(company=self.company)
+            .order_by('-joined_at', '-pk').values_list('user__username', flat=True)
+        )
+
+        seen = []
+        usernames, next_url = self.get_page(self.url, {'per_page': 3})
+        seen += usernames
+        while next_url:
+            usernames, next_url = self.get_page(self.url + next_url)
+            seen += usernames
+
+        self.assertEqual(seen, expected)
+
+    def test_filters_and_sort(self):
+        """Тест фильтра по статусу, поиска по началу логина и сортировки"""
+        membership = CompanyMembership.objects.filter(company=self.company).exclude(user=self.owner).first()
+        membership.user.is_active = False
+        membership.user.save()
+
+        usernames, _ = self.get_page(self.url, {'status': 'inactive'})
+        self.assertEqual(usernames, [membership.user.username])
+        active, _ = self.get_page(self.url, {'status': 'active'})
+        self.assertNotIn(membership.user.username, active)
+
+        usernames, _ = self.get_page(self.url, {'q': membership.user.username})
+        self.assertEqual(usernames, [membership.user.username])
+
+        usernames, _ = self.get_page(self.url, {'sort': 'username'})
+        self.assertEqual(usernames, sorted(usernames))
+        self.assertEqual(len(usernames), 7)
+
+    def test_invalid_cursor_gives_first_page(self):
+        """Тест что поврежденный курсор или курсор другой сортировки дает первую страницу"""
+        first, next_url = self.get_page(self.url, {'per_page': 3})
+        cursor = next_url.split('cursor=')[1]
+        for value in (['abc', 'x'], [{'a': 1}, 1], {'sort': '-joined_at,-pk', 'values': ['abc', 'x']}):
+            bad = base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+            self.assertEqual(self.get_page(self.url, {'per_page': 3, 'cursor': bad})[0], first)
+
+        by_username, _ = self.get_page(self.url, {'per_page': 3, 'sort': 'username'})
+        self.assertEqual(self.get_page(self.url, {'per_page': 3, 'sort': 'username', 'cursor': cursor})[0], by_username)
+
+    def test_without_permission_only_self(self):
+        """Тест что пользователь без прав видит только себя"""
+        employee = CompanyMembership.objects.filter(company=self.company, role='employee').first().user
+        self.client.force_login(employee)
+        response = self.client.get(self.url)
+        self.assertEqual(re.findall(r'data-username="([^"]+)"', response.content.decode()), [employee.username])
+
+
+class UsersApiPaginationTest(TestCase):
+    """Тесты пагинации API пользователей v1"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=2, members=7, sections=0, seed=6)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.client.force_login(User.objects.get(pk=self.company.owner_id))
+        # Текущая компания запоминается в сессии при входе на дашборд
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+        self.expected = list(
+            User.objects.filter(company_memberships__company=self.company)
+            .order_by('-date_joined', '-id').values_list('id', flat=True)
+        )
+
+    def test_cursor_pages(self):
+        """Тест что курсор проходит всех пользователей компании без повторов"""
+        response = self.client.get('/api/v1/users/', {'pagination': 'cursor', 'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 7)
+
+        seen = [user['id'] for user in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            seen += [user['id'] for user in data['results']]
+        self.assertEqual(seen, self.expected)
+
+    def test_invalid_cursor(self):
+        """Тест что неверный курсор - ошибка 400, а не 500"""
+        for value in (['abc', 'x'], [{'a': 1}, 1], {'sort': '-date_joined,-id', 'values': ['abc', 'x']}):
+            cursor = base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+            response = self.client.get('/api/v1/users/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('cursor', response.json())
+        self.assertEqual(self.client.get('/api/v1/users/', {'cursor': 'не-base64'}).status_code, 400)
+
+    def test_page_number_count_from_statistics(self):
+        """Тест что без фильтров count берется из счетчиков компании без COUNT(*)"""
+        self.client.get('/api/v1/users/')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/v1/users/', {'page': 2, 'page_size': 3})
+        data = response.json()
+        self.assertEqual(data['count'], 7)
+        self.assertEqual([user['id'] for user in data['results']], self.expected[3:6])
+        self.assertFalse(any('COUNT(' in query['sql'] for query in captured.captured_queries))
+
+        response = self.client.get('/api/v1/users/', {'is_active': 'true'})
+        self.assertEqual(response.json()['count'], 7)
+
+
+class UserSearchTest(TestCase):
+    """Тесты полнотекстового поиска пользователей"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=2, members=4, sections=0, seed=7)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.other_company = Company.objects.get(slug=f'{generator.slug_prefix}1')
+        self.owner = User.objects.get(pk=self.company.owner_id)
+        self.member = CompanyMembership.objects.filter(company=self.company).exclude(user=self.owner).first().user
+        self.member.first_name = 'Фёдор'
+        self.member.last_name = 'Ёлкин'
+        self.member.save()
+
+    def ids(self, text, company=None):
+        return [user.pk for user in search.search(User.objects.all(), text, company and company.pk)]
+
+    def test_index_available(self):
+        """Тест что на SQLite используется индекс FTS5"""
+        self.assertTrue(search.is_available())
+
+    def test_prefix_case_and_yo(self):
+        """Тест поиска по началу слова без учета регистра и различия ё/е"""
+        for text in ['фед', 'ФЁД', 'елк', 'Федор Ёл', self.member.username[:-1]]:
+            self.assertIn(self.member.pk, self.ids(text), text)
+        self.assertEqual(self.ids('едор'), [])
+
+    def test_company_scope(self):
+        """Тест ограничения поиска компанией и обновления индекса по членствам"""
+        self.assertEqual(self.ids('Фёдор', self.company), [self.member.pk])
+        self.assertEqual(self.ids('Фёдор', self.other_company), [])
+
+        CompanyMembership.objects.filter(company=self.company, user=self.member).delete()
+        self.assertEqual(self.ids('Фёдор', self.company), [])
+        self.assertEqual(self.ids('Фёдор'), [self.member.pk])
+
+    def test_rename_and_delete_update_index(self):
+        """Тест что изменение и удаление пользователя обновляют индекс"""
+        self.member.last_name = 'Сидоров'
+        self.member.save(update_fields=['last_name'])
+        self.assertEqual(self.ids('Ёлкин'), [])
+        self.assertIn(self.member.pk, self.ids('сидор'))
+
+        self.member.delete()
+        self.assertNotIn(self.member.pk, self.ids('Фёдор'))
+
+    def test_rebuild(self):
+        """Тест полной перестройки индекса"""
+        self.assertEqual(search.rebuild(chunk_size=3), User.objects.count())
+        self.assertEqual(self.ids('Фёдор', self.company), [self.member.pk])
+
+    def test_migration_backfill_matches_company_scope(self):
+        """Тест что заполнение индекса в миграции дает те же токены компаний, что и сигналы"""
+        from importlib import import_module
+
+        migration = import_module('users.migrations.0004_user_search_index')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.TABLE}')
+            cursor.execute(migration.POPULATE_SQL)
+        self.assertEqual(self.ids('Фёдор', self.company), [self.member.pk])
+
+    def test_api_search(self):
+        """Тест ?search= в API v1 в пределах текущей компании"""
+        self.client.force_login(self.owner)
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+        response = self.client.get('/api/v1/users/', {'search': 'фёд'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['id'] for user in response.json()['results']], [self.member.pk])
+
+
+    def test_staff_search_scoped_and_reports_truncation(self):
+        """Тест поиска для админов: в пределах текущей компании и с признаком усечения"""
+        User.objects.filter(pk=self.owner.pk).update(is_staff=True)
+        self.client.force_login(self.owner)
+        url = reverse('legacy_users:users_api:user-search')
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+        response = self.client.get(url, {'q': 'load7', 'limit': 100}).json()
+        members = set(CompanyMembership.objects.filter(company=self.company).values_list('user_id', flat=True))
+        self.assertEqual({user['id'] for user in response['results']}, members)
+        self.assertFalse(response['truncated'])
+
+        response = self.client.get(url, {'q': 'load7', 'limit': 2}).json()
+        self.assertEqual((len(response['results']), response['limit'], response['truncated']), (2, 2, True))
+
+
+class UsersApiListRowsTest(TestCase):
+    """Тесты списка пользователей API v1, собранного из values()"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=1, members=5, sections=0, seed=8)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.client.force_login(User.objects.get(pk=self.company.owner_id))
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+
+    def test_row_fields(self):
+        """Тест полей строки: полное имя, подразделение и должность из профиля"""
+        user = User.objects.filter(company_memberships__company=self.company).last()
+        user.first_name = user.last_name = ''
+        user.save()
+        user.profile.department = ''
+        user.profile.position = 'Аналитик'
+        user.profile.save()
+
+        rows = {row['id']: row for row in self.client.get('/api/v1/users/').json()['results']}
+        self.assertEqual(len(rows), 5)
+        row = rows[user.pk]
+        self.assertEqual(row['full_name'], user.username)
+        self.assertIsNone(row['department_name'])
+        self.assertEqual(row['position'], 'Аналитик')
+
+        other = User.objects.select_related('profile').get(pk=next(pk for pk in rows if pk != user.pk))
+        self.assertEqual(rows[other.pk]['full_name'], other.get_full_name())
+        self.assertEqual(rows[other.pk]['department_name'], other.profile.department)
+
+        # Время в списке и в карточке - в одном часовом поясе
+        detail = self.client.get(f'/api/v1/users/{user.pk}/').json()
+        self.assertEqual(row['date_joined'], detail['date_joined'])
+
+    def test_filters_by_profile_fields(self):
+        """Тест фильтров по подразделению и должности профиля"""
+        user = User.objects.filter(company_memberships__company=self.company).first()
+        user.profile.department = 'Уникальный отдел'
+        user.profile.save()
+        response = self.client.get('/api/v1/users/', {'department': 'Уникальный'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [user.pk])
+
+
+class ORJSONRendererTest(TestCase):
+    """Тесты рендерера и парсера JSON на orjson"""
+
+    def test_same_output_as_drf(self):
+        """Тест что ответ совпадает с JSONRenderer для UUID, дат и Decimal"""
+        data = {
+            'id': uuid.uuid4(),
+            'joined': timezone.now(),
+            'day': datetime.date(2025, 1, 2),
+            'amount': decimal.Decimal('12.50'),
+            'name': 'Фёдор\u2028',
+            1: None,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+    def test_parser(self):
+        """Тест разбора тела запроса и ошибки разбора"""
+        self.assertEqual(ORJSONParser().parse(io.BytesIO('{"a": [1, "ё"]}'.encode())), {'a': [1, 'ё']})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"a": NaN}'))
+
+
+class UsersApiSparseFieldsTest(TestCase):
+    """Тесты ?fields= и ?expand= в API пользователей v1"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=2, members=4, sections=0, seed=9)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.client.force_login(User.objects.get(pk=self.company.owner_id))
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+        self.member = CompanyMembership.objects.filter(company=self.company, role='employee').first().user
+        # Пользователь состоит и во второй компании - её членство раскрываться не должно
+        other_company = Company.objects.exclude(pk=self.company.pk).get(slug__startswith=generator.slug_prefix)
+        CompanyMembership.objects.create(company=other_company, user=self.member, role='viewer')
+
+    def users_select(self, captured):
+        # Выборка пользователей компании (а не загрузка текущего пользователя сессии)
+        return next(query['sql'] for query in captured if 'JOIN "companies_companymembership"' in query['sql'] and 'LIMIT' in query['sql'])
+
+    def test_list_fields(self):
+        """Тест что список отдает и выбирает из базы только запрошенные поля"""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/v1/users/', {'fields': 'username,full_name'})
+        rows = response.json()['results']
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(set(rows[0]), {'id', 'username', 'full_name'})
+        select = self.users_select(captured)
+        self.assertNotIn('"email"', select)
+        self.assertNotIn('users_userprofile', select)
+
+    def test_list_expand(self):
+        """Тест раскрытия профиля и членств текущей компании в списке"""
+        response = self.client.get('/api/v1/users/', {'expand': 'profile,memberships', 'fields': 'username'})
+        rows = {row['id']: row for row in response.json()['results']}
+        row = rows[self.member.pk]
+        self.assertEqual(set(row), {'id', 'username', 'profile', 'memberships'})
+        self.assertEqual(row['profile']['position'], self.member.profile.position)
+        self.assertEqual([membership['role'] for membership in row['memberships']], ['employee'])
+
+    def test_detail_fields_and_expand(self):
+        """Тест карточки пользователя: only() по полям и prefetch членств"""
+        url = f'/api/v1/users/{self.member.pk}/'
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, {'fields': 'email', 'expand': 'memberships'})
+        data = response.json()
+        self.assertEqual(set(data), {'id', 'email', 'memberships'})
+        self.assertEqual([membership['role'] for membership in data['memberships']], ['employee'])
+        select = self.users_select(captured)
+        self.assertNotIn('"first_name"', select)
+
+        with CaptureQueriesContext(connection) as captured:
+            data = self.client.get(url).json()
+        self.assertEqual(data['profile']['position'], self.member.profile.position)
+        self.assertFalse(any('FROM "users_userprofile"' in query['sql'] for query in captured))
+
+        # Профиль карточки выводит пользователя целиком: only() не должен
+        # превращать отложенные поля в отдельные запросы
+        with CaptureQueriesContext(connection) as sparse:
+            data = self.client.get(url, {'fields': 'id,profile'}).json()
+        self.assertEqual(set(data), {'id', 'profile'})
+        self.assertEqual(data['profile']['user']['email'], self.member.email)
+        self.assertEqual(len(sparse), len(captured))
+
+
+class UsersApiBulkTest(TestCase):
+    """Тесты массовых операций API пользователей v1"""
+
+    def setUp(self):
+        cache.clear()
+        generator = LoadDataGenerator(companies=2, members=30, sections=0, seed=10)
+        generator.run()
+        self.company = Company.objects.get(slug=f'{generator.slug_prefix}0')
+        self.owner = User.objects.get(pk=self.company.owner_id)
+        self.client.force_login(self.owner)
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+        self.member_ids = list(
+            CompanyMembership.objects.filter(company=self.company).exclude(user=self.owner)
+            .values_list('user_id', flat=True)
+        )
+        self.outsider = User.objects.exclude(company_memberships__company=self.company).first()
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type='application/json')
+
+    def test_bulk_deactivate_by_ids(self):
+        """Тест деактивации по id: результаты по каждому id и постоянное число запросов"""
+        User.objects.filter(pk=self.member_ids[0]).update(is_active=False)
+        ids = self.member_ids + [self.owner.pk, self.outsider.pk]
+        with CaptureQueriesContext(connection) as captured:
+            response = self.post('/api/v1/users/bulk-deactivate/', {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(captured), 10)
+
+        statuses = {result['id']: result['status'] for result in response.json()['results']}
+        self.assertEqual(statuses[self.member_ids[0]], 'unchanged')
+        self.assertEqual(statuses[self.member_ids[1]], 'updated')
+        self.assertEqual(statuses[self.owner.pk], 'skipped')
+        self.assertEqual(statuses[self.outsider.pk], 'not_found')
+        self.assertEqual(response.json()['updated'], len(self.member_ids) - 1)
+        self.assertFalse(User.objects.filter(pk__in=self.member_ids, is_active=True).exists())
+        self.assertTrue(User.objects.get(pk=self.outsider.pk).is_active)
+
+    def test_bulk_by_filter_and_reset_password(self):
+        """Тест операции по фильтру и сброса паролей"""
+        user = CompanyMembership.objects.filter(
+            company=self.company, is_active=True, user__is_active=True).exclude(user=self.owner).first().user
+        user.profile.department = 'Отдел на выход'
+        user.profile.save()
+
+        response = self.post('/api/v1/users/bulk-reset-password/', {'filter': {'department': 'Отдел на выход'}})
+        [result] = response.json()['results']
+        self.assertEqual((result['id'], result['status']), (user.pk, 'updated'))
+        user.refresh_from_db()
+        self.assertFalse(user.has_usable_password())
+
+        # Ссылка для нового пароля уходит письмом пользователю, а не в ответ администратору
+        self.assertTrue(result['notified'])
+        self.assertNotIn('invite_url', result)
+        [message] = mail.outbox
+        self.assertEqual(message.to, [user.email])
+        [url] = re.findall(r'http://testserver(/companies/\S+)', message.body)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(url, {'new_password1': 'Zx9-reset-pass', 'new_password2': 'Zx9-reset-pass'})
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('Zx9-reset-pass'))
+
+    def test_admin_cannot_touch_protected_users(self):
+        """Тест: администратор не меняет владельца, других администраторов и сотрудников"""
+        admin, other_admin = (
+            membership.user for membership in
+            CompanyMembership.objects.filter(company=self.company, role='admin', is_active=True, user__is_active=True)[:2]
+        )
+        staff = CompanyMembership.objects.filter(company=self.company, role='employee').first().user
+        User.objects.filter(pk=staff.pk).update(is_staff=True)
+        employee = CompanyMembership.objects.filter(
+            company=self.company, role='employee', is_active=True, user__is_active=True,
+        ).exclude(user=staff).first().user
+        self.client.force_login(admin)
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+
+        ids = [self.owner.pk, other_admin.pk, staff.pk, admin.pk, employee.pk]
+        for url in ('/api/v1/users/bulk-deactivate/', '/api/v1/users/bulk-reset-password/'):
+            statuses = {result['id']: result['status'] for result in self.post(url, {'ids': ids}).json()['results']}
+            self.assertEqual(statuses, {
+                self.owner.pk: 'skipped', other_admin.pk: 'skipped', staff.pk: 'skipped',
+                admin.pk: 'skipped', employee.pk: 'updated',
+            })
+        self.assertEqual([message.to for message in mail.outbox], [[employee.email]])
+        protected = User.objects.filter(pk__in=ids[:4])
+        self.assertTrue(all(user.is_active and user.has_usable_password() for user in protected))
+
+    def test_validation_and_permissions(self):
+        """Тест ошибок в теле запроса и запрета для не-администраторов"""
+        self.assertEqual(self.post('/api/v1/users/bulk-activate/', {}).status_code, 400)
+        self.assertEqual(self.post('/api/v1/users/bulk-activate/', {'ids': ['x']}).status_code, 400)
+        self.assertEqual(self.post('/api/v1/users/bulk-activate/', {'filter': {}}).status_code, 400)
+        self.assertEqual(self.post('/api/v1/users/bulk-activate/', [1, 2]).status_code, 400)
+
+        employee = CompanyMembership.objects.filter(company=self.company, role='employee').first().user
+        self.client.force_login(employee)
+        self.client.get(reverse('companies:dashboard', kwargs={'company_slug': self.company.slug}))
+        response = self.post('/api/v1/users/bulk-deactivate/', {'ids': self.member_ids})
+        self.assertEqual(response.status_code, 403)
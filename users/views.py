@@ -1,16 +1,24 @@
+from urllib.parse import urlencode
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.db.models import Q
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 
 from .models import UserProfile
-from companies.models import Company
+from . import search
+from companies import keyset
+from companies.cache import get_active_company
+from companies.models import Company, CompanyMembership
+from companies.statistics import get_company_statistics
 from .forms import (
     CustomAuthenticationForm, UserProfileForm, 
     AdminUserEditForm, AdminUserCreateForm
@@ -79,13 +87,31 @@ def profile_edit_view(request):
     return render(request, 'users/profile_edit.html', {'form': form})
 
 
+# Сортировки списка пользователей: (название, поля keyset-пагинации).
+# Последнее поле - pk, чтобы порядок был однозначным
+USER_LIST_SORTS = {
+    'joined': ('Сначала новые', [('joined_at', True), ('pk', True)]),
+    'username': ('По логину', [('user__username', False), ('pk', False)]),
+}
+
+USERS_PER_PAGE = 50
+USERS_MAX_PER_PAGE = 200
+
+# Сколько карточек отрисовывается и отправляется за один шаг
+USERS_STREAM_CHUNK = 25
+
+USERS_STREAM_MARKER = mark_safe('<!--users-stream-->')
+
+
 def users_list_view(request, company_slug):
     """Список пользователей - доступен только админам и пользователям с правами"""
     if not request.user.is_authenticated:
         return redirect('admin:login')
     
     # Получаем объект компании
-    company = get_object_or_404(Company, slug=company_slug)
+    company = get_active_company(company_slug)
+    if company is None:
+        raise Http404('Компания не найдена')
     
     # Проверяем права доступа
     can_view_all = request.user.is_staff or request.user.has_perm('auth.view_user')
@@ -93,33 +119,86 @@ def users_list_view(request, company_slug):
     # Определяем текущий namespace для правильной генерации URL
     current_namespace = 'company_users' if company_slug else 'users'
     
-    if can_view_all:
-        # Админ или пользователь с правами видит всех
-        users = User.objects.all().select_related('profile')
-        context = {
-            'users': users,
-            'can_view_all': True,
-            'current_user': request.user,
-            'company': company,
-            'company_slug': company_slug,
-            'namespace': current_namespace
-        }
-    else:
-        # Обычный пользователь видит только себя
-        users = [request.user]
-        context = {
-            'users': users,
-            'can_view_all': False,
-            'current_user': request.user,
-            'company': company,
-            'company_slug': company_slug,
-            'namespace': current_namespace
-        }
+    context = {
+        'can_view_all': can_view_all,
+        'current_user': request.user,
+        'company': company,
+        'company_slug': company_slug,
+        'namespace': current_namespace
+    }
     
     # Выбираем правильный шаблон в зависимости от контекста
     template_name = 'users/company_users_list.html' if company_slug else 'users/users_list.html'
     
-    return render(request, template_name, context)
+    if not can_view_all:
+        # Обычный пользователь видит только себя
+        context['users'] = [request.user]
+        return render(request, template_name, context)
+    
+    # Админ или пользователь с правами видит участников компании постранично
+    filters = {
+        'q': request.GET.get('q', '').strip(),
+        'status': request.GET.get('status', ''),
+        'sort': request.GET.get('sort', ''),
+    }
+    if filters['sort'] not in USER_LIST_SORTS:
+        filters['sort'] = 'joined'
+    try:
+        per_page = min(max(int(request.GET.get('per_page', USERS_PER_PAGE)), 1), USERS_MAX_PER_PAGE)
+    except ValueError:
+        per_page = USERS_PER_PAGE
+    
+    memberships = CompanyMembership.objects.filter(company=company).select_related('user__profile')
+    if filters['status'] in ('active', 'inactive'):
+        # Статус пользователя, как в бейдже карточки и кнопке переключения
+        memberships = memberships.filter(user__is_active=filters['status'] == 'active')
+    if filters['q']:
+        # Диапазон вместо LIKE, чтобы использовался индекс по username
+        memberships = memberships.filter(user__username__gte=filters['q'], user__username__lt=filters['q'] + '\U0010ffff')
+    
+    cursor = request.GET.get('cursor')
+    rows, next_cursor = keyset.paginate(memberships, USER_LIST_SORTS[filters['sort']][1], cursor, per_page)
+    users = [membership.user for membership in rows]
+    
+    query = {key: value for key, value in filters.items() if value}
+    if per_page != USERS_PER_PAGE:
+        query['per_page'] = per_page
+    context.update({
+        'filters': filters,
+        'sort_choices': [(value, label) for value, (label, _) in USER_LIST_SORTS.items()],
+        'next_url': f'?{urlencode({**query, "cursor": next_cursor})}' if next_cursor else None,
+        'first_url': f'?{urlencode(query)}' if cursor else None,
+        'members_count': None if query.keys() - {'sort', 'per_page'} else get_company_statistics(company).members_count,
+        'stream_marker': USERS_STREAM_MARKER,
+    })
+    return _stream_users_page(request, template_name, context, users)
+
+
+def _stream_users_page(request, template_name, context, users):
+    """
+    Отдает страницу потоком: сначала шапка, затем карточки пачками,
+    затем окончание страницы. Шапка и окончание отрисовываются сразу,
+    чтобы сообщения и сессия обработались до отправки ответа.
+    """
+    page = render_to_string(template_name, context, request)
+    head, tail = page.split(USERS_STREAM_MARKER, 1)
+    cards = get_template('users/includes/company_user_cards.html')
+    card_context = {key: context[key] for key in ('can_view_all', 'current_user', 'company_slug')}
+    
+    def content():
+        yield head
+        if not users:
+            yield cards.render({**card_context, 'users': []})
+        for start in range(0, len(users), USERS_STREAM_CHUNK):
+            yield cards.render({**card_context, 'users': users[start:start + USERS_STREAM_CHUNK]})
+        yield tail
+    
+    return StreamingHttpResponse(content(), content_type='text/html; charset=utf-8')
+
+
+# Сколько пользователей возвращает поиск по умолчанию и максимум
+USER_SEARCH_LIMIT = 20
+USER_SEARCH_MAX_LIMIT = 100
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -189,8 +268,12 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """Поиск пользователей (только для админов)"""
-        if not request.user.is_staff:
+        """
+        Поиск пользователей текущей компании (только для админов). Выдается
+        не больше limit пользователей; truncated сообщает, что найдено больше.
+        """
+        company = getattr(request, 'current_company', None)
+        if not request.user.is_staff or company is None:
             return Response(
                 {'error': 'Доступ запрещен'}, 
                 status=status.HTTP_403_FORBIDDEN
@@ -198,14 +281,18 @@ class UserViewSet(viewsets.ModelViewSet):
         
         query = request.query_params.get('q', '')
         if query:
-            users = User.objects.filter(
-                Q(username__icontains=query) |
-                Q(first_name__icontains=query) |
-                Q(last_name__icontains=query) |
-                Q(email__icontains=query)
-            )
-            serializer = self.get_serializer(users, many=True)
-            return Response(serializer.data)
+            try:
+                limit = min(int(request.query_params.get('limit', USER_SEARCH_LIMIT)), USER_SEARCH_MAX_LIMIT)
+            except ValueError:
+                limit = USER_SEARCH_LIMIT
+            limit = max(limit, 1)
+            users = search.search(User.objects.all(), query, company_id=company.pk, limit=limit + 1)
+            serializer = self.get_serializer(users[:limit], many=True)
+            return Response({
+                'results': serializer.data,
+                'limit': limit,
+                'truncated': len(users) > limit,
+            })
         
         return Response({'error': 'Параметр q обязателен'}, status=status.HTTP_400_BAD_REQUEST)
 